@@ -0,0 +1,19 @@
+"""
+Benchmarks da API com dados sintéticos
+
+Gera um conjunto de dados do tamanho pedido (gabaritos, provas e resultados
+já no formato gravado pelo storage), sobe o `main:app` dentro do próprio
+processo e chama cada rota direto pela interface ASGI, sem rede nem
+servidor HTTP no meio. Para cada rota são medidas as latências p50/p95/p99
+e a vazão; alguns caminhos internos (folha PNG, cálculo do resultado,
+estatísticas) também são medidos isoladamente.
+
+Os números são gravados em JSON (baseline) e podem ser comparados com uma
+baseline anterior, apontando as regressões:
+
+    cd backend
+    python -m benchmarks --escala pequeno --saida baseline.json
+    python -m benchmarks --escala pequeno --comparar baseline.json
+
+Ver `python -m benchmarks --help` para as opções.
+"""
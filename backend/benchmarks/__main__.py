@@ -0,0 +1,181 @@
+"""
+Rodar os benchmarks: python -m benchmarks [opções] (de dentro de backend/)
+
+O conjunto sintético é gerado uma vez em <diretorio>/base e reaproveitado
+enquanto a escala não muda; cada execução trabalha sobre uma cópia dele em
+<diretorio>/execucao, então as escritas e remoções medidas não alteram as
+execuções seguintes.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import medicao  # noqa: E402
+from benchmarks.dados import ESCALAS, carregar_meta, gerar_em  # noqa: E402
+
+
+def _argumentos(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks da API TEstify")
+    parser.add_argument("--escala", choices=ESCALAS, default="pequeno", help="tamanho do conjunto sintético")
+    parser.add_argument("--gabaritos", type=int, help="número de gabaritos (substitui o da escala)")
+    parser.add_argument("--provas", type=int, help="número de provas/resultados (substitui o da escala)")
+    parser.add_argument("--diretorio", help="onde guardar os dados gerados (padrão: temporário do sistema)")
+    parser.add_argument("--requisicoes", type=int, default=200, help="requisições medidas por rota")
+    parser.add_argument("--concorrencia", type=int, default=8, help="requisições simultâneas por rota")
+    parser.add_argument("--apenas", help="só as rotas/medições cujo nome contém este texto")
+    parser.add_argument("--sem-micro", action="store_true", help="não rodar os microbenchmarks")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="gravar a execução como baseline (JSON)")
+    parser.add_argument("--comparar", help="baseline (JSON) para comparar; sai com código 1 se houver regressão")
+    parser.add_argument("--tolerancia", type=float, default=medicao.TOLERANCIA_PADRAO,
+                        help="piora relativa aceita no p50/p95 (ex: 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def preparar_dados(diretorio: str, num_gabaritos: int, num_provas: int, semente: int) -> str:
+    """Diretório de execução com uma cópia do conjunto (gerado se preciso)"""
+    base = os.path.join(diretorio, "base")
+    os.makedirs(base, exist_ok=True)
+    anterior = os.getcwd()
+    os.chdir(base)
+    meta = carregar_meta()
+    os.chdir(anterior)
+    desejado = {
+        "gabaritos": num_gabaritos, "provas": num_provas, "semente": semente,
+        "backend": os.getenv("STORAGE_BACKEND", "json").lower(),
+    }
+    if any(meta.get(campo) != valor for campo, valor in desejado.items()):
+        print(f"Gerando {num_gabaritos} gabaritos e {num_provas} provas/resultados em {base}...")
+        shutil.rmtree(base)
+        os.makedirs(base)
+        inicio = time.perf_counter()
+        # Em outro processo: o storage fixa o diretório dos dados no import
+        processo = multiprocessing.get_context("spawn").Process(
+            target=gerar_em, args=(base, num_gabaritos, num_provas, semente)
+        )
+        processo.start()
+        processo.join()
+        if processo.exitcode != 0:
+            raise SystemExit("Falha ao gerar o conjunto de dados")
+        print(f"Conjunto gerado em {time.perf_counter() - inicio:.1f}s")
+
+    execucao = os.path.join(diretorio, "execucao")
+    shutil.rmtree(execucao, ignore_errors=True)
+    shutil.copytree(base, execucao)
+    return execucao
+
+
+async def _medir_cenario(cliente, cenario, requisicoes: list, concorrencia: int) -> dict:
+    # Aquecimento (só leituras): caches e imports fora da medição
+    if all(metodo == "GET" for metodo, *_ in requisicoes):
+        for metodo, url, corpo, headers in requisicoes[:3]:
+            await cliente.requisicao(metodo, url, corpo, headers)
+    pendentes = iter(requisicoes)
+    latencias, erros, total_bytes = [], 0, 0
+
+    async def trabalhador():
+        nonlocal erros, total_bytes
+        for metodo, url, corpo, headers in pendentes:
+            status, tamanho, segundos = await cliente.requisicao(metodo, url, corpo, headers)
+            latencias.append(segundos)
+            total_bytes += tamanho
+            if status not in cenario.esperado:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(max(1, concorrencia))))
+    return medicao.resumir(latencias, time.perf_counter() - inicio, erros, total_bytes)
+
+
+async def medir_rotas(app, ctx, args) -> dict:
+    from benchmarks.asgi import ClienteASGI
+    from benchmarks.cenarios import CENARIOS
+
+    cliente = ClienteASGI(app)
+    await cliente.iniciar()
+    rotas = {}
+    try:
+        for cenario in CENARIOS:
+            if args.apenas and args.apenas not in cenario.nome:
+                continue
+            requisicoes = cenario.requisicoes(ctx, args.requisicoes)
+            rotas[cenario.nome] = await _medir_cenario(cliente, cenario, requisicoes, args.concorrencia)
+            medida = rotas[cenario.nome]
+            if medida.get("n"):
+                print(f"  {cenario.nome}: p50 {medida['p50_ms']:.2f} ms, p95 {medida['p95_ms']:.2f} ms, "
+                      f"{medida['rps']} req/s, {medida['erros']} erros")
+    finally:
+        await cliente.encerrar()
+    return rotas
+
+
+def main(argv=None) -> int:
+    args = _argumentos(argv)
+    # Caminhos relativos ao diretório de onde o comando foi chamado
+    args.saida = args.saida and os.path.abspath(args.saida)
+    args.comparar = args.comparar and os.path.abspath(args.comparar)
+    escala = ESCALAS[args.escala]
+    num_gabaritos = args.gabaritos or escala["gabaritos"]
+    num_provas = args.provas or escala["provas"]
+    diretorio = os.path.abspath(
+        args.diretorio or os.path.join(tempfile.gettempdir(), "testify-benchmark", f"{num_gabaritos}-{num_provas}")
+    )
+
+    execucao = preparar_dados(diretorio, num_gabaritos, num_provas, args.semente)
+    os.chdir(execucao)
+    meta = carregar_meta()
+
+    # Importar o app só agora: o storage lê data/ do diretório atual
+    inicio = time.perf_counter()
+    import storage
+    from main import app
+    from benchmarks import micro
+    from benchmarks.cenarios import Contexto
+    for colecao in (storage.gabaritos, storage.provas, storage.resultados, storage.chaves):
+        len(colecao)  # carregar agora, fora das medições
+    carga = time.perf_counter() - inicio
+    print(f"Storage carregado em {carga:.2f}s ({meta['gabaritos']} gabaritos, {meta['provas']} provas)")
+
+    ctx = Contexto(meta, args.semente)
+    micro_medidas = {}
+    if not args.sem_micro:
+        print("Microbenchmarks...")
+        micro_medidas = {
+            nome: medida for nome, medida in micro.executar(ctx).items()
+            if not args.apenas or args.apenas in nome
+        }
+    print(f"Rotas ({args.requisicoes} requisições, concorrência {args.concorrencia})...")
+    rotas = asyncio.run(medir_rotas(app, ctx, args))
+    micro_medidas["carga do storage"] = medicao.resumir([carga], carga)
+
+    print()
+    print(medicao.tabela(rotas, micro_medidas))
+    opcoes = {"requisicoes": args.requisicoes, "concorrencia": args.concorrencia, "apenas": args.apenas}
+    if args.saida:
+        medicao.salvar(args.saida, meta, rotas, micro_medidas, opcoes)
+        print(f"\nBaseline gravada em {args.saida}")
+
+    if args.comparar:
+        linhas = medicao.comparar({"rotas": rotas, "micro": micro_medidas}, medicao.carregar(args.comparar), args.tolerancia)
+        print()
+        print(medicao.tabela_comparacao(linhas))
+        regressoes = [linha["nome"] for linha in linhas if linha["regressao"]]
+        if regressoes:
+            print(f"\n{len(regressoes)} regressões (tolerância {args.tolerancia:.0%}): {', '.join(regressoes)}")
+            return 1
+        print("\nSem regressões")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
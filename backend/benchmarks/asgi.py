@@ -0,0 +1,98 @@
+"""
+Cliente ASGI mínimo, dentro do processo
+
+Chama o app direto pela interface ASGI (scope / receive / send): o tempo
+medido é o da aplicação (middlewares, validação, rotas, storage e
+serialização), sem socket, servidor HTTP nem o overhead de um cliente como
+o httpx. O corpo inteiro da resposta é consumido, inclusive o de respostas
+em streaming, então exportações e PDFs entram com o custo completo.
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class ClienteASGI:
+    """Requisições a um app ASGI, com o lifespan do app"""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan: Optional[asyncio.Task] = None
+        self._entrada: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._saida: "asyncio.Queue[dict]" = asyncio.Queue()
+
+    async def iniciar(self):
+        """Rodar o startup do lifespan (filas, conversões, pools)"""
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan = asyncio.create_task(self.app(scope, self._entrada.get, self._saida.put))
+        await self._entrada.put({"type": "lifespan.startup"})
+        mensagem = await self._saida.get()
+        if mensagem["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"Falha no startup do app: {mensagem.get('message')}")
+
+    async def encerrar(self):
+        """Rodar o shutdown do lifespan"""
+        if self._lifespan is None:
+            return
+        await self._entrada.put({"type": "lifespan.shutdown"})
+        await self._saida.get()
+        await self._lifespan
+        self._lifespan = None
+
+    async def requisicao(
+        self,
+        metodo: str,
+        url: str,
+        corpo: bytes = b"",
+        headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, int, float]:
+        """Fazer uma requisição; retorna (status, bytes do corpo, segundos)"""
+        partes = urlsplit(url)
+        cabecalhos = [(b"host", b"benchmark")]
+        if corpo:
+            cabecalhos.append((b"content-length", str(len(corpo)).encode()))
+        cabecalhos += [(nome.lower().encode(), valor.encode()) for nome, valor in (headers or {}).items()]
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": metodo,
+            "scheme": "http",
+            "path": partes.path,
+            "raw_path": partes.path.encode(),
+            "query_string": partes.query.encode(),
+            "root_path": "",
+            "headers": cabecalhos,
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+        }
+        enviado = False
+        terminou = asyncio.Event()
+
+        async def receive() -> dict:
+            nonlocal enviado
+            if not enviado:
+                enviado = True
+                return {"type": "http.request", "body": corpo, "more_body": False}
+            await terminou.wait()
+            return {"type": "http.disconnect"}
+
+        status, tamanho = 0, 0
+
+        async def send(mensagem: dict):
+            nonlocal status, tamanho
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            elif mensagem["type"] == "http.response.body":
+                tamanho += len(mensagem.get("body", b""))
+                if not mensagem.get("more_body", False):
+                    terminou.set()
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            terminou.set()
+        return status, tamanho, time.perf_counter() - inicio
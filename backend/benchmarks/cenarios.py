@@ -0,0 +1,217 @@
+"""
+Cenários de carga: uma requisição típica de cada rota da API
+
+Cada cenário monta suas requisições a partir do conjunto sintético (ids,
+turmas e respostas sorteados com uma semente fixa). As requisições são
+montadas antes da medição, então consultas ao storage feitas para
+escolher ids não entram no tempo medido.
+
+Os cenários rodam na ordem da lista: leituras, depois escritas e, por
+último, as remoções, que consomem ids do fim de cada coleção (as escritas
+anteriores só usam ids do começo).
+"""
+
+import io
+import json
+import uuid
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import storage
+
+Requisicao = Tuple[str, str, bytes, dict]  # (método, url, corpo, headers)
+
+JSON = {"content-type": "application/json"}
+# Ids do fim de cada coleção reservados para os cenários de remoção
+FRACAO_REMOCAO = 0.1
+# Gabaritos cujas folhas PNG são baixadas (as demais seriam só renderização)
+GABARITOS_PNG = 20
+
+
+class Contexto:
+    """Conjunto de dados em uso e o sorteio dos parâmetros"""
+
+    def __init__(self, meta: dict, semente: int = 7):
+        self.meta = meta
+        self.rng = np.random.default_rng(semente)
+        self._removidos = {"gabaritos": 0, "provas": 0, "resultados": 0}
+
+    def _total(self, colecao: str) -> int:
+        return self.meta["gabaritos"] if colecao == "gabaritos" else self.meta["provas"]
+
+    def id(self, colecao: str) -> int:
+        """Id sorteado fora da faixa reservada para remoções"""
+        limite = max(1, int(self._total(colecao) * (1 - FRACAO_REMOCAO)))
+        return int(self.rng.integers(1, limite + 1))
+
+    def id_remocao(self, colecao: str) -> Optional[int]:
+        """Próximo id da faixa reservada (do último para trás), ou None se acabou"""
+        total = self._total(colecao)
+        if self._removidos[colecao] >= total * FRACAO_REMOCAO:
+            return None
+        self._removidos[colecao] += 1
+        return total - self._removidos[colecao] + 1
+
+    def turma(self) -> str:
+        return f"T{int(self.rng.integers(0, self.meta['turmas'])):05d}"
+
+    def respostas(self, gabarito: dict) -> List[str]:
+        alternativas = gabarito["alternativas"] + [""]
+        return [alternativas[i] for i in self.rng.integers(0, len(alternativas), gabarito["num_questoes"])]
+
+
+class Cenario:
+    """Uma rota medida: como montar cada requisição e quantas fazer"""
+
+    __slots__ = ("nome", "montar", "max_requisicoes", "esperado")
+
+    def __init__(
+        self,
+        nome: str,
+        montar: Callable[[Contexto], Optional[Requisicao]],
+        max_requisicoes: Optional[int] = None,
+        esperado: Tuple[int, ...] = (200,)
+    ):
+        self.nome = nome
+        self.montar = montar
+        self.max_requisicoes = max_requisicoes
+        self.esperado = esperado
+
+    def requisicoes(self, ctx: Contexto, quantidade: int) -> List[Requisicao]:
+        if self.max_requisicoes is not None:
+            quantidade = min(quantidade, self.max_requisicoes)
+        montadas = (self.montar(ctx) for _ in range(quantidade))
+        return [requisicao for requisicao in montadas if requisicao is not None]
+
+
+def _get(url: str, headers: Optional[dict] = None) -> Requisicao:
+    return "GET", url, b"", headers or {}
+
+
+def _json(metodo: str, url: str, corpo: dict) -> Requisicao:
+    return metodo, url, json.dumps(corpo).encode(), JSON
+
+
+def _multipart(campos: dict, arquivos: dict) -> Tuple[bytes, dict]:
+    fronteira = uuid.uuid4().hex
+    partes = []
+    for nome, valor in campos.items():
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+        )
+    for nome, (arquivo, conteudo, tipo) in arquivos.items():
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"; filename="{arquivo}"\r\n'
+            f"Content-Type: {tipo}\r\n\r\n".encode() + conteudo + b"\r\n"
+        )
+    partes.append(f"--{fronteira}--\r\n".encode())
+    return b"".join(partes), {"content-type": f"multipart/form-data; boundary={fronteira}"}
+
+
+def _foto_sintetica() -> bytes:
+    """JPEG do tamanho de uma foto de celular reduzida (sem folha de verdade)"""
+    buffer = io.BytesIO()
+    ruido = np.random.default_rng(0).integers(180, 255, (1600, 1200), dtype=np.uint8)
+    Image.fromarray(ruido, "L").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+_FOTO: List[bytes] = []
+
+
+def _submeter_prova(ctx: Contexto) -> Requisicao:
+    if not _FOTO:
+        _FOTO.append(_foto_sintetica())
+    # Conteúdo diferente a cada envio: a deduplicação por hash não se aplica
+    foto = _FOTO[0] + uuid.uuid4().bytes
+    corpo, headers = _multipart(
+        {"gabarito_id": ctx.id("gabaritos"), "nome_aluno": "Aluno", "matricula_aluno": "1", "turma_aluno": ctx.turma()},
+        {"imagem": ("foto.jpg", foto, "image/jpeg")}
+    )
+    return "POST", "/api/provas/", corpo, headers
+
+
+def _criar_resultado(ctx: Contexto) -> Requisicao:
+    prova = storage.provas.obter(ctx.id("provas"))
+    gabarito = storage.gabaritos.obter(prova["gabarito_id"])
+    return _json("POST", "/api/resultados/", {
+        "prova_id": prova["id"], "gabarito_id": gabarito["id"], "respostas_aluno": ctx.respostas(gabarito)
+    })
+
+
+def _criar_lote(ctx: Contexto) -> Requisicao:
+    gabarito = storage.gabaritos.obter(ctx.id("gabaritos"))
+    provas = storage.provas.filtrar(gabarito_id=gabarito["id"])
+    return _json("POST", "/api/resultados/lote", {
+        "gabarito_id": gabarito["id"],
+        "itens": [{"prova_id": p["id"], "respostas_aluno": ctx.respostas(gabarito)} for p in provas],
+    })
+
+
+def _criar_gabarito(ctx: Contexto) -> Requisicao:
+    num_questoes = int(ctx.rng.integers(10, 61))
+    return _json("POST", "/api/gabaritos/", {
+        "titulo": f"Benchmark {uuid.uuid4().hex[:8]}",
+        "num_questoes": num_questoes,
+        "alternativas": ["A", "B", "C", "D", "E"],
+        "respostas_corretas": ctx.respostas({"alternativas": ["A", "B", "C", "D", "E"], "num_questoes": num_questoes}),
+    })
+
+
+def _atualizar_gabarito(ctx: Contexto) -> Requisicao:
+    # Só a descrição muda: nem a folha nem a chave (sem recorreção)
+    gabarito = storage.gabaritos.obter(ctx.id("gabaritos"))
+    corpo = {campo: gabarito[campo] for campo in ("titulo", "num_questoes", "alternativas", "respostas_corretas")}
+    corpo["descricao"] = uuid.uuid4().hex
+    return _json("PUT", f"/api/gabaritos/{gabarito['id']}", corpo)
+
+
+def _folhas_turma(ctx: Contexto) -> Requisicao:
+    alunos = [{"nome_aluno": f"Aluno {i}", "matricula_aluno": str(i)} for i in range(ctx.meta["alunos_por_turma"])]
+    gabarito_id = int(ctx.rng.integers(1, GABARITOS_PNG + 1))
+    return _json("POST", f"/api/gabaritos/{gabarito_id}/folhas", {"turma_aluno": ctx.turma(), "alunos": alunos})
+
+
+def _remover(colecao: str, rota: str) -> Callable[[Contexto], Optional[Requisicao]]:
+    def montar(ctx: Contexto) -> Optional[Requisicao]:
+        item_id = ctx.id_remocao(colecao)
+        return None if item_id is None else ("DELETE", f"{rota}/{item_id}", b"", {})
+    return montar
+
+
+CENARIOS = [
+    # Leituras
+    Cenario("GET /health", lambda ctx: _get("/health")),
+    Cenario("GET /api/gabaritos?limit=100", lambda ctx: _get("/api/gabaritos/?limit=100&sort=-criado_em")),
+    Cenario("GET /api/gabaritos/{id}", lambda ctx: _get(f"/api/gabaritos/{ctx.id('gabaritos')}")),
+    Cenario("GET /api/gabaritos/{id}/png",
+            lambda ctx: _get(f"/api/gabaritos/{int(ctx.rng.integers(1, GABARITOS_PNG + 1))}/png")),
+    Cenario("GET /api/provas?limit=100", lambda ctx: _get("/api/provas/?limit=100&sort=-criado_em")),
+    Cenario("GET /api/provas?gabarito_id", lambda ctx: _get(f"/api/provas/?gabarito_id={ctx.id('gabaritos')}")),
+    Cenario("GET /api/provas/{id}", lambda ctx: _get(f"/api/provas/{ctx.id('provas')}")),
+    Cenario("GET /api/provas/{id}/status", lambda ctx: _get(f"/api/provas/{ctx.id('provas')}/status")),
+    Cenario("GET /api/resultados?turma_aluno",
+            lambda ctx: _get(f"/api/resultados/?turma_aluno={ctx.turma()}&limit=100&sort=-nota")),
+    Cenario("GET /api/resultados?gabarito_id",
+            lambda ctx: _get(f"/api/resultados/?gabarito_id={ctx.id('gabaritos')}")),
+    Cenario("GET /api/resultados/{id}", lambda ctx: _get(f"/api/resultados/{ctx.id('resultados')}")),
+    Cenario("GET /api/resultados/exportar",
+            lambda ctx: _get(f"/api/resultados/exportar?gabarito_id={ctx.id('gabaritos')}&questoes=true")),
+    Cenario("GET .../gabarito/{id}/estatisticas",
+            lambda ctx: _get(f"/api/resultados/gabarito/{ctx.id('gabaritos')}/estatisticas")),
+    Cenario("GET .../gabarito/{id}/analise",
+            lambda ctx: _get(f"/api/resultados/gabarito/{ctx.id('gabaritos')}/analise")),
+    # Escritas
+    Cenario("POST /api/gabaritos", _criar_gabarito, max_requisicoes=50),
+    Cenario("PUT /api/gabaritos/{id}", _atualizar_gabarito),
+    Cenario("POST /api/gabaritos/{id}/folhas", _folhas_turma, max_requisicoes=10),
+    Cenario("POST /api/provas", _submeter_prova, max_requisicoes=50),
+    Cenario("POST /api/resultados", _criar_resultado),
+    Cenario("POST /api/resultados/lote", _criar_lote),
+    # Remoções (ids reservados no fim de cada coleção)
+    Cenario("DELETE /api/resultados/{id}", _remover("resultados", "/api/resultados")),
+    Cenario("DELETE /api/provas/{id}", _remover("provas", "/api/provas")),
+    Cenario("DELETE /api/gabaritos/{id}", _remover("gabaritos", "/api/gabaritos")),
+]
@@ -0,0 +1,181 @@
+"""
+Conjuntos de dados sintéticos para os benchmarks
+
+Os registros são gravados direto nas coleções do storage (sem passar pelas
+rotas), em lotes, já no formato que a API grava: gabaritos com a versão da
+chave registrada, provas concluídas e resultados com respostas compactas.
+Cada turma tem ALUNOS_POR_TURMA alunos e faz vários gabaritos; o desempenho
+de cada aluno segue uma "habilidade" sorteada, então notas, estatísticas e
+análise de itens têm distribuições realistas.
+
+Deve ser chamado com o diretório de trabalho já no destino (o storage grava
+em data/ relativo ao diretório atual) e antes de qualquer import das rotas.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+
+ESCALAS: Dict[str, Dict[str, int]] = {
+    "minimo": {"gabaritos": 50, "provas": 1_000},
+    "pequeno": {"gabaritos": 1_000, "provas": 10_000},
+    "medio": {"gabaritos": 10_000, "provas": 100_000},
+    "grande": {"gabaritos": 50_000, "provas": 1_000_000},
+}
+ALUNOS_POR_TURMA = 30
+GABARITOS_POR_TURMA = 10
+ALTERNATIVAS = ("A", "B", "C", "D", "E")
+QUESTOES = (10, 60)  # intervalo do número de questões
+PERIODO_DIAS = 730  # criado_em espalhado pelos últimos dois anos
+LOTE = 5000
+META_ARQUIVO = os.path.join("data", "benchmark.json")
+
+
+def carregar_meta() -> dict:
+    """Descrição do conjunto já gerado no diretório atual (ou {})"""
+    try:
+        with open(META_ARQUIVO, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _inserir(colecao, registros: list) -> list:
+    """Inserir em lotes; retorna os ids na ordem dos registros"""
+    ids = []
+    for inicio in range(0, len(registros), LOTE):
+        operacoes = [("inserir", (registro,)) for registro in registros[inicio:inicio + LOTE]]
+        ids.extend(item["id"] for item in colecao.aplicar_lote(operacoes))
+    return ids
+
+
+def gerar(num_gabaritos: int, num_provas: int, semente: int = 42) -> dict:
+    """Gerar o conjunto em data/ (coleções vazias) e gravar a descrição
+
+    Retorna a descrição (também gravada em data/benchmark.json), usada
+    pelos cenários para sortear ids válidos.
+    """
+    import storage
+    from utils_respostas import EM_BRANCO, registro_chave
+
+    for colecao in (storage.gabaritos, storage.provas, storage.resultados, storage.chaves):
+        if len(colecao):
+            raise RuntimeError(f"Coleção {colecao.nome} não está vazia; use um diretório novo")
+
+    rng = np.random.default_rng(semente)
+    inicio = datetime.now() - timedelta(days=PERIODO_DIAS)
+    num_turmas = max(1, num_gabaritos // GABARITOS_POR_TURMA)
+    turmas = [f"T{t:05d}" for t in range(num_turmas)]
+
+    # Gabaritos e a versão da chave de cada um
+    gabaritos, corretas_por_gabarito = [], []
+    for g in range(num_gabaritos):
+        num_questoes = int(rng.integers(QUESTOES[0], QUESTOES[1] + 1))
+        corretas = rng.integers(0, len(ALTERNATIVAS), num_questoes).astype(np.uint8)
+        corretas_por_gabarito.append(corretas)
+        criado = (inicio + timedelta(days=PERIODO_DIAS * g / num_gabaritos)).isoformat()
+        gabaritos.append({
+            "titulo": f"Prova {g + 1} - {turmas[g % num_turmas]}",
+            "num_questoes": num_questoes,
+            "alternativas": list(ALTERNATIVAS),
+            "respostas_corretas": [ALTERNATIVAS[c] for c in corretas],
+            "descricao": None,
+            "criado_em": criado,
+            "atualizado_em": criado,
+        })
+    gabarito_ids = _inserir(storage.gabaritos, gabaritos)
+    chave_ids = _inserir(storage.chaves, [
+        registro_chave(gid, g["alternativas"], g["respostas_corretas"])
+        for gid, g in zip(gabarito_ids, gabaritos)
+    ])
+    storage.gabaritos.aplicar_lote([
+        ("atualizar", (gid, {"chave_id": cid})) for gid, cid in zip(gabarito_ids, chave_ids)
+    ])
+
+    # Provas e resultados: as provas de cada gabarito são dos alunos da turma dele
+    habilidade = rng.uniform(0.3, 0.95, (num_turmas, ALUNOS_POR_TURMA))
+    por_gabarito = np.bincount(np.arange(num_provas) % num_gabaritos, minlength=num_gabaritos)
+    provas, resultados = [], []
+    for g, quantidade in enumerate(por_gabarito):
+        if not quantidade:
+            continue
+        turma = g % num_turmas
+        alunos = np.arange(quantidade) % ALUNOS_POR_TURMA
+        corretas = corretas_por_gabarito[g]
+        # Acerta com a habilidade do aluno; senão marca uma alternativa qualquer ou deixa em branco
+        acerta = rng.random((quantidade, len(corretas))) < habilidade[turma, alunos][:, None]
+        codigos = np.where(acerta, corretas, rng.integers(0, len(ALTERNATIVAS), (quantidade, len(corretas))))
+        codigos = np.where(rng.random(codigos.shape) < 0.02, EM_BRANCO, codigos).astype(np.uint8)
+        num_acertos = (codigos == corretas).sum(axis=1)
+        criado = (inicio + timedelta(days=PERIODO_DIAS * g / num_gabaritos, hours=1)).isoformat()
+        for k in range(quantidade):
+            aluno = {
+                "nome_aluno": f"Aluno {turma:05d}-{alunos[k]:02d}",
+                "matricula_aluno": f"{turma:05d}{alunos[k]:02d}",
+                "turma_aluno": turmas[turma],
+            }
+            respostas = ["" if c == EM_BRANCO else ALTERNATIVAS[c] for c in codigos[k]]
+            provas.append({
+                "gabarito_id": gabarito_ids[g],
+                **aluno,
+                "imagem_url": None,
+                "imagem_hash": None,
+                "respostas_detectadas": respostas,
+                "questoes_em_branco": np.flatnonzero(codigos[k] == EM_BRANCO).tolist(),
+                "questoes_multiplas": [],
+                "status": "done",
+                "criado_em": criado,
+            })
+            acertos = int(num_acertos[k])
+            resultados.append({
+                "gabarito_id": gabarito_ids[g],
+                **aluno,
+                "chave_id": chave_ids[g],
+                "respostas": base64.b64encode(codigos[k].tobytes()).decode("ascii"),
+                "acertos": acertos,
+                "erros": len(corretas) - acertos,
+                "percentual_acerto": round(acertos / len(corretas) * 100, 2),
+                "nota": round(acertos / len(corretas) * 10, 2),
+                "criado_em": criado,
+            })
+        # Gravar de tempos em tempos para não manter tudo em memória duas vezes
+        if len(provas) >= LOTE:
+            _gravar_provas(storage, provas, resultados)
+            provas, resultados = [], []
+    _gravar_provas(storage, provas, resultados)
+
+    for colecao in (storage.gabaritos, storage.provas, storage.resultados, storage.chaves):
+        colecao.compactar()
+
+    meta = {
+        "gabaritos": num_gabaritos,
+        "provas": num_provas,
+        "turmas": num_turmas,
+        "alunos_por_turma": ALUNOS_POR_TURMA,
+        "semente": semente,
+        "backend": storage.STORAGE_BACKEND,
+        "gerado_em": datetime.now().isoformat(),
+    }
+    with open(META_ARQUIVO, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _gravar_provas(storage, provas: list, resultados: list):
+    prova_ids = _inserir(storage.provas, provas)
+    for prova_id, resultado in zip(prova_ids, resultados):
+        resultado["prova_id"] = prova_id
+    resultado_ids = _inserir(storage.resultados, resultados)
+    storage.provas.aplicar_lote([
+        ("atualizar", (pid, {"resultado_id": rid})) for pid, rid in zip(prova_ids, resultado_ids)
+    ])
+
+
+def gerar_em(diretorio: str, num_gabaritos: int, num_provas: int, semente: int = 42):
+    """Gerar o conjunto em `diretorio` (alvo de um processo novo)"""
+    os.chdir(diretorio)
+    gerar(num_gabaritos, num_provas, semente)
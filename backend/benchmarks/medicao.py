@@ -0,0 +1,138 @@
+"""
+Resumo das medições, baselines em JSON e comparação entre execuções
+
+Uma baseline guarda, por rota e por microbenchmark, as latências p50/p95/p99
+(em milissegundos) e a vazão. Na comparação, uma medição é regressão quando
+o p50 ou o p95 pioram mais que a tolerância em relação à baseline (ou a
+vazão cai na mesma proporção) ou quando há mais erros; diferenças abaixo de
+MINIMO_MS são ignoradas, porque em rotas muito rápidas são só ruído.
+"""
+
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+VERSAO_BASELINE = 1
+TOLERANCIA_PADRAO = 0.20
+MINIMO_MS = 0.5
+
+
+def resumir(latencias: Sequence[float], duracao: float, erros: int = 0, bytes_total: int = 0) -> dict:
+    """Estatísticas de uma série de latências (em segundos) medida em `duracao` segundos"""
+    ms = np.asarray(latencias, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"n": 0, "erros": erros}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "n": len(ms),
+        "erros": erros,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "media_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "rps": round(len(ms) / duracao, 1) if duracao > 0 else None,
+        "bytes_medio": int(bytes_total / len(ms)),
+    }
+
+
+def ambiente() -> dict:
+    """Onde a medição foi feita (só para referência na comparação)"""
+    return {
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "storage": os.getenv("STORAGE_BACKEND", "json"),
+    }
+
+
+def salvar(caminho: str, dados: dict, rotas: dict, micro: dict, opcoes: dict):
+    """Gravar uma execução como baseline"""
+    saida = {
+        "versao": VERSAO_BASELINE,
+        "medido_em": datetime.now().isoformat(),
+        "ambiente": ambiente(),
+        "dados": dados,
+        "opcoes": opcoes,
+        "rotas": rotas,
+        "micro": micro,
+    }
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+
+
+def carregar(caminho: str) -> dict:
+    with open(caminho, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("versao") != VERSAO_BASELINE:
+        raise ValueError(f"Baseline {caminho} em formato desconhecido")
+    return baseline
+
+
+def _piorou(atual: Optional[float], base: Optional[float], tolerancia: float) -> bool:
+    if atual is None or base is None:
+        return False
+    return atual - base > MINIMO_MS and atual > base * (1 + tolerancia)
+
+
+def comparar(atual: dict, baseline: dict, tolerancia: float = TOLERANCIA_PADRAO) -> List[dict]:
+    """Linhas da comparação (uma por medição presente nas duas execuções)
+
+    Cada linha traz as métricas de antes/depois, a variação do p95 e
+    "regressao" (bool).
+    """
+    linhas = []
+    for grupo in ("rotas", "micro"):
+        for nome, medida in atual.get(grupo, {}).items():
+            base = baseline.get(grupo, {}).get(nome)
+            if not base or not medida.get("n") or not base.get("n"):
+                continue
+            regressao = (
+                _piorou(medida.get("p50_ms"), base.get("p50_ms"), tolerancia)
+                or _piorou(medida.get("p95_ms"), base.get("p95_ms"), tolerancia)
+                or (medida.get("erros", 0) > base.get("erros", 0))
+            )
+            # Vazão de rotas abaixo de MINIMO_MS varia demais entre execuções
+            if grupo == "rotas" and medida.get("rps") and base.get("rps") and base["p50_ms"] >= MINIMO_MS:
+                regressao = regressao or medida["rps"] < base["rps"] / (1 + tolerancia)
+            linhas.append({
+                "grupo": grupo,
+                "nome": nome,
+                "antes": base,
+                "depois": medida,
+                "variacao_p95": round(medida["p95_ms"] / base["p95_ms"] - 1, 3) if base.get("p95_ms") else None,
+                "regressao": regressao,
+            })
+    return linhas
+
+
+def tabela(rotas: Dict[str, dict], micro: Dict[str, dict]) -> str:
+    """Texto com uma linha por medição"""
+    linhas = [f"{'medição':<42} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'erros':>6}"]
+    for grupo, medidas in (("rota", rotas), ("micro", micro)):
+        for nome, m in medidas.items():
+            if not m.get("n"):
+                continue
+            linhas.append(
+                f"{grupo + ' ' + nome:<42.42} {m['n']:>6} {m['p50_ms']:>9.2f} {m['p95_ms']:>9.2f} "
+                f"{m['p99_ms']:>9.2f} {m.get('rps') or 0:>9.1f} {m.get('erros', 0):>6}"
+            )
+    return "\n".join(linhas)
+
+
+def tabela_comparacao(linhas: List[dict]) -> str:
+    """Texto da comparação, com as regressões marcadas"""
+    saida = [f"{'medição':<42} {'p95 antes':>10} {'p95 depois':>11} {'variação':>9}"]
+    for linha in linhas:
+        variacao = linha["variacao_p95"]
+        saida.append(
+            f"{linha['grupo'] + ' ' + linha['nome']:<42.42} {linha['antes']['p95_ms']:>10.2f} "
+            f"{linha['depois']['p95_ms']:>11.2f} {'' if variacao is None else f'{variacao:+.0%}':>9}"
+            f"{'  REGRESSÃO' if linha['regressao'] else ''}"
+        )
+    return "\n".join(saida)
@@ -0,0 +1,65 @@
+"""
+Microbenchmarks dos caminhos internos mais usados pelas rotas
+
+- generate_gabarito_png: folha nova (renderização) e folha repetida
+  (cache de folhas)
+- calcular_resultado: correção de uma prova com a chave já resolvida
+- obter_estatisticas: montagem da resposta a partir dos agregados
+  (montar_estatisticas, o que a rota faz fora do cache de respostas)
+"""
+
+import itertools
+import os
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict
+
+from benchmarks.cenarios import Contexto
+from benchmarks.medicao import resumir
+
+
+def _medir(funcao: Callable[[], object], repeticoes: int, aquecimento: int = 3) -> dict:
+    for _ in range(aquecimento):
+        funcao()
+    latencias = []
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        t = time.perf_counter()
+        funcao()
+        latencias.append(time.perf_counter() - t)
+    return resumir(latencias, time.perf_counter() - inicio)
+
+
+def executar(ctx: Contexto, repeticoes: int = 200) -> Dict[str, dict]:
+    """Medir cada caminho; retorna {nome: resumo}"""
+    import storage
+    from routes.resultado_routes import montar_estatisticas
+    from utils_correcao import calcular_resultado, obter_chave
+    from utils_gabarito import generate_gabarito_png
+
+    medidas = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        destino = os.path.join(diretorio, "folha.png")
+        # Título novo a cada chamada: sempre renderiza
+        medidas["generate_gabarito_png (nova)"] = _medir(
+            lambda: generate_gabarito_png(destino, num_questions=50, title=f"PROVA {uuid.uuid4().hex}"),
+            max(5, repeticoes // 20), aquecimento=1
+        )
+        medidas["generate_gabarito_png (cache)"] = _medir(
+            lambda: generate_gabarito_png(destino, num_questions=50, title="PROVA"), repeticoes
+        )
+
+    gabaritos = [storage.gabaritos.obter(ctx.id("gabaritos")) for _ in range(64)]
+    entradas = [(ctx.respostas(g), obter_chave(g["id"])) for g in gabaritos]
+    proximo = itertools.count()
+    medidas["calcular_resultado"] = _medir(
+        lambda: calcular_resultado(*entradas[next(proximo) % len(entradas)]), repeticoes * 10
+    )
+
+    ids = [g["id"] for g in gabaritos]
+    montar_estatisticas(ids[0])  # montagem inicial dos agregados fica fora da medição
+    medidas["obter_estatisticas"] = _medir(
+        lambda: montar_estatisticas(ids[next(proximo) % len(ids)]), repeticoes * 10
+    )
+    return medidas
@@ -4,21 +4,57 @@ TEstify Backend - API REST para o sistema de correção de provas
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response
+from contextlib import asynccontextmanager
 import uvicorn
 import os
 from dotenv import load_dotenv
 
+# Carregar .env antes das rotas: a camada de storage lê a configuração no import
+load_dotenv()
+
 # Importar rotas
 from routes import gabarito_routes, prova_routes, resultado_routes
+from utils_fila_omr import fila_omr
+from utils_folhas import encerrar_pool as encerrar_pool_folhas
+from utils_correcao import recorrecao
+from utils_manutencao import manutencao
+from utils_respostas import converter_resultados_antigos
+from utils_metricas import MiddlewareMetricas, Medidor, registro, TIPO_CONTEUDO
+from utils_perfil import perfil_requisicao, perfis
+from utils_workers import MULTIPROCESSO, PERFIS_DIR, diretorio_metricas, eleger_lider
+import storage
 
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Subir as filas (reenfileirando pendentes) e encerrar os pools no shutdown
+
+    Com vários workers, só o líder retoma o trabalho pendente e roda a
+    manutenção (coleta de órfãos e arquivo).
+    """
+    lider = eleger_lider()
+    if MULTIPROCESSO:
+        registro.compartilhar(diretorio_metricas(lider))
+        perfis.diretorio = PERFIS_DIR
+    if lider:
+        convertidos = converter_resultados_antigos()
+        if convertidos:
+            print(f"{convertidos} resultados convertidos para o formato compacto")
+    fila_omr.iniciar(reenfileirar=lider)
+    if lider:
+        recorrecao.iniciar()
+        manutencao.iniciar()
+    yield
+    manutencao.parar()
+    fila_omr.parar()
+    encerrar_pool_folhas()
 
 # Inicializar FastAPI
 app = FastAPI(
     title="TEstify API",
     description="Backend do sistema TEstify de correção de provas",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS para aceitar requisições do frontend mobile
@@ -30,11 +66,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas por rota (e perfil opt-in); adicionado por último, fica por fora de tudo
+app.add_middleware(MiddlewareMetricas, perfil=perfil_requisicao)
+
+registro.registrar(Medidor(
+    "testify_colecao_itens", "Registros em cada coleção do storage", ("colecao",),
+    coletar=lambda: {
+        (colecao.nome,): len(colecao)
+        for colecao in (storage.gabaritos, storage.provas, storage.resultados, storage.chaves)
+    },
+    local=True
+))
+registro.registrar(Medidor(
+    "testify_fila_omr_pendentes", "Provas aguardando a leitura automática",
+    coletar=lambda: {(): fila_omr.pendentes()}
+))
+
 # Incluir rotas
 app.include_router(gabarito_routes.router, prefix="/api/gabaritos", tags=["Gabaritos"])
 app.include_router(prova_routes.router, prefix="/api/provas", tags=["Provas"])
 app.include_router(resultado_routes.router, prefix="/api/resultados", tags=["Resultados"])
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas no formato de exposição do Prometheus"""
+    return Response(registro.exportar(), media_type=TIPO_CONTEUDO)
+
+@app.get("/metrics/perfis/{perfil_id}", include_in_schema=False)
+async def obter_perfil(perfil_id: str):
+    """Relatório de uma requisição perfilada (header X-Profile)"""
+    texto = perfis.obter(perfil_id)
+    if texto is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return PlainTextResponse(texto)
+
 # Health check
 @app.get("/health")
 async def health():
@@ -56,7 +121,8 @@ async def root():
             "provas": "/api/provas",
             "resultados": "/api/resultados",
             "docs": "/docs",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         }
     }
 
@@ -2,38 +2,65 @@
 Rotas para gerenciar gabaritos
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import List
-import json
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 import os
+import uuid
 from datetime import datetime
-from schemas import GabaritoCreate, GabaritoResponse
-from utils_gabarito import generate_gabarito_png, create_gabaritos_directory
+from schemas import GabaritoCreate, GabaritoResponse, FolhasTurmaRequest, RecorrecaoResponse
+from utils_correcao import recorrecao
+from utils_respostas import versoes_chave
+from utils_gabarito import generate_gabarito_png, create_gabaritos_directory, layout_path_para
+from utils_folhas import gerar_pdf_folhas
+from utils_http import servir_arquivo
+from utils_cache import responder_com_cache
+from utils_listagem import pagina_listagem, projetar, LISTAGEM_LIMITE_MAX
+from utils_manutencao import arquivar, garantir_restaurado, remover_dependentes, restaurar
+from utils_metricas import FALHAS
+from utils_omr import carregar_layout, CODIGO_BITS_FOLHA
+import storage
 
 router = APIRouter()
 
-# Arquivo para persistência (simulando banco de dados)
-GABARITOS_FILE = "data/gabaritos.json"
-
-def ensure_data_dir():
-    """Garantir que o diretório de dados existe"""
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(GABARITOS_FILE):
-        with open(GABARITOS_FILE, "w") as f:
-            json.dump({"gabaritos": [], "id_counter": 1}, f)
-
-def load_gabaritos():
-    """Carregar gabaritos do arquivo"""
-    ensure_data_dir()
-    with open(GABARITOS_FILE, "r") as f:
-        return json.load(f)
-
-def save_gabaritos(data):
-    """Salvar gabaritos no arquivo"""
-    ensure_data_dir()
-    with open(GABARITOS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+# As folhas mudam quando o gabarito é editado: o cliente sempre revalida (ETag)
+CACHE_CONTROL_PNG = os.getenv("CACHE_CONTROL_PNG", "public, no-cache")
+
+# Campos que mudam o desenho da folha
+CAMPOS_FOLHA = ("titulo", "num_questoes", "alternativas")
+
+def parametros_folha(gabarito: dict) -> dict:
+    """Parâmetros de desenho da folha de um gabarito"""
+    return {
+        "num_questions": gabarito["num_questoes"],
+        "choices": tuple(gabarito["alternativas"]),
+        "title": f"GABARITO - {gabarito['titulo']}"
+    }
+
+def _renderizar_folha(gabarito: dict) -> str:
+    """Gerar o PNG (e o layout) de um gabarito; roda fora do event loop"""
+    gabarito_dir = create_gabaritos_directory()
+    # Nome único a cada renderização: o layout é cacheado pelo caminho (aqui
+    # e nos processos do OMR), então um arquivo nunca pode ser reescrito
+    png_filename = os.path.join(
+        gabarito_dir,
+        f"gabarito_{gabarito['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.png"
+    )
+    return generate_gabarito_png(filename=png_filename, **parametros_folha(gabarito))
+
+async def gerar_folha(gabarito: dict) -> Optional[dict]:
+    """Renderizar a folha em uma thread e gravar png_path/layout_path no gabarito"""
+    try:
+        png_filename = await run_in_threadpool(_renderizar_folha, gabarito)
+    except Exception as e:
+        FALHAS.inc(etapa="folha_gabarito")
+        print(f"Erro ao gerar PNG: {e}")
+        return None
+    return await storage.fila.atualizar(storage.gabaritos, gabarito["id"], {
+        "png_path": png_filename,
+        "layout_path": layout_path_para(png_filename)
+    })
 
 @router.post("/", response_model=GabaritoResponse)
 async def criar_gabarito(gabarito: GabaritoCreate):
@@ -52,10 +79,7 @@ async def criar_gabarito(gabarito: GabaritoCreate):
             detail=f"Número de respostas ({len(gabarito.respostas_corretas)}) não corresponde ao número de questões ({gabarito.num_questoes})"
         )
     
-    data = load_gabaritos()
-    
-    novo_gabarito = {
-        "id": data["id_counter"],
+    novo_gabarito = await storage.fila.inserir(storage.gabaritos, {
         "titulo": gabarito.titulo,
         "num_questoes": gabarito.num_questoes,
         "alternativas": gabarito.alternativas,
@@ -63,81 +87,253 @@ async def criar_gabarito(gabarito: GabaritoCreate):
         "descricao": gabarito.descricao,
         "criado_em": datetime.now().isoformat(),
         "atualizado_em": datetime.now().isoformat()
-    }
+    })
     
-    # Gerar gabarito em PNG
-    try:
-        gabarito_dir = create_gabaritos_directory()
-        png_filename = os.path.join(
-            gabarito_dir,
-            f"gabarito_{novo_gabarito['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        )
-        generate_gabarito_png(
-            filename=png_filename,
-            num_questions=gabarito.num_questoes,
-            title=f"GABARITO - {gabarito.titulo}"
-        )
-        novo_gabarito["png_path"] = png_filename
-    except Exception as e:
-        print(f"Erro ao gerar PNG: {e}")
+    # Registrar já a versão da chave que os resultados vão referenciar
+    await run_in_threadpool(versoes_chave.atual, novo_gabarito["id"])
     
-    data["gabaritos"].append(novo_gabarito)
-    data["id_counter"] += 1
-    save_gabaritos(data)
-    
-    return novo_gabarito
+    # Gerar gabarito em PNG (em thread, sem travar o event loop); se falhar,
+    # a folha é gerada no primeiro download
+    return await gerar_folha(novo_gabarito) or novo_gabarito
 
 @router.get("/", response_model=List[GabaritoResponse])
-async def listar_gabaritos():
-    """Listar todos os gabaritos"""
-    data = load_gabaritos()
-    return data["gabaritos"]
+async def listar_gabaritos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LISTAGEM_LIMITE_MAX),
+    after: Optional[str] = None,
+    sort: str = "id",
+    fields: Optional[str] = None,
+    criado_de: Optional[str] = None,
+    criado_ate: Optional[str] = None
+):
+    """
+    Listar os gabaritos
+    
+    - **limit** / **after**: tamanho da página e cursor (header X-Next-Cursor
+      da página anterior); sem limit, devolve tudo
+    - **sort**: id, criado_em ("-" na frente = decrescente)
+    - **fields**: campos devolvidos, separados por vírgula (ex: id,titulo)
+    - **criado_de** / **criado_ate**: intervalo de criado_em (ISO; só a data inclui o dia todo)
+    
+    Resposta em cache até o próximo commit em gabaritos; com If-None-Match
+    do ETag recebido, devolve 304.
+    """
+    return await responder_com_cache(request, [storage.gabaritos], lambda: pagina_listagem(
+        request, storage.gabaritos, GabaritoResponse, limit, after, sort, fields, criado_de, criado_ate
+    ))
 
 @router.get("/{gabarito_id}", response_model=GabaritoResponse)
-async def obter_gabarito(gabarito_id: int):
-    """Obter um gabarito específico"""
-    data = load_gabaritos()
-    gabarito = next(
-        (g for g in data["gabaritos"] if g["id"] == gabarito_id),
-        None
-    )
+async def obter_gabarito(gabarito_id: int, request: Request):
+    """Obter um gabarito específico (em cache, com ETag / 304)"""
+    def gerar():
+        gabarito = storage.gabaritos.obter(gabarito_id)
+        if not gabarito:
+            raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+        return projetar(gabarito, list(GabaritoResponse.model_fields)), {}
+    return await responder_com_cache(request, [storage.gabaritos], gerar)
+
+@router.get("/{gabarito_id}/png")
+async def baixar_folha_gabarito(gabarito_id: int, request: Request):
+    """
+    Baixar a folha de respostas (PNG) do gabarito
+    
+    Responde com ETag e Cache-Control; reenviar o ETag em If-None-Match
+    devolve 304 sem corpo. Aceita Range (download parcial / retomado).
+    """
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    if not gabarito:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    
+    png_path = gabarito.get("png_path")
+    if not png_path or not os.path.exists(png_path):
+        # Folha ainda não gerada (ou removida do disco): gerar agora
+        gabarito = await gerar_folha(gabarito)
+        if not gabarito:
+            raise HTTPException(status_code=500, detail="Não foi possível gerar a folha do gabarito")
+        png_path = gabarito["png_path"]
+    
+    return servir_arquivo(request, png_path, "image/png", CACHE_CONTROL_PNG)
+
+def _atribuir_codigos(gabarito: dict, alunos: List[dict]) -> List[dict]:
+    """Código de folha de cada aluno, reaproveitando o de quem já recebeu folha
+
+    Retorna a lista de folhas do gabarito atualizada (com os alunos novos);
+    levanta ValueError se os códigos do gabarito acabaram.
+    """
+    folhas = list(gabarito.get("folhas") or [])
+    por_aluno = {(f["matricula_aluno"], f["nome_aluno"]): f for f in folhas}
+    proximo = max((f["codigo"] for f in folhas), default=0) + 1
+    for aluno in alunos:
+        existente = por_aluno.get((aluno["matricula_aluno"], aluno["nome_aluno"]))
+        if existente is not None and existente.get("turma_aluno") == aluno["turma_aluno"]:
+            aluno["codigo"] = existente["codigo"]
+            continue
+        if proximo >= 1 << CODIGO_BITS_FOLHA:
+            raise ValueError("Limite de folhas personalizadas do gabarito atingido")
+        aluno["codigo"] = proximo
+        proximo += 1
+        folha = {campo: aluno[campo] for campo in ("codigo", "nome_aluno", "matricula_aluno", "turma_aluno")}
+        folhas.append(folha)
+        por_aluno[(aluno["matricula_aluno"], aluno["nome_aluno"])] = folha
+    return folhas
+
+@router.post("/{gabarito_id}/folhas")
+async def gerar_folhas_turma(gabarito_id: int, pedido: FolhasTurmaRequest):
+    """
+    Gerar as folhas personalizadas de uma turma (PDF com uma página por aluno)
+    
+    - **turma_aluno**: Turma padrão dos alunos
+    - **alunos**: [{"nome_aluno", "matricula_aluno", "turma_aluno"?}, ...]
+    
+    Cada folha traz o nome e a matrícula impressos e uma faixa de código na
+    margem esquerda; na correção, a prova é associada ao aluno pelo código,
+    sem precisar informar nome/matrícula no envio.
+    """
+    gabarito = storage.gabaritos.obter(gabarito_id)
     if not gabarito:
         raise HTTPException(status_code=404, detail="Gabarito não encontrado")
-    return gabarito
+    if not pedido.alunos:
+        raise HTTPException(status_code=400, detail="Nenhum aluno informado")
+    
+    # Folha gerada antes da faixa de código: gerar de novo (mesmas bolhas)
+    layout_path = gabarito.get("layout_path")
+    if not layout_path or not os.path.exists(layout_path) or "codigo" not in carregar_layout(layout_path):
+        gabarito = await gerar_folha(gabarito)
+        if not gabarito:
+            raise HTTPException(status_code=500, detail="Não foi possível gerar a folha do gabarito")
+    
+    alunos = [
+        {
+            "nome_aluno": aluno.nome_aluno,
+            "matricula_aluno": aluno.matricula_aluno,
+            "turma_aluno": aluno.turma_aluno or pedido.turma_aluno or ""
+        }
+        for aluno in pedido.alunos
+    ]
+    # Códigos atribuídos sobre o estado gravado, dentro do commit: requisições
+    # (ou workers) concorrentes nunca repetem um código nem perdem alunos
+    erros = []
+    
+    def atribuir(atual: dict) -> Optional[dict]:
+        try:
+            folhas = _atribuir_codigos(atual, alunos)
+        except ValueError as e:
+            erros.append(str(e))
+            return None
+        if len(folhas) == len(atual.get("folhas") or []):
+            return None
+        return {"folhas": folhas}
+    
+    if not await storage.fila.alterar(storage.gabaritos, gabarito_id, atribuir):
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    if erros:
+        raise HTTPException(status_code=400, detail=erros[0])
+    
+    tamanho_px = tuple(carregar_layout(gabarito["layout_path"])["page_size"])
+    return StreamingResponse(
+        gerar_pdf_folhas(parametros_folha(gabarito), gabarito_id, alunos, tamanho_px),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="folhas_gabarito_{gabarito_id}.pdf"'}
+    )
 
 @router.put("/{gabarito_id}", response_model=GabaritoResponse)
 async def atualizar_gabarito(gabarito_id: int, gabarito: GabaritoCreate):
     """Atualizar um gabarito"""
-    data = load_gabaritos()
-    gabarito_existente = next(
-        (g for g in data["gabaritos"] if g["id"] == gabarito_id),
-        None
-    )
+    anterior = storage.gabaritos.obter(gabarito_id)
+    if not anterior:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    folha_anterior = [anterior.get(campo) for campo in CAMPOS_FOLHA]
+    chave_mudou = list(anterior["respostas_corretas"]) != list(gabarito.respostas_corretas)
+    alternativas_mudaram = list(anterior["alternativas"]) != list(gabarito.alternativas)
+    
+    campos = {
+        "titulo": gabarito.titulo,
+        "num_questoes": gabarito.num_questoes,
+        "alternativas": gabarito.alternativas,
+        "respostas_corretas": gabarito.respostas_corretas,
+        "descricao": gabarito.descricao,
+        "atualizado_em": datetime.now().isoformat()
+    }
+    if chave_mudou:
+        # A recorreção precisa dos resultados arquivados de volta
+        await garantir_restaurado(gabarito_id)
+        # Gravada junto com a chave nova: sobrevive a um restart antes da recorreção
+        campos["recorrecao_pendente"] = True
+    gabarito_existente = await storage.fila.atualizar(storage.gabaritos, gabarito_id, campos)
     if not gabarito_existente:
         raise HTTPException(status_code=404, detail="Gabarito não encontrado")
     
-    gabarito_existente["titulo"] = gabarito.titulo
-    gabarito_existente["num_questoes"] = gabarito.num_questoes
-    gabarito_existente["alternativas"] = gabarito.alternativas
-    gabarito_existente["respostas_corretas"] = gabarito.respostas_corretas
-    gabarito_existente["descricao"] = gabarito.descricao
-    gabarito_existente["atualizado_em"] = datetime.now().isoformat()
+    # Chave corrigida: recorrigir em background todos os resultados já gravados
+    # (progresso em GET /{gabarito_id}/recorrecao)
+    if chave_mudou:
+        recorrecao.agendar(gabarito_id)
+    elif alternativas_mudaram:
+        # Resultados novos usam uma nova versão da chave (com as alternativas novas)
+        await run_in_threadpool(versoes_chave.atual, gabarito_id)
+    
+    # Título, questões ou alternativas mudaram: a folha impressa também muda
+    if [gabarito_existente.get(campo) for campo in CAMPOS_FOLHA] != folha_anterior:
+        gabarito_existente = await gerar_folha(gabarito_existente) or gabarito_existente
     
-    save_gabaritos(data)
     return gabarito_existente
 
+@router.get("/{gabarito_id}/recorrecao", response_model=RecorrecaoResponse)
+async def obter_recorrecao(gabarito_id: int):
+    """Progresso da recorreção disparada pela última mudança de respostas_corretas"""
+    tarefa = recorrecao.obter(gabarito_id)
+    if not tarefa:
+        raise HTTPException(status_code=404, detail="Nenhuma recorreção para este gabarito")
+    return tarefa
+
+@router.post("/{gabarito_id}/encerrar", response_model=GabaritoResponse)
+async def encerrar_gabarito(gabarito_id: int):
+    """
+    Encerrar a prova: depois de ARQUIVO_IDADE_DIAS, a manutenção move suas
+    provas, resultados e imagens para o arquivo (as consultas continuam
+    lendo de lá, sem restaurar; ver POST /{gabarito_id}/restaurar)
+    """
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    if not gabarito:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    if gabarito.get("encerrado_em"):
+        return gabarito
+    return await storage.fila.atualizar(storage.gabaritos, gabarito_id, {"encerrado_em": datetime.now().isoformat()})
+
+@router.post("/{gabarito_id}/reabrir", response_model=GabaritoResponse)
+async def reabrir_gabarito(gabarito_id: int):
+    """Reabrir uma prova encerrada (restaurando-a do arquivo, se preciso)"""
+    if not storage.gabaritos.obter(gabarito_id):
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    await garantir_restaurado(gabarito_id)
+    return await storage.fila.atualizar(storage.gabaritos, gabarito_id, {"encerrado_em": None})
+
+@router.post("/{gabarito_id}/arquivar", response_model=GabaritoResponse)
+async def arquivar_gabarito(gabarito_id: int):
+    """Arquivar agora uma prova encerrada, sem esperar ARQUIVO_IDADE_DIAS"""
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    if not gabarito:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    if not gabarito.get("arquivado_em") and not await run_in_threadpool(arquivar, gabarito_id):
+        raise HTTPException(
+            status_code=409, detail="Só provas encerradas e sem provas na fila de leitura podem ser arquivadas"
+        )
+    return storage.gabaritos.obter(gabarito_id)
+
+@router.post("/{gabarito_id}/restaurar", response_model=GabaritoResponse)
+async def restaurar_gabarito(gabarito_id: int):
+    """Trazer de volta do arquivo as provas e resultados (a prova continua encerrada)"""
+    if not storage.gabaritos.obter(gabarito_id):
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    await run_in_threadpool(restaurar, gabarito_id)
+    return storage.gabaritos.obter(gabarito_id)
+
 @router.delete("/{gabarito_id}")
 async def deletar_gabarito(gabarito_id: int):
-    """Deletar um gabarito"""
-    data = load_gabaritos()
-    gabarito_index = next(
-        (i for i, g in enumerate(data["gabaritos"]) if g["id"] == gabarito_id),
-        None
-    )
-    if gabarito_index is None:
+    """Deletar um gabarito, com suas provas, resultados, imagens, folha e arquivo"""
+    gabarito = await storage.fila.remover(storage.gabaritos, gabarito_id)
+    if gabarito is None:
         raise HTTPException(status_code=404, detail="Gabarito não encontrado")
     
-    data["gabaritos"].pop(gabarito_index)
-    save_gabaritos(data)
+    await run_in_threadpool(remover_dependentes, gabarito)
     
     return {"message": f"Gabarito {gabarito_id} deletado com sucesso"}
@@ -2,45 +2,50 @@
 Rotas para gerenciar provas (upload de imagens e processamento)
 """
 
-from fastapi import APIRouter, UploadFile, File, Form
-from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional, Tuple
+import asyncio
 import json
 import os
+import zipfile
 from datetime import datetime
-from schemas import ProvaResponse
+from schemas import ProvaResponse, ProvaStatusResponse, LoteProvasResponse
+from utils_correcao import STATUS_NA_FILA
+from utils_fila_omr import fila_omr
+from utils_http import servir_arquivo
+from utils_imagens import normalizar_imagem
+from utils_listagem import listar_pagina, LISTAGEM_LIMITE_MAX
+from utils_manutencao import (
+    colecao_de_leitura, extrair_arquivado, garantir_restaurado, obter_ou_arquivado, obter_ou_restaurar,
+    remover_imagem_se_orfa
+)
+from utils_omr import FolhaNaoReconhecida
+from utils_upload import armazenar, UploadInvalido
+import storage
 
 router = APIRouter()
 
-PROVAS_FILE = "data/provas.json"
-
-def ensure_data_dir():
-    """Garantir que o diretório de dados existe"""
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists("data/uploads"):
-        os.makedirs("data/uploads")
-    if not os.path.exists(PROVAS_FILE):
-        with open(PROVAS_FILE, "w") as f:
-            json.dump({"provas": [], "id_counter": 1}, f)
-
-def load_provas():
-    """Carregar provas do arquivo"""
-    ensure_data_dir()
-    with open(PROVAS_FILE, "r") as f:
-        return json.load(f)
-
-def save_provas(data):
-    """Salvar provas no arquivo"""
-    ensure_data_dir()
-    with open(PROVAS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+# Tempo máximo de espera pelo reconhecimento quando o lote pede "aguardar"
+LOTE_TIMEOUT = float(os.getenv("LOTE_TIMEOUT", 120))
+# Derivados nunca mudam para a mesma prova (são endereçados pelo conteúdo)
+CACHE_CONTROL_IMAGENS = os.getenv("CACHE_CONTROL_IMAGENS", "private, max-age=31536000, immutable")
+
+# Tipo de arquivo dos originais, pela extensão gravada em utils_upload
+_TIPOS_ORIGINAL = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".bmp": "image/bmp",
+    ".tif": "image/tiff",
+    ".webp": "image/webp",
+}
 
 @router.post("/", response_model=ProvaResponse)
 async def submeter_prova(
     gabarito_id: int = Form(...),
-    nome_aluno: str = Form(...),
-    matricula_aluno: str = Form(...),
-    turma_aluno: str = Form(...),
+    nome_aluno: str = Form(""),
+    matricula_aluno: str = Form(""),
+    turma_aluno: str = Form(""),
     imagem: UploadFile = File(...)
 ):
     """
@@ -51,70 +56,273 @@ async def submeter_prova(
     - **matricula_aluno**: Matrícula do aluno
     - **turma_aluno**: Turma do aluno
     - **imagem**: Arquivo de imagem da prova
-    """
-    ensure_data_dir()
     
-    # Salvar imagem
-    filename = f"data/uploads/prova_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-    with open(filename, "wb") as f:
-        content = await imagem.read()
-        f.write(content)
+    Retorna imediatamente com status "queued"; a leitura das respostas e a
+    criação do resultado acontecem em background. Em folhas personalizadas
+    (POST /api/gabaritos/{id}/folhas) o aluno é identificado pelo código
+    impresso, e nome/matrícula/turma podem ser omitidos.
+    """
+    # Prova nova de um gabarito arquivado: ele volta antes (as leituras vêm do arquivo)
+    await garantir_restaurado(gabarito_id)
+    # Salvar imagem (em blocos, endereçada pelo hash do conteúdo)
+    try:
+        armazenado = await run_in_threadpool(armazenar, imagem.file)
+    except UploadInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    data = load_provas()
-    nova_prova = {
-        "id": data["id_counter"],
+    nova_prova = await storage.fila.inserir(storage.provas, {
         "gabarito_id": gabarito_id,
         "nome_aluno": nome_aluno,
         "matricula_aluno": matricula_aluno,
         "turma_aluno": turma_aluno,
-        "imagem_url": filename,
-        "respostas_detectadas": None,  # Será preenchido por OCR
+        "imagem_url": armazenado["caminho"],
+        "imagem_hash": armazenado["sha256"],
+        "respostas_detectadas": None,  # Preenchido pela fila de OMR
+        "status": STATUS_NA_FILA,
         "criado_em": datetime.now().isoformat()
-    }
+    })
     
-    data["provas"].append(nova_prova)
-    data["id_counter"] += 1
-    save_provas(data)
+    # Leitura das bolhas roda em background; acompanhar em /{id}/status
+    fila_omr.enfileirar(nova_prova["id"])
     
     return nova_prova
 
+def _extrair_lote(arquivos: List[UploadFile]) -> List[Tuple[str, Optional[dict], Optional[str]]]:
+    """Armazenar cada folha do lote (arquivos soltos ou entradas de ZIP)
+
+    As entradas do ZIP são copiadas uma a uma, em blocos, direto do arquivo
+    enviado, sem extrair o pacote inteiro em memória.
+    Retorna (nome, armazenado, erro) na ordem em que as folhas aparecem.
+    """
+    folhas = []
+
+    def gravar(nome: str, origem):
+        try:
+            folhas.append((nome, armazenar(origem), None))
+        except UploadInvalido as e:
+            folhas.append((nome, None, str(e)))
+
+    for arquivo in arquivos:
+        if zipfile.is_zipfile(arquivo.file):
+            arquivo.file.seek(0)
+            with zipfile.ZipFile(arquivo.file) as pacote:
+                for info in pacote.infolist():
+                    nome = info.filename
+                    if info.is_dir() or nome.startswith("__MACOSX/") or os.path.basename(nome).startswith("."):
+                        continue
+                    with pacote.open(info) as origem:
+                        gravar(nome, origem)
+        else:
+            arquivo.file.seek(0)
+            gravar(arquivo.filename or "imagem", arquivo.file)
+    return folhas
+
+@router.post("/lote", response_model=LoteProvasResponse)
+async def submeter_lote_provas(
+    gabarito_id: int = Form(...),
+    turma_aluno: str = Form(""),
+    alunos: Optional[str] = Form(None),
+    aguardar: bool = Form(False),
+    imagens: List[UploadFile] = File(...)
+):
+    """
+    Submeter as provas de uma turma inteira de uma vez
+    
+    - **gabarito_id**: ID do gabarito
+    - **turma_aluno**: Turma das provas
+    - **alunos**: (opcional) JSON com [{"nome_aluno", "matricula_aluno"}, ...]
+      na ordem das folhas; sem isso, o nome do arquivo vira o nome do aluno
+      (folhas personalizadas são associadas ao aluno pelo código impresso)
+    - **aguardar**: esperar o reconhecimento terminar antes de responder
+    - **imagens**: várias imagens ou um único arquivo ZIP com as imagens
+    
+    Todas as provas são gravadas em um único commit e o reconhecimento é
+    distribuído entre os workers da fila de OMR.
+    """
+    if not storage.gabaritos.obter(gabarito_id):
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    await garantir_restaurado(gabarito_id)
+    try:
+        lista_alunos = json.loads(alunos) if alunos else []
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Campo 'alunos' não é um JSON válido")
+    if not isinstance(lista_alunos, list) or not all(isinstance(a, dict) for a in lista_alunos):
+        raise HTTPException(status_code=400, detail="Campo 'alunos' deve ser uma lista de objetos")
+    
+    try:
+        folhas = await run_in_threadpool(_extrair_lote, imagens)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Arquivo ZIP inválido")
+    
+    # Posição na lista de folhas (rejeitadas incluídas): `alunos` segue essa ordem
+    aceitas = [(i, nome, armazenado) for i, (nome, armazenado, erro) in enumerate(folhas) if armazenado]
+    agora = datetime.now().isoformat()
+    novas_provas = []
+    for i, nome, armazenado in aceitas:
+        aluno = lista_alunos[i] if i < len(lista_alunos) else {}
+        novas_provas.append({
+            "gabarito_id": gabarito_id,
+            "nome_aluno": aluno.get("nome_aluno") or os.path.splitext(os.path.basename(nome))[0],
+            "matricula_aluno": aluno.get("matricula_aluno", ""),
+            "turma_aluno": turma_aluno,
+            "imagem_url": armazenado["caminho"],
+            "imagem_hash": armazenado["sha256"],
+            "respostas_detectadas": None,  # Preenchido pela fila de OMR
+            "status": STATUS_NA_FILA,
+            "criado_em": agora
+        })
+    provas = await storage.fila.inserir_lote(storage.provas, novas_provas)
+    for prova in provas:
+        fila_omr.enfileirar(prova["id"])
+    
+    if aguardar and provas:
+        await asyncio.wait(
+            [asyncio.wrap_future(fila_omr.acompanhar(p["id"])) for p in provas],
+            timeout=LOTE_TIMEOUT
+        )
+    
+    saida = []
+    criadas = iter(provas)
+    for nome, armazenado, erro in folhas:
+        if not armazenado:
+            saida.append({"arquivo": nome, "status": "rejected", "erro": erro})
+            continue
+        criada = next(criadas)
+        prova = storage.provas.obter(criada["id"]) or criada
+        saida.append({
+            "arquivo": nome,
+            "prova_id": prova["id"],
+            "status": prova.get("status"),
+            "erro": prova.get("erro"),
+            "respostas_detectadas": prova.get("respostas_detectadas"),
+            "resultado_id": prova.get("resultado_id")
+        })
+    
+    return {
+        "gabarito_id": gabarito_id,
+        "total": len(folhas),
+        "aceitas": len(provas),
+        "rejeitadas": len(folhas) - len(provas),
+        "folhas": saida
+    }
+
 @router.get("/", response_model=List[ProvaResponse])
-async def listar_provas():
-    """Listar todas as provas"""
-    data = load_provas()
-    return data["provas"]
+async def listar_provas(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LISTAGEM_LIMITE_MAX),
+    after: Optional[str] = None,
+    sort: str = "id",
+    fields: Optional[str] = None,
+    criado_de: Optional[str] = None,
+    criado_ate: Optional[str] = None,
+    gabarito_id: Optional[int] = None,
+    turma_aluno: Optional[str] = None,
+    matricula_aluno: Optional[str] = None,
+    status: Optional[str] = None
+):
+    """
+    Listar as provas
+    
+    - **limit** / **after**: tamanho da página e cursor (header X-Next-Cursor
+      da página anterior); sem limit, devolve tudo
+    - **sort**: id, criado_em ("-" na frente = decrescente)
+    - **fields**: campos devolvidos, separados por vírgula (ex: id,nome_aluno,status)
+    - **criado_de** / **criado_ate**: intervalo de criado_em (ISO; só a data inclui o dia todo)
+    - **gabarito_id**, **turma_aluno**, **matricula_aluno**, **status**: filtros
+      (com gabarito_id de um gabarito arquivado, lê do arquivo)
+    """
+    colecao = await colecao_de_leitura(storage.provas, gabarito_id)
+    return listar_pagina(
+        request, colecao, ProvaResponse, limit, after, sort, fields, criado_de, criado_ate,
+        gabarito_id=gabarito_id, turma_aluno=turma_aluno, matricula_aluno=matricula_aluno, status=status
+    )
 
 @router.get("/{prova_id}", response_model=ProvaResponse)
 async def obter_prova(prova_id: int):
     """Obter uma prova específica"""
-    data = load_provas()
-    prova = next(
-        (p for p in data["provas"] if p["id"] == prova_id),
-        None
-    )
+    prova = await obter_ou_arquivado(storage.provas, prova_id)
     if not prova:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Prova não encontrada")
     return prova
 
+@router.get("/{prova_id}/status", response_model=ProvaStatusResponse)
+async def obter_status_prova(prova_id: int):
+    """Status do reconhecimento de uma prova (queued/processing/done/failed)"""
+    prova = await obter_ou_arquivado(storage.provas, prova_id)
+    if not prova:
+        raise HTTPException(status_code=404, detail="Prova não encontrada")
+    return {
+        "prova_id": prova_id,
+        "status": prova.get("status"),
+        "erro": prova.get("erro"),
+        "resultado_id": prova.get("resultado_id")
+    }
+
+async def _derivados_prova(prova_id: int) -> dict:
+    """Caminhos dos derivados de uma prova, gerando-os se ainda não existem
+
+    Provas anteriores à normalização (ou cuja leitura falhou antes de gravar
+    os campos) são normalizadas aqui, na primeira vez que são pedidas. As de
+    uma prova arquivada são lidas do pacote, sem restaurar nem gravar nada.
+    """
+    prova = await obter_ou_arquivado(storage.provas, prova_id)
+    if not prova:
+        raise HTTPException(status_code=404, detail="Prova não encontrada")
+    caminhos = {"trabalho": prova.get("imagem_trabalho"), "miniatura": prova.get("imagem_miniatura")}
+    if all(caminho and os.path.exists(caminho) for caminho in caminhos.values()):
+        return caminhos
+    if storage.provas.obter(prova_id) is None:
+        for tipo, caminho in caminhos.items():
+            caminhos[tipo] = await run_in_threadpool(extrair_arquivado, prova["gabarito_id"], caminho)
+        if not all(caminhos.values()):
+            raise HTTPException(status_code=404, detail="Imagem da prova arquivada não disponível")
+        return caminhos
+    try:
+        caminhos = await run_in_threadpool(normalizar_imagem, prova["imagem_url"], prova.get("imagem_hash"))
+    except FolhaNaoReconhecida as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    await storage.fila.atualizar(storage.provas, prova_id, {
+        "imagem_trabalho": caminhos["trabalho"],
+        "imagem_miniatura": caminhos["miniatura"],
+    })
+    return caminhos
+
+@router.get("/{prova_id}/miniatura")
+async def obter_miniatura_prova(prova_id: int, request: Request):
+    """Miniatura (JPEG, MINIATURA_LADO px no maior lado) da foto da prova"""
+    caminhos = await _derivados_prova(prova_id)
+    return servir_arquivo(request, caminhos["miniatura"], "image/jpeg", CACHE_CONTROL_IMAGENS)
+
+@router.get("/{prova_id}/imagem")
+async def obter_imagem_prova(prova_id: int, request: Request, original: bool = False):
+    """
+    Foto da prova: a cópia de trabalho normalizada (JPEG em tons de cinza,
+    com a orientação corrigida), ou o arquivo enviado com **original=true**
+    (404 se ele não foi mantido; ver IMAGENS_MANTER_ORIGINAL)
+    """
+    if original:
+        prova = await obter_ou_arquivado(storage.provas, prova_id)
+        if not prova:
+            raise HTTPException(status_code=404, detail="Prova não encontrada")
+        caminho = prova.get("imagem_url")
+        if storage.provas.obter(prova_id) is None:
+            caminho = await run_in_threadpool(extrair_arquivado, prova["gabarito_id"], caminho)
+        if not caminho or not os.path.exists(caminho):
+            raise HTTPException(status_code=404, detail="Imagem original não mantida")
+        tipo = _TIPOS_ORIGINAL.get(os.path.splitext(caminho)[1].lower(), "application/octet-stream")
+        return servir_arquivo(request, caminho, tipo, CACHE_CONTROL_IMAGENS)
+    caminhos = await _derivados_prova(prova_id)
+    return servir_arquivo(request, caminhos["trabalho"], "image/jpeg", CACHE_CONTROL_IMAGENS)
+
 @router.delete("/{prova_id}")
 async def deletar_prova(prova_id: int):
     """Deletar uma prova"""
-    data = load_provas()
-    prova_index = next(
-        (i for i, p in enumerate(data["provas"]) if p["id"] == prova_id),
-        None
-    )
-    if prova_index is None:
-        from fastapi import HTTPException
+    await obter_ou_restaurar(storage.provas, prova_id)
+    prova = await storage.fila.remover(storage.provas, prova_id)
+    if prova is None:
         raise HTTPException(status_code=404, detail="Prova não encontrada")
     
-    # Deletar arquivo de imagem
-    prova = data["provas"][prova_index]
-    if os.path.exists(prova["imagem_url"]):
-        os.remove(prova["imagem_url"])
-    
-    data["provas"].pop(prova_index)
-    save_provas(data)
+    # Deletar arquivo de imagem (se nenhuma outra prova usa o mesmo conteúdo)
+    remover_imagem_se_orfa(prova)
     
     return {"message": f"Prova {prova_id} deletada com sucesso"}
@@ -2,77 +2,40 @@
 Rotas para resultados das correções
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import List
-import json
-import os
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from datetime import datetime
-from schemas import ResultadoResponse, EstatisticasResponse, ResultadoCreate
+from schemas import (
+    ResultadoResponse, EstatisticasResponse, ResultadoCreate, ResultadoLoteCreate, AnaliseItensResponse,
+    DesempenhoTurmaResponse, DesempenhoAlunoResponse, SimilaridadeResponse
+)
+from utils_analise import analisar_gabarito
+from utils_correcao import corrigir_lote, campos_corrigidos, montar_resultado, GabaritoNaoEncontrado
+from utils_cache import responder_com_cache
+from utils_desempenho import desempenho
+from utils_estatisticas import estatisticas
+from utils_exportacao import exportar_csv, exportar_ndjson, FORMATOS
+from utils_listagem import listar_pagina, ordenacao, intervalo_criacao, LISTAGEM_LIMITE_MAX
+from utils_manutencao import abrir_arquivado, colecao_de_leitura, obter_ou_arquivado, obter_ou_restaurar
+from utils_respostas import Chave, campos_respostas, expandir_resultado
+from utils_similaridade import analisar_similaridade, SIMILARIDADE_MINIMO_ERROS
+import storage
+import utils_correcao
 
 router = APIRouter()
 
-RESULTADOS_FILE = "data/resultados.json"
-GABARITOS_FILE = "data/gabaritos.json"
-PROVAS_FILE = "data/provas.json"
-
-def ensure_data_dir():
-    """Garantir que o diretório de dados existe"""
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    if not os.path.exists(RESULTADOS_FILE):
-        with open(RESULTADOS_FILE, "w") as f:
-            json.dump({"resultados": [], "id_counter": 1}, f)
-
-def load_resultados():
-    """Carregar resultados do arquivo"""
-    ensure_data_dir()
-    with open(RESULTADOS_FILE, "r") as f:
-        return json.load(f)
-
-def load_gabaritos():
-    """Carregar gabaritos"""
-    with open(GABARITOS_FILE, "r") as f:
-        return json.load(f)
-
-def load_provas():
-    """Carregar provas"""
-    with open(PROVAS_FILE, "r") as f:
-        return json.load(f)
-
-def save_resultados(data):
-    """Salvar resultados no arquivo"""
-    ensure_data_dir()
-    with open(RESULTADOS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def calcular_resultado(respostas_aluno: List[str], gabarito_id: int) -> dict:
-    """
-    Calcular o resultado da correção
-    """
-    gabaritos_data = load_gabaritos()
-    gabarito = next(
-        (g for g in gabaritos_data["gabaritos"] if g["id"] == gabarito_id),
-        None
-    )
-    
-    if not gabarito:
-        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
-    
-    respostas_corretas = gabarito["respostas_corretas"]
-    
-    acertos = sum(
-        1 for a, c in zip(respostas_aluno, respostas_corretas) if a == c
-    )
-    erros = len(respostas_aluno) - acertos
-    percentual = (acertos / len(respostas_aluno) * 100) if respostas_aluno else 0
-    nota = (acertos / len(respostas_aluno) * 10) if respostas_aluno else 0
-    
-    return {
-        "acertos": acertos,
-        "erros": erros,
-        "percentual_acerto": round(percentual, 2),
-        "nota": round(nota, 2)
-    }
+async def obter_chave(gabarito_id: int) -> Chave:
+    """Versão atual da chave de respostas do gabarito (404 se não existe)
+
+    No threadpool: depois de uma mudança no gabarito, a consulta registra a
+    versão nova com commits no storage.
+    """
+    try:
+        return await run_in_threadpool(utils_correcao.obter_chave, gabarito_id)
+    except GabaritoNaoEncontrado as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 @router.post("/", response_model=ResultadoResponse)
 async def criar_resultado(payload: ResultadoCreate):
@@ -83,122 +46,328 @@ async def criar_resultado(payload: ResultadoCreate):
     - **gabarito_id**: ID do gabarito
     - **respostas_aluno**: Respostas do aluno detectadas ou inseridas
     """
-    provas_data = load_provas()
-    prova = next(
-        (p for p in provas_data["provas"] if p["id"] == payload.prova_id),
-        None
-    )
+    prova = await obter_ou_restaurar(storage.provas, payload.prova_id)
     
     if not prova:
         raise HTTPException(status_code=404, detail="Prova não encontrada")
     
-    # Calcular resultado
-    calculo = calcular_resultado(payload.respostas_aluno, payload.gabarito_id)
+    chave = await obter_chave(payload.gabarito_id)
+    resultado = montar_resultado(prova, chave, payload.respostas_aluno)
+    novo_resultado = await storage.fila.inserir(storage.resultados, resultado)
     
-    # Obter gabarito para pegar respostas corretas
-    gabaritos_data = load_gabaritos()
-    gabarito = next(
-        (g for g in gabaritos_data["gabaritos"] if g["id"] == payload.gabarito_id),
-        None
-    )
-    if not gabarito:
-        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    return expandir_resultado(novo_resultado)
+
+@router.post("/lote", response_model=List[ResultadoResponse])
+async def criar_resultados_lote(payload: ResultadoLoteCreate):
+    """
+    Corrigir várias provas de um gabarito de uma vez
     
-    data = load_resultados()
-    novo_resultado = {
-        "id": data["id_counter"],
-        "prova_id": payload.prova_id,
-        "gabarito_id": payload.gabarito_id,
-        "nome_aluno": prova["nome_aluno"],
-        "matricula_aluno": prova["matricula_aluno"],
-        "turma_aluno": prova["turma_aluno"],
-        "respostas_aluno": payload.respostas_aluno,
-        "respostas_corretas": gabarito["respostas_corretas"],
-        **calculo,
-        "criado_em": datetime.now().isoformat()
-    }
+    - **gabarito_id**: ID do gabarito
+    - **itens**: [{"prova_id", "respostas_aluno"}, ...]
+    
+    A chave é lida uma vez (do cache), todas as respostas são corrigidas
+    em uma única operação de matriz e os resultados são gravados em um
+    único commit. Se alguma prova não existir, nada é gravado.
+    """
+    chave = await obter_chave(payload.gabarito_id)
     
-    data["resultados"].append(novo_resultado)
-    data["id_counter"] += 1
-    save_resultados(data)
+    provas = [await obter_ou_restaurar(storage.provas, item.prova_id) for item in payload.itens]
+    faltando = [item.prova_id for item, prova in zip(payload.itens, provas) if prova is None]
+    if faltando:
+        raise HTTPException(status_code=404, detail=f"Provas não encontradas: {faltando}")
     
-    return novo_resultado
+    correcao = corrigir_lote([item.respostas_aluno for item in payload.itens], chave.corretas)
+    agora = datetime.now().isoformat()
+    novos = [
+        {
+            "prova_id": prova["id"],
+            "gabarito_id": payload.gabarito_id,
+            "nome_aluno": prova["nome_aluno"],
+            "matricula_aluno": prova["matricula_aluno"],
+            "turma_aluno": prova["turma_aluno"],
+            **campos_respostas(item.respostas_aluno, chave),
+            **campos_corrigidos(correcao, i, chave),
+            "criado_em": agora
+        }
+        for i, (item, prova) in enumerate(zip(payload.itens, provas))
+    ]
+    
+    return [expandir_resultado(r) for r in await storage.fila.inserir_lote(storage.resultados, novos)]
 
 @router.get("/", response_model=List[ResultadoResponse])
-async def listar_resultados():
-    """Listar todos os resultados"""
-    data = load_resultados()
-    return data["resultados"]
+async def listar_resultados(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LISTAGEM_LIMITE_MAX),
+    after: Optional[str] = None,
+    sort: str = "id",
+    fields: Optional[str] = None,
+    criado_de: Optional[str] = None,
+    criado_ate: Optional[str] = None,
+    gabarito_id: Optional[int] = None,
+    prova_id: Optional[int] = None,
+    turma_aluno: Optional[str] = None,
+    matricula_aluno: Optional[str] = None
+):
+    """
+    Listar os resultados
+    
+    - **limit** / **after**: tamanho da página e cursor (header X-Next-Cursor
+      da página anterior); sem limit, devolve tudo
+    - **sort**: id, criado_em, nota ("-" na frente = decrescente)
+    - **fields**: campos devolvidos, separados por vírgula (ex: id,matricula_aluno,nota)
+    - **criado_de** / **criado_ate**: intervalo de criado_em (ISO; só a data inclui o dia todo)
+    - **gabarito_id**, **prova_id**, **turma_aluno**, **matricula_aluno**: filtros
+      (com gabarito_id de um gabarito arquivado, lê do arquivo)
+    """
+    colecao = await colecao_de_leitura(storage.resultados, gabarito_id)
+    return listar_pagina(
+        request, colecao, ResultadoResponse, limit, after, sort, fields, criado_de, criado_ate,
+        expandir=expandir_resultado,
+        gabarito_id=gabarito_id, prova_id=prova_id, turma_aluno=turma_aluno, matricula_aluno=matricula_aluno
+    )
+
+@router.get("/exportar")
+async def exportar_resultados(
+    formato: str = "csv",
+    questoes: bool = False,
+    sort: str = "id",
+    criado_de: Optional[str] = None,
+    criado_ate: Optional[str] = None,
+    gabarito_id: Optional[int] = None,
+    prova_id: Optional[int] = None,
+    turma_aluno: Optional[str] = None,
+    matricula_aluno: Optional[str] = None
+):
+    """
+    Exportar resultados (notas) em CSV ou NDJSON
+    
+    - **formato**: "csv" ou "ndjson"
+    - **questoes**: incluir o acerto (1/0) de cada questão (colunas q1..qN
+      no CSV, campo "questoes" no NDJSON)
+    - **sort**, **criado_de**, **criado_ate** e filtros: como na listagem
+    
+    A resposta é enviada em streaming, lendo os resultados em lotes: a
+    memória não cresce com o número de resultados exportados.
+    """
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido: {formato} (use csv ou ndjson)")
+    colecao = await colecao_de_leitura(storage.resultados, gabarito_id)
+    ordem, decrescente = ordenacao(colecao, sort)
+    
+    num_questoes = 0
+    if questoes:
+        if gabarito_id is not None:
+            gabarito = storage.gabaritos.obter(gabarito_id)
+            if not gabarito:
+                raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+            num_questoes = gabarito["num_questoes"]
+        else:
+            # Vários gabaritos: colunas até a maior prova (as demais ficam vazias)
+            num_questoes = max((g["num_questoes"] for g in storage.gabaritos.listar()), default=0)
+    
+    filtros = {
+        campo: valor for campo, valor in {
+            "gabarito_id": gabarito_id, "prova_id": prova_id,
+            "turma_aluno": turma_aluno, "matricula_aluno": matricula_aluno
+        }.items() if valor is not None
+    }
+    exportar = exportar_csv if formato == "csv" else exportar_ndjson
+    nome = f"resultados_gabarito_{gabarito_id}" if gabarito_id is not None else "resultados"
+    return StreamingResponse(
+        exportar(colecao, num_questoes, ordem, decrescente,
+                 intervalos=intervalo_criacao(criado_de, criado_ate), **filtros),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome}.{formato}"'}
+    )
 
 @router.get("/{resultado_id}", response_model=ResultadoResponse)
 async def obter_resultado(resultado_id: int):
     """Obter um resultado específico"""
-    data = load_resultados()
-    resultado = next(
-        (r for r in data["resultados"] if r["id"] == resultado_id),
-        None
-    )
+    resultado = await obter_ou_arquivado(storage.resultados, resultado_id)
     if not resultado:
         raise HTTPException(status_code=404, detail="Resultado não encontrado")
-    return resultado
+    return expandir_resultado(resultado)
+
+def montar_estatisticas(gabarito_id: int) -> dict:
+    """Resposta de estatísticas (formato de EstatisticasResponse) a partir dos agregados"""
+    # Gabarito arquivado: os agregados dos resultados do arquivo
+    arquivado = abrir_arquivado(gabarito_id)
+    agregado = (arquivado.estatisticas if arquivado else estatisticas).obter(gabarito_id)
+    
+    if not agregado:
+        raise HTTPException(status_code=404, detail="Nenhum resultado encontrado para este gabarito")
+    
+    return {
+        "gabarito_id": gabarito_id,
+        "total_provas_corrigidas": agregado["total"],
+        "media_acertos": round(agregado["media_acertos"], 2),
+        "media_erros": round(agregado["media_erros"], 2),
+        "media_percentual": round(agregado["media_percentual"], 2),
+        "questao_mais_errada": agregado["questao_mais_errada"],
+        "questao_mais_acertada": agregado["questao_mais_acertada"],
+        "erros_por_questao": agregado["erros_por_questao"],
+        "histograma_percentual": agregado["histograma_percentual"]
+    }
 
 @router.get("/gabarito/{gabarito_id}/estatisticas", response_model=EstatisticasResponse)
-async def obter_estatisticas(gabarito_id: int):
+async def obter_estatisticas(gabarito_id: int, request: Request):
     """
     Obter estatísticas de um gabarito
     (quais questões mais erraram, média de acertos, etc)
-    """
-    data = load_resultados()
-    resultados_gabarito = [
-        r for r in data["resultados"] if r["gabarito_id"] == gabarito_id
-    ]
     
+    Lê os agregados mantidos a cada resultado gravado: o custo não depende
+    do número de resultados. A resposta fica em cache até o próximo commit
+    em resultados (ETag / 304).
+    """
+    return await responder_com_cache(request, [storage.resultados], lambda: (montar_estatisticas(gabarito_id), {}))
+
+def montar_similaridade(gabarito_id: int, turma_aluno: Optional[str], limite: int, minimo_erros_iguais: int) -> dict:
+    """Resposta da análise de semelhança (formato de SimilaridadeResponse)"""
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    if not gabarito:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    filtros = {"gabarito_id": gabarito_id}
+    if turma_aluno is not None:
+        filtros["turma_aluno"] = turma_aluno
+    arquivado = abrir_arquivado(gabarito_id)
+    resultados_gabarito = (arquivado.resultados if arquivado else storage.resultados).filtrar(**filtros)
     if not resultados_gabarito:
         raise HTTPException(status_code=404, detail="Nenhum resultado encontrado para este gabarito")
     
-    total = len(resultados_gabarito)
-    media_acertos = sum(r["acertos"] for r in resultados_gabarito) / total
-    media_erros = sum(r["erros"] for r in resultados_gabarito) / total
-    media_percentual = sum(r["percentual_acerto"] for r in resultados_gabarito) / total
-    
-    # Encontrar questão mais errada
-    erros_por_questao = {}
-    gabaritos_data = load_gabaritos()
-    gabarito = next(
-        (g for g in gabaritos_data["gabaritos"] if g["id"] == gabarito_id),
-        None
+    return analisar_similaridade(gabarito, resultados_gabarito, turma_aluno, limite, minimo_erros_iguais)
+
+@router.get("/gabarito/{gabarito_id}/similaridade", response_model=SimilaridadeResponse)
+async def obter_similaridade(
+    gabarito_id: int,
+    request: Request,
+    turma_aluno: Optional[str] = None,
+    limite: int = Query(20, ge=1, le=500),
+    minimo_erros_iguais: int = Query(SIMILARIDADE_MINIMO_ERROS, ge=0)
+):
+    """
+    Pares de alunos com respostas suspeitamente parecidas
+    
+    - **turma_aluno**: comparar só os alunos de uma turma
+    - **limite**: quantos pares devolver (os de maior escore)
+    - **minimo_erros_iguais**: ignorar pares com menos erros iguais que isso
+    
+    Compara todos os pares de uma vez, em matriz: o escore é -log10 da
+    probabilidade de tantos erros iguais (mesma alternativa errada) entre dois
+    alunos independentes com aqueles desempenhos; o p_valor já é corrigido
+    pelo número de pares. É um indício para revisão, não uma prova de cola.
+    """
+    return await responder_com_cache(
+        request, [storage.resultados, storage.gabaritos],
+        lambda: (montar_similaridade(gabarito_id, turma_aluno, limite, minimo_erros_iguais), {})
     )
+
+def titulo_gabarito(gabarito_id: int) -> Optional[str]:
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    return gabarito["titulo"] if gabarito else None
+
+def montar_desempenho_turma(turma_aluno: str) -> dict:
+    """Resposta de desempenho da turma (formato de DesempenhoTurmaResponse)"""
+    agregado = desempenho.turma(turma_aluno)
+    
+    if not agregado:
+        raise HTTPException(status_code=404, detail="Nenhum resultado encontrado para esta turma")
     
-    for resultado in resultados_gabarito:
-        for i, (resposta, correta) in enumerate(zip(resultado["respostas_aluno"], resultado["respostas_corretas"])):
-            if resposta != correta:
-                erros_por_questao[i] = erros_por_questao.get(i, 0) + 1
+    provas = [{**prova, "titulo": titulo_gabarito(prova["gabarito_id"])} for prova in agregado["provas"]]
+    provas.sort(key=lambda p: p["gabarito_id"])
+    return {
+        "turma_aluno": turma_aluno,
+        "total_alunos": len(agregado["alunos"]),
+        "total_provas": len(provas),
+        "media_nota": round(agregado["media_nota"], 2),
+        "provas": [
+            {**p, **{campo: round(p[campo], 2) for campo in ("media_nota", "media_percentual", "mediana_nota")}}
+            for p in provas
+        ],
+        "alunos": [
+            {**a, "media_nota": round(a["media_nota"], 2), "percentil": round(a["percentil"], 1)}
+            for a in agregado["alunos"]
+        ]
+    }
+
+def montar_desempenho_aluno(matricula_aluno: str) -> dict:
+    """Resposta do histórico do aluno (formato de DesempenhoAlunoResponse)"""
+    agregado = desempenho.aluno(matricula_aluno)
     
-    questao_mais_errada = max(erros_por_questao, key=erros_por_questao.get) if erros_por_questao else 0
-    questao_mais_acertada = min(erros_por_questao, key=erros_por_questao.get) if erros_por_questao else 0
+    if not agregado:
+        raise HTTPException(status_code=404, detail="Nenhum resultado encontrado para esta matrícula")
     
+    tendencia = agregado["tendencia"]
     return {
-        "gabarito_id": gabarito_id,
-        "total_provas_corrigidas": total,
-        "media_acertos": round(media_acertos, 2),
-        "media_erros": round(media_erros, 2),
-        "media_percentual": round(media_percentual, 2),
-        "questao_mais_errada": questao_mais_errada,
-        "questao_mais_acertada": questao_mais_acertada
+        "matricula_aluno": matricula_aluno,
+        "nome_aluno": agregado["nome_aluno"],
+        "total_provas": len(agregado["provas"]),
+        "media_nota": round(agregado["media_nota"], 2),
+        "tendencia": round(tendencia, 3) if tendencia is not None else None,
+        "provas": [
+            {
+                **{campo: valor for campo, valor in p.items() if campo != "nome_aluno"},
+                "titulo": titulo_gabarito(p["gabarito_id"]),
+                "percentil": round(p["percentil"], 1),
+                "media_turma": round(p["media_turma"], 2)
+            }
+            for p in agregado["provas"]
+        ]
     }
 
+@router.get("/turma/{turma_aluno}/desempenho", response_model=DesempenhoTurmaResponse)
+async def obter_desempenho_turma(turma_aluno: str, request: Request):
+    """
+    Desempenho de uma turma em todos os gabaritos
+    
+    - **provas**: média, mediana, menor e maior nota da turma em cada gabarito
+    - **alunos**: média de cada aluno nos gabaritos que fez, com posição e
+      percentil na turma
+    
+    Lê os agregados mantidos a cada resultado gravado (em cache até o
+    próximo commit em resultados ou gabaritos).
+    """
+    return await responder_com_cache(
+        request, [storage.resultados, storage.gabaritos], lambda: (montar_desempenho_turma(turma_aluno), {})
+    )
+
+@router.get("/aluno/{matricula_aluno}/desempenho", response_model=DesempenhoAlunoResponse)
+async def obter_desempenho_aluno(matricula_aluno: str, request: Request):
+    """
+    Histórico de um aluno em todos os gabaritos
+    
+    Para cada prova (em ordem cronológica): nota, posição e percentil na
+    turma e média da turma; para o aluno: média e tendência (inclinação da
+    reta das notas, em pontos por prova).
+    """
+    return await responder_com_cache(
+        request, [storage.resultados, storage.gabaritos], lambda: (montar_desempenho_aluno(matricula_aluno), {})
+    )
+
+@router.get("/gabarito/{gabarito_id}/analise", response_model=AnaliseItensResponse)
+async def obter_analise_itens(gabarito_id: int):
+    """
+    Análise de itens de um gabarito
+    
+    Para cada questão: dificuldade, discriminação (27% superior/inferior),
+    ponto-bisserial e quantos alunos marcaram cada alternativa; para a
+    prova: média, desvio padrão e KR-20.
+    """
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    if not gabarito:
+        raise HTTPException(status_code=404, detail="Gabarito não encontrado")
+    colecao = await colecao_de_leitura(storage.resultados, gabarito_id)
+    resultados_gabarito = colecao.filtrar(gabarito_id=gabarito_id)
+    if not resultados_gabarito:
+        raise HTTPException(status_code=404, detail="Nenhum resultado encontrado para este gabarito")
+    
+    # Matriz de respostas e estatísticas em NumPy: fora do event loop
+    return await run_in_threadpool(analisar_gabarito, gabarito, resultados_gabarito)
+
 @router.delete("/{resultado_id}")
 async def deletar_resultado(resultado_id: int):
     """Deletar um resultado"""
-    data = load_resultados()
-    resultado_index = next(
-        (i for i, r in enumerate(data["resultados"]) if r["id"] == resultado_id),
-        None
-    )
-    if resultado_index is None:
+    await obter_ou_restaurar(storage.resultados, resultado_id)
+    if await storage.fila.remover(storage.resultados, resultado_id) is None:
         raise HTTPException(status_code=404, detail="Resultado não encontrado")
     
-    data["resultados"].pop(resultado_index)
-    save_resultados(data)
-    
     return {"message": f"Resultado {resultado_id} deletado com sucesso"}
@@ -3,7 +3,7 @@ Schemas (Pydantic models) para validação de dados
 """
 
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # ===== GABARITO =====
@@ -31,10 +31,34 @@ class GabaritoResponse(BaseModel):
     descricao: Optional[str]
     criado_em: datetime
     atualizado_em: datetime
+    encerrado_em: Optional[datetime] = None  # prova encerrada (pode ser arquivada)
+    arquivado_em: Optional[datetime] = None  # provas e resultados no arquivo (ver utils_manutencao)
 
     class Config:
         from_attributes = True
 
+class AlunoFolha(BaseModel):
+    """Aluno da turma que recebe uma folha personalizada"""
+    nome_aluno: str
+    matricula_aluno: str = ""
+    turma_aluno: Optional[str] = None  # padrão: turma_aluno da requisição
+
+class FolhasTurmaRequest(BaseModel):
+    """Schema para gerar as folhas personalizadas de uma turma"""
+    turma_aluno: Optional[str] = None
+    alunos: List[AlunoFolha]
+
+class RecorrecaoResponse(BaseModel):
+    """Progresso da recorreção dos resultados após mudar a chave de respostas"""
+    gabarito_id: int
+    status: str  # queued / processing / done / failed
+    total: Optional[int]  # resultados do gabarito
+    processados: int
+    alterados: int  # resultados cuja nota mudou
+    erro: Optional[str]
+    criado_em: datetime
+    concluido_em: Optional[datetime]
+
 # ===== PROVA =====
 class ProvaCreate(BaseModel):
     """Schema para submeter uma prova para correção"""
@@ -52,12 +76,39 @@ class ProvaResponse(BaseModel):
     matricula_aluno: str
     turma_aluno: str
     imagem_url: Optional[str]
-    respostas_detectadas: Optional[List[str]]
+    respostas_detectadas: Optional[List[str]]  # "" = em branco, "*" = marcação múltipla
+    questoes_em_branco: Optional[List[int]] = None  # índices (base 0)
+    questoes_multiplas: Optional[List[int]] = None
+    status: Optional[str] = None  # queued / processing / done / failed
     criado_em: datetime
 
     class Config:
         from_attributes = True
 
+class ProvaStatusResponse(BaseModel):
+    """Schema de status do reconhecimento de uma prova"""
+    prova_id: int
+    status: Optional[str]
+    erro: Optional[str]
+    resultado_id: Optional[int]
+
+class FolhaLoteResponse(BaseModel):
+    """Resultado do envio de uma folha dentro de um lote"""
+    arquivo: str
+    prova_id: Optional[int] = None
+    status: str  # queued / processing / done / failed / rejected
+    erro: Optional[str] = None
+    respostas_detectadas: Optional[List[str]] = None
+    resultado_id: Optional[int] = None
+
+class LoteProvasResponse(BaseModel):
+    """Schema de resposta do envio de provas em lote"""
+    gabarito_id: int
+    total: int
+    aceitas: int
+    rejeitadas: int
+    folhas: List[FolhaLoteResponse]
+
 # ===== RESULTADO =====
 class ResultadoCreate(BaseModel):
     """Schema de criação de resultado (JSON body)"""
@@ -65,6 +116,16 @@ class ResultadoCreate(BaseModel):
     gabarito_id: int
     respostas_aluno: List[str]
 
+class ItemResultadoLote(BaseModel):
+    """Respostas de uma prova dentro de uma correção em lote"""
+    prova_id: int
+    respostas_aluno: List[str]
+
+class ResultadoLoteCreate(BaseModel):
+    """Schema de correção em lote (várias provas do mesmo gabarito)"""
+    gabarito_id: int
+    itens: List[ItemResultadoLote]
+
 class ResultadoResponse(BaseModel):
     """Schema de resposta para resultado da correção"""
     id: int
@@ -94,3 +155,106 @@ class EstatisticasResponse(BaseModel):
     media_percentual: float
     questao_mais_errada: int
     questao_mais_acertada: int
+    erros_por_questao: List[int] = []  # índice = questão (base 0)
+    histograma_percentual: List[int] = []  # faixas de 10%: [0-10), [10-20), ..., [90-100]
+
+# ===== DESEMPENHO =====
+class DesempenhoProvaTurma(BaseModel):
+    """Resumo de um gabarito aplicado a uma turma"""
+    gabarito_id: int
+    titulo: Optional[str]  # None se o gabarito foi removido
+    total_alunos: int
+    media_nota: float
+    media_percentual: float
+    menor_nota: float
+    maior_nota: float
+    mediana_nota: float
+
+class DesempenhoAlunoTurma(BaseModel):
+    """Média de um aluno em todos os gabaritos da turma"""
+    matricula_aluno: str
+    nome_aluno: str
+    total_provas: int
+    media_nota: float
+    posicao: int  # 1 = maior média; empates dividem a posição
+    percentil: float
+
+class DesempenhoTurmaResponse(BaseModel):
+    """Schema do desempenho de uma turma"""
+    turma_aluno: str
+    total_alunos: int
+    total_provas: int
+    media_nota: float  # média das médias dos alunos
+    provas: List[DesempenhoProvaTurma]
+    alunos: List[DesempenhoAlunoTurma]  # em ordem de posição
+
+class DesempenhoProvaAluno(BaseModel):
+    """Nota de um aluno em um gabarito, comparada à turma"""
+    gabarito_id: int
+    titulo: Optional[str]
+    turma_aluno: str
+    resultado_id: int
+    nota: float
+    percentual_acerto: float
+    criado_em: datetime
+    posicao: int  # na turma, neste gabarito
+    total_turma: int
+    percentil: float
+    media_turma: float
+
+class DesempenhoAlunoResponse(BaseModel):
+    """Schema do histórico de um aluno"""
+    matricula_aluno: str
+    nome_aluno: str
+    total_provas: int
+    media_nota: float
+    tendencia: Optional[float]  # pontos por prova (reta das notas); None com menos de 2 provas
+    provas: List[DesempenhoProvaAluno]  # em ordem cronológica
+
+class AnaliseQuestao(BaseModel):
+    """Estatísticas de uma questão (análise de itens)"""
+    questao: int  # índice base 0
+    correta: Optional[str]
+    dificuldade: Optional[float]  # proporção de acertos (0 a 1)
+    discriminacao: Optional[float]  # acerto nos 27% melhores - nos 27% piores
+    ponto_bisserial: Optional[float]  # None quando não há variação
+    distratores: Dict[str, int]  # alternativa -> nº de alunos que a marcaram
+    em_branco: int
+    invalidas: int  # marcação múltipla ou fora das alternativas
+
+class AnaliseItensResponse(BaseModel):
+    """Schema da análise de itens de um gabarito"""
+    gabarito_id: int
+    total_alunos: int
+    num_questoes: int
+    media_acertos: float
+    desvio_padrao: float
+    kr20: Optional[float]  # confiabilidade da prova
+    questoes: List[AnaliseQuestao]
+
+# ===== SIMILARIDADE =====
+class AlunoPar(BaseModel):
+    """Um dos alunos de um par de folhas parecidas"""
+    resultado_id: int
+    prova_id: int
+    nome_aluno: str
+    matricula_aluno: str
+    turma_aluno: str
+
+class ParSuspeito(BaseModel):
+    """Par de alunos com mais erros iguais do que o esperado ao acaso"""
+    aluno_a: AlunoPar
+    aluno_b: AlunoPar
+    respostas_iguais: int  # questões com a mesma alternativa marcada
+    erros_iguais: int  # ... e errada
+    erros_iguais_esperados: float
+    escore: float  # -log10 da probabilidade de tantos erros iguais ao acaso
+    p_valor: float  # já corrigido pelo número de pares
+
+class SimilaridadeResponse(BaseModel):
+    """Schema da análise de semelhança entre as respostas de um gabarito"""
+    gabarito_id: int
+    turma_aluno: Optional[str]
+    total_alunos: int
+    total_pares: int
+    pares: List[ParSuspeito]  # do maior escore para o menor
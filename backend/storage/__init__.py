@@ -0,0 +1,70 @@
+"""
+Camada de armazenamento compartilhada pelas rotas
+
+O backend é escolhido pela variável STORAGE_BACKEND:
+- "json" (padrão, desenvolvimento): coleções em memória, indexadas por id,
+  com as alterações persistidas em um journal append-only em data/
+- "sqlite": tabelas SQLite (modo WAL) em DATABASE_URL, com índices
+  secundários nos campos de busca
+
+Os dois servem vários processos (uvicorn --workers N, ou WEB_CONCURRENCY):
+as escritas são serializadas entre eles (flock no journal, transação no
+SQLite) e cada processo acompanha as escritas dos outros antes das leituras,
+entregando-as aos seus observadores. `colecao.sincronizar()` faz esse
+acompanhamento para quem lê só dados derivados.
+
+As rotas escrevem pela `fila` (group commit com escritor único); as
+leituras vão direto às coleções, e as listagens paginam com
+`colecao.paginar(...)` (cursor sobre índices ordenados). Quem mantém dados
+derivados (agregados, caches) registra um observador com
+`colecao.observar(callback)`.
+"""
+
+import os
+
+from storage.fila import FilaCommit
+from storage.journal import ColecaoJournal
+
+DATA_DIR = "data"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/testify.db")
+# Workers do uvicorn (o próprio uvicorn usa a variável como padrão de --workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Campos com índice secundário em cada coleção
+INDICES = {
+    "gabaritos": (),
+    "provas": ("gabarito_id", "turma_aluno", "matricula_aluno", "imagem_hash"),
+    "resultados": ("gabarito_id", "prova_id", "turma_aluno", "matricula_aluno", "chave_id"),
+    "chaves": ("gabarito_id",),
+}
+# Campos com índice ordenado (além do id): ordenação e intervalos na paginação
+ORDENACOES = {
+    "gabaritos": ("criado_em",),
+    "provas": ("criado_em",),
+    "resultados": ("criado_em", "nota"),
+    "chaves": (),
+}
+
+
+def criar_colecao(nome: str, backend: str = STORAGE_BACKEND):
+    """Criar a coleção `nome` no backend configurado"""
+    if backend == "sqlite":
+        # Import tardio: o modo JSON não depende do SQLAlchemy
+        from storage.sqlite import ColecaoSQLite
+        return ColecaoSQLite(
+            nome, DATABASE_URL, indices=INDICES[nome], ordenacoes=ORDENACOES[nome],
+            multiprocesso=WEB_CONCURRENCY > 1
+        )
+    if backend == "json":
+        return ColecaoJournal(nome, diretorio=DATA_DIR, indices=INDICES[nome], ordenacoes=ORDENACOES[nome])
+    raise ValueError(f"STORAGE_BACKEND inválido: {backend}")
+
+
+gabaritos = criar_colecao("gabaritos")
+provas = criar_colecao("provas")
+resultados = criar_colecao("resultados")
+# Versões das chaves de respostas, referenciadas pelos resultados (imutáveis)
+chaves = criar_colecao("chaves")
+
+fila = FilaCommit()
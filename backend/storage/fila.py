@@ -0,0 +1,123 @@
+"""
+Fila de escrita com group commit
+
+Uma única thread escritora consome as mutações enfileiradas pelos handlers,
+espera alguns milissegundos para juntar as que chegarem em sequência e
+aplica cada lote com um só commit por coleção (um fsync no journal ou uma
+transação no SQLite). Como só essa thread atribui ids, requisições
+concorrentes nunca recebem ids repetidos nem sobrescrevem as escritas umas
+das outras.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+# Janela de agrupamento e tamanho máximo de um lote
+GROUP_COMMIT_MS = float(os.getenv("GROUP_COMMIT_MS", 5))
+GROUP_COMMIT_MAX_LOTE = int(os.getenv("GROUP_COMMIT_MAX_LOTE", 500))
+
+
+class FilaCommit:
+    """Escritor único que aplica as mutações em lotes"""
+
+    def __init__(self, janela_ms: float = GROUP_COMMIT_MS, max_lote: int = GROUP_COMMIT_MAX_LOTE):
+        self.janela = janela_ms / 1000
+        self.max_lote = max_lote
+        # (coleção, operações, future, se o future resolve com um só retorno)
+        self._fila: "queue.Queue[Tuple[object, List[Tuple[str, tuple]], Future, bool]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _garantir_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name="fila-commit", daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while True:
+            lote = [self._fila.get()]
+            limite = time.monotonic() + self.janela
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._commit(lote)
+
+    def _commit(self, lote: List[Tuple[object, List[Tuple[str, tuple]], Future, bool]]):
+        # Agrupar por coleção mantendo a ordem de chegada dentro de cada uma
+        por_colecao: Dict[int, List[Tuple[object, List[Tuple[str, tuple]], Future, bool]]] = {}
+        for pedido in lote:
+            por_colecao.setdefault(id(pedido[0]), []).append(pedido)
+
+        for pedidos in por_colecao.values():
+            colecao = pedidos[0][0]
+            try:
+                retornos = colecao.aplicar_lote([op for _, ops, _, _ in pedidos for op in ops])
+            except Exception as e:
+                for _, _, future, _ in pedidos:
+                    future.set_exception(e)
+                continue
+            inicio = 0
+            for _, ops, future, unico in pedidos:
+                parte = retornos[inicio:inicio + len(ops)]
+                inicio += len(ops)
+                future.set_result(parte[0] if unico else parte)
+
+    # ===== API =====
+    def submeter(self, colecao, op: str, *args) -> Future:
+        """Enfileirar uma operação; o Future resolve com o retorno dela"""
+        self._garantir_thread()
+        future: Future = Future()
+        self._fila.put((colecao, [(op, args)], future, True))
+        return future
+
+    def submeter_lote(self, colecao, operacoes: List[Tuple[str, tuple]]) -> Future:
+        """Enfileirar várias operações que entram juntas no mesmo commit
+
+        O Future resolve com a lista de retornos, na ordem das operações.
+        """
+        self._garantir_thread()
+        future: Future = Future()
+        self._fila.put((colecao, list(operacoes), future, False))
+        return future
+
+    async def _aguardar(self, colecao, op: str, *args):
+        return await asyncio.wrap_future(self.submeter(colecao, op, *args))
+
+    async def inserir_lote(self, colecao, itens: List[dict]) -> List[dict]:
+        """Inserir vários registros em um único commit"""
+        return await asyncio.wrap_future(
+            self.submeter_lote(colecao, [("inserir", (item,)) for item in itens])
+        )
+
+    async def inserir(self, colecao, item: dict) -> dict:
+        """Inserir um registro; retorna-o com o id atribuído"""
+        return await self._aguardar(colecao, "inserir", item)
+
+    async def atualizar(self, colecao, item_id: int, campos: dict) -> Optional[dict]:
+        """Atualizar campos de um registro; None se não existir"""
+        return await self._aguardar(colecao, "atualizar", item_id, campos)
+
+    async def alterar(self, colecao, item_id: int, funcao) -> Optional[dict]:
+        """Atualizar um registro a partir do estado atual, dentro do commit
+
+        `funcao(registro)` retorna os campos a atualizar (ou None); roda na
+        thread escritora, então duas requisições nunca partem do mesmo estado.
+        """
+        return await self._aguardar(colecao, "alterar", item_id, funcao)
+
+    async def remover(self, colecao, item_id: int) -> Optional[dict]:
+        """Remover um registro; retorna o registro removido ou None"""
+        return await self._aguardar(colecao, "remover", item_id)
@@ -0,0 +1,625 @@
+"""
+Coleção em memória com persistência por journal append-only
+
+O arquivo data/<nome>.json continua sendo o snapshot (mesmo formato de antes:
+{"<nome>": [...], "id_counter": N}). Cada alteração é acrescentada como uma
+linha JSON em data/<nome>.journal; na carga, o snapshot é lido e o journal
+reaplicado. Quando o journal cresce demais, é feita a compactação: um novo
+snapshot é gravado (rename atômico) e o journal é trocado por um novo, que
+começa com a linha {"op": "geracao", "n": N}.
+
+Vários processos (workers do uvicorn) podem usar a mesma coleção: as
+escritas acontecem com a trava exclusiva de data/<nome>.lock e começam
+aplicando o que os outros processos acrescentaram ao journal, então os ids
+nunca se repetem. Antes de cada leitura, um stat do journal mostra se ele
+mudou; se mudou, as linhas novas são reaplicadas (e entregues aos
+observadores) antes da leitura. Uma compactação feita por outro processo é
+percebida pela troca do arquivo: o restante do journal antigo é lido pelo
+descritor ainda aberto e a leitura continua no novo.
+
+A versão de uma coleção (usada nos ETags) é a posição no journal, junto da
+geração e de um id aleatório gravado uma vez em data/instancia: todo
+processo que aplicou as mesmas linhas tem a mesma versão, e ela não se
+repete se o diretório de dados for recriado.
+"""
+
+import json
+import os
+import threading
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from storage.trava import TravaArquivo
+from utils_metricas import medir_etapa
+
+# Compactar quando o journal tiver mais linhas que isso (ou que o nº de itens)
+COMPACTAR_APOS = int(os.getenv("JOURNAL_COMPACTAR_APOS", 1000))
+# paginar() ordena os candidatos do índice secundário só quando eles são
+# menos que 1/PAGINAR_FRACAO_SCAN da coleção
+PAGINAR_FRACAO_SCAN = 8
+
+
+def _mudanca(op: str, anterior: Optional[dict], atual: Optional[dict]) -> Tuple[str, Optional[dict], Optional[dict]]:
+    """(op, anterior, atual) no formato entregue aos observadores"""
+    if op == "inserir":
+        return op, None, atual
+    if op == "remover":
+        return op, anterior, None
+    return op, anterior, atual
+
+
+def chave_ordem(valor) -> tuple:
+    """Chave comparável de um campo de ordenação (None antes de qualquer valor)"""
+    return (valor is not None, valor)
+
+
+def diferencas(anteriores: Dict[int, dict], atuais: Dict[int, dict]) -> List[tuple]:
+    """Mudanças (formato dos observadores) que levam de um estado ao outro"""
+    mudancas = []
+    for item_id, anterior in anteriores.items():
+        atual = atuais.get(item_id)
+        if atual is None:
+            mudancas.append(("remover", anterior, None))
+        elif atual != anterior:
+            mudancas.append(("substituir", anterior, atual))
+    mudancas.extend(("inserir", None, atual) for item_id, atual in atuais.items() if item_id not in anteriores)
+    return mudancas
+
+
+def instancia_armazenamento(diretorio: str) -> str:
+    """Id aleatório do diretório de dados, criado na primeira chamada
+
+    O arquivo aparece completo (link de um temporário já escrito): outro
+    processo criando ao mesmo tempo perde a corrida e lê o id vencedor.
+    """
+    caminho = os.path.join(diretorio, "instancia")
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(uuid.uuid4().hex[:12])
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp_path, caminho)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(caminho, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def notificar_observadores(observadores: List[Callable], mudancas: List[tuple]):
+    """Entregar as mudanças de um commit aos observadores de uma coleção
+
+    Erro em um observador não desfaz o commit nem impede os demais.
+    """
+    for callback in observadores:
+        for op, anterior, atual in mudancas:
+            try:
+                callback(op, anterior, atual)
+            except Exception as e:
+                print(f"Erro no observador da coleção: {e}")
+
+
+class ColecaoJournal:
+    """Coleção de registros (dicts com campo "id") indexada por id
+
+    Campos listados em `indices` ganham um índice secundário
+    (valor -> ids) usado por filtrar(); campos em `ordenacoes` (e o id)
+    ganham um índice ordenado usado por paginar().
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        diretorio: str = "data",
+        indices: Iterable[str] = (),
+        compactar_apos: int = COMPACTAR_APOS,
+        ordenacoes: Iterable[str] = ()
+    ):
+        self.nome = nome
+        self.diretorio = diretorio
+        self.indices = tuple(indices)
+        self.ordenacoes = tuple(ordenacoes)
+        self.compactar_apos = compactar_apos
+        self.snapshot_path = os.path.join(diretorio, f"{nome}.json")
+        self.journal_path = os.path.join(diretorio, f"{nome}.journal")
+        self.trava = TravaArquivo(os.path.join(diretorio, f"{nome}.lock"))
+
+        self._lock = threading.RLock()
+        self._itens: Dict[int, dict] = {}
+        # campo -> valor -> ids (dict usado como conjunto ordenado)
+        self._indices: Dict[str, Dict[object, Dict[int, None]]] = {c: {} for c in self.indices}
+        # campo -> lista ordenada de (chave_ordem(valor), id); "id" -> lista ordenada de ids
+        self._ordenados: Dict[str, list] = self._ordenados_vazios()
+        self._id_counter = 1
+        self._linhas_journal = 0
+        # Journal aberto para acrescentar e para ler o que outros processos gravaram
+        self._journal = None
+        self._leitura = None
+        self._inode = None
+        self._posicao = 0  # bytes do journal já aplicados
+        self._tamanho_visto = 0  # tamanho do journal na última verificação
+        self._geracao = 0  # compactações (linha "geracao" do journal)
+        self._carregado = False
+        self._observadores: List[Callable] = []
+        self._instancia = ""
+        self._versao = ""
+
+    def _ordenados_vazios(self) -> Dict[str, list]:
+        return {"id": [], **{c: [] for c in self.ordenacoes}}
+
+    # ===== CARGA =====
+    def _garantir_carregado(self):
+        if self._carregado:
+            return
+        with self._lock:
+            if self._carregado:
+                return
+            os.makedirs(self.diretorio, exist_ok=True)
+            self._instancia = instancia_armazenamento(self.diretorio)
+            with medir_etapa("json_carga"), self.trava.compartilhada():
+                self._carregar()
+            self._versao = self._posicao_atual()
+            self._carregado = True
+
+    def _carregar(self):
+        """Ler o snapshot e reaplicar o journal (com a trava)"""
+        self._carregar_snapshot()
+        self._abrir_journal()
+        for entrada in self._ler_novas():
+            self._aplicar(entrada)
+
+    def _carregar_snapshot(self):
+        self._itens = {}
+        self._indices = {c: {} for c in self.indices}
+        self._ordenados = self._ordenados_vazios()
+        self._id_counter = 1
+        if not os.path.exists(self.snapshot_path):
+            return
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for item in data.get(self.nome, []):
+            self._itens[item["id"]] = item
+            self._indexar(item, ordenados=False)
+        # Índices ordenados montados de uma vez, com um sort por campo
+        self._ordenados["id"] = sorted(self._itens)
+        for campo in self.ordenacoes:
+            self._ordenados[campo] = sorted(
+                (chave_ordem(item.get(campo)), item["id"]) for item in self._itens.values()
+            )
+        self._id_counter = data.get("id_counter", 1)
+
+    def _abrir_journal(self):
+        for arquivo in (self._journal, self._leitura):
+            if arquivo is not None:
+                arquivo.close()
+        self._journal = open(self.journal_path, "ab")
+        self._leitura = open(self.journal_path, "rb")
+        self._inode = os.fstat(self._leitura.fileno()).st_ino
+        self._posicao = self._tamanho_visto = 0
+        self._geracao = 0
+        self._linhas_journal = 0
+
+    def _ler_novas(self) -> List[dict]:
+        """Entradas completas do journal a partir da posição já aplicada"""
+        self._leitura.seek(self._posicao)
+        dados = self._leitura.read()
+        self._tamanho_visto = self._posicao + len(dados)
+        entradas = []
+        for linha in dados.splitlines(keepends=True):
+            try:
+                if not linha.endswith(b"\n"):
+                    raise json.JSONDecodeError("linha incompleta", "", 0)
+                entrada = json.loads(linha)
+            except json.JSONDecodeError:
+                # Linha truncada (queda durante a escrita): a próxima escrita
+                # sobrescreve a partir daqui
+                break
+            self._posicao += len(linha)
+            self._linhas_journal += 1
+            if entrada["op"] == "geracao":
+                self._geracao = entrada["n"]
+            else:
+                entradas.append(entrada)
+        return entradas
+
+    def _reproduzir(self, entradas: List[dict]) -> List[tuple]:
+        """Aplicar entradas gravadas por outro processo; retorna as mudanças"""
+        mudancas = []
+        for entrada in entradas:
+            op = entrada["op"]
+            item_id = entrada["item"]["id"] if op == "inserir" else entrada["id"]
+            anterior = self._itens.get(item_id)
+            self._aplicar(entrada)
+            atual = self._itens.get(item_id)
+            if op == "inserir" or anterior is not None:
+                mudancas.append(_mudanca(op, anterior, atual))
+        return mudancas
+
+    def _acompanhar(self) -> List[tuple]:
+        """Aplicar o que outros processos gravaram desde a última leitura
+
+        Chamado com o lock e a trava. Retorna as mudanças, a entregar aos
+        observadores com _publicar().
+        """
+        mudancas = self._reproduzir(self._ler_novas())
+        try:
+            inode = os.stat(self.journal_path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._inode:
+            # Outro processo compactou: o snapshot novo contém o journal antigo
+            # inteiro (já lido acima) e o journal novo continua dele
+            geracao = self._geracao
+            self._abrir_journal()
+            novas = self._ler_novas()
+            if self._geracao == geracao + 1:
+                mudancas += self._reproduzir(novas)
+            else:
+                # Mais de uma compactação desde a última leitura: recarregar
+                anteriores = self._itens
+                self._carregar()
+                mudancas += diferencas(anteriores, self._itens)
+        return mudancas
+
+    def _posicao_atual(self) -> str:
+        """Identifica o estado aplicado: o mesmo em todo processo que leu até aqui"""
+        return f"{self._instancia}.{self._geracao}.{self._posicao}"
+
+    def _publicar(self, mudancas: List[tuple]):
+        notificar_observadores(self._observadores, mudancas)
+        # Depois dos observadores: quem vê a versão nova vê os derivados atualizados
+        if mudancas:
+            self._versao = self._posicao_atual()
+
+    def sincronizar(self):
+        """Trazer as escritas de outros processos antes de uma leitura
+
+        Sem escritas novas custa só um stat do journal.
+        """
+        if not self._carregado:
+            self._garantir_carregado()
+            return
+        try:
+            estado = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return
+        if estado.st_ino == self._inode and estado.st_size == self._tamanho_visto:
+            return
+        with self._lock:
+            with self.trava.compartilhada():
+                mudancas = self._acompanhar()
+            self._publicar(mudancas)
+
+    def _indexar(self, item: dict, ordenados: bool = True):
+        for campo, indice in self._indices.items():
+            indice.setdefault(item.get(campo), {})[item["id"]] = None
+        if not ordenados:
+            return
+        ids = self._ordenados["id"]
+        if not ids or ids[-1] < item["id"]:
+            ids.append(item["id"])  # caso comum: id novo é o maior
+        elif ids[bisect_left(ids, item["id"])] != item["id"]:
+            insort(ids, item["id"])
+        for campo in self.ordenacoes:
+            insort(self._ordenados[campo], (chave_ordem(item.get(campo)), item["id"]))
+
+    def _desindexar(self, item: dict, ids: bool = True):
+        for campo, indice in self._indices.items():
+            ids_valor = indice.get(item.get(campo))
+            if ids_valor is not None:
+                ids_valor.pop(item["id"], None)
+                if not ids_valor:
+                    del indice[item.get(campo)]
+        for campo in (("id",) if ids else ()) + self.ordenacoes:
+            lista = self._ordenados[campo]
+            entrada = item["id"] if campo == "id" else (chave_ordem(item.get(campo)), item["id"])
+            posicao = bisect_left(lista, entrada)
+            if posicao < len(lista) and lista[posicao] == entrada:
+                del lista[posicao]
+
+    def _aplicar(self, entrada: dict):
+        op = entrada["op"]
+        if op == "inserir":
+            item = entrada["item"]
+            self._itens[item["id"]] = item
+            self._indexar(item)
+            self._id_counter = max(self._id_counter, item["id"] + 1)
+        elif op == "atualizar":
+            item = self._itens.get(entrada["id"])
+            if item is not None:
+                # Registro novo em vez de update() no lugar: quem leu o
+                # anterior (outra thread) nunca vê uma atualização pela metade
+                novo = {**item, **entrada["campos"], "id": item["id"]}
+                self._desindexar(item, ids=False)
+                self._itens[novo["id"]] = novo
+                self._indexar(novo)
+        elif op == "substituir":
+            item = self._itens.get(entrada["id"])
+            if item is not None:
+                self._desindexar(item, ids=False)
+                self._itens[item["id"]] = entrada["item"]
+                self._indexar(entrada["item"])
+        elif op == "remover":
+            item = self._itens.pop(entrada["id"], None)
+            if item is not None:
+                self._desindexar(item)
+
+    # ===== ESCRITA =====
+    def _preparar(self, op: str, args: tuple):
+        """Montar a entrada de journal de uma operação e o valor de retorno"""
+        if op == "inserir":
+            (item,) = args
+            novo = {"id": self._id_counter, **item}
+            return {"op": "inserir", "item": novo}, novo
+        if op == "restaurar":
+            (item,) = args
+            if item["id"] in self._itens:
+                return None, None
+            return {"op": "inserir", "item": item}, item
+        if op == "atualizar":
+            item_id, campos = args
+            if item_id not in self._itens:
+                return None, None
+            return {"op": "atualizar", "id": item_id, "campos": campos}, self._itens[item_id]
+        if op == "alterar":
+            item_id, funcao = args
+            item = self._itens.get(item_id)
+            if item is None:
+                return None, None
+            # Lê o registro atual dentro do commit (com o lock e a trava)
+            campos = funcao(item)
+            if not campos:
+                return None, item
+            return {"op": "atualizar", "id": item_id, "campos": campos}, item
+        if op == "substituir":
+            item_id, item = args
+            if item_id not in self._itens:
+                return None, None
+            novo = {**item, "id": item_id}
+            return {"op": "substituir", "id": item_id, "item": novo}, novo
+        if op == "remover":
+            (item_id,) = args
+            item = self._itens.get(item_id)
+            if item is None:
+                return None, None
+            return {"op": "remover", "id": item_id}, item
+        raise ValueError(f"Operação desconhecida: {op}")
+
+    def _gravar(self, entradas: List[dict]):
+        """Acrescentar as entradas ao journal com um único fsync (com a trava exclusiva)"""
+        if not entradas:
+            return
+        dados = "".join(
+            json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for entrada in entradas
+        ).encode("utf-8")
+        with medir_etapa("json_gravacao"):
+            if self._tamanho_visto > self._posicao:
+                # Sobra de uma escrita interrompida: descartar antes de acrescentar
+                self._journal.truncate(self._posicao)
+            self._journal.write(dados)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._posicao = self._tamanho_visto = self._posicao + len(dados)
+        self._linhas_journal += len(entradas)
+        if self._linhas_journal > max(self.compactar_apos, len(self._itens)):
+            self.compactar()
+
+    def aplicar_lote(self, operacoes: List[Tuple[str, tuple]]) -> List[Optional[dict]]:
+        """Aplicar várias operações de uma vez (um commit no journal)
+
+        `operacoes` é uma lista de (op, args), com op em "inserir" (item,),
+        "restaurar" (item com id: inserção que mantém o id, ex: volta do
+        arquivo; ignorada se o id já existe), "atualizar" (id, campos),
+        "alterar" (id, funcao: read-modify-write atômico; `funcao(registro)`
+        recebe o registro atual e retorna os campos a atualizar, ou None
+        para não mudar nada; não deve levantar exceção),
+        "substituir" (id, item: o registro inteiro, para quando campos deixam
+        de existir) ou "remover" (id,). Retorna, na mesma ordem, o registro
+        inserido/atualizado/removido (None se o id não existe).
+        """
+        self._garantir_carregado()
+        with self._lock, self.trava.exclusiva():
+            # Ids e registros atuais: primeiro o que outros processos gravaram
+            mudancas = self._acompanhar()
+            entradas, retornos = [], []
+            for op, args in operacoes:
+                entrada, retorno = self._preparar(op, args)
+                if entrada is not None:
+                    anterior = self._itens[args[0]] if op in ("atualizar", "alterar", "substituir") else retorno
+                    self._aplicar(entrada)
+                    if op in ("atualizar", "alterar"):
+                        retorno = self._itens[args[0]]
+                    entradas.append(entrada)
+                    mudancas.append(_mudanca(entrada["op"], anterior, retorno))
+                retornos.append(retorno)
+            self._gravar(entradas)
+            self._publicar(mudancas)
+            return retornos
+
+    def observar(self, callback: Callable[[str, Optional[dict], Optional[dict]], None]):
+        """Registrar `callback(op, anterior, atual)`, chamado após cada commit
+
+        `anterior` é None em inserções e `atual` é None em remoções. Os
+        callbacks rodam na thread escritora: devem ser rápidos e não podem
+        modificar os registros recebidos.
+        """
+        self._observadores.append(callback)
+
+    @property
+    def versao(self) -> str:
+        """Muda a cada commit com alterações, deste ou de outro processo, e é
+        igual em todos os processos que viram os mesmos commits (caches de
+        leitura e ETags comparam a versão)"""
+        self.sincronizar()
+        return self._versao
+
+    def compactar(self):
+        """Gravar um novo snapshot e começar um journal novo"""
+        self._garantir_carregado()
+        with self._lock, self.trava.exclusiva(), medir_etapa("json_compactacao"):
+            self._publicar(self._acompanhar())
+            data = {self.nome: list(self._itens.values()), "id_counter": self._id_counter}
+            self._substituir_arquivo(
+                self.snapshot_path, json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            )
+            # Journal novo por rename (e não truncando o atual): outro processo
+            # ainda pode ler o fim do antigo pelo descritor aberto
+            geracao = self._geracao + 1
+            self._substituir_arquivo(self.journal_path, (json.dumps({"op": "geracao", "n": geracao}) + "\n").encode())
+            self._abrir_journal()
+            self._ler_novas()
+
+    @staticmethod
+    def _substituir_arquivo(caminho: str, dados: bytes):
+        tmp_path = caminho + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, caminho)
+
+    def inserir(self, item: dict) -> dict:
+        """Inserir um registro, atribuindo o próximo id"""
+        return self.aplicar_lote([("inserir", (item,))])[0]
+
+    def atualizar(self, item_id: int, campos: dict) -> Optional[dict]:
+        """Atualizar campos de um registro; retorna None se não existir"""
+        return self.aplicar_lote([("atualizar", (item_id, campos))])[0]
+
+    def remover(self, item_id: int) -> Optional[dict]:
+        """Remover um registro; retorna o registro removido ou None"""
+        return self.aplicar_lote([("remover", (item_id,))])[0]
+
+    # ===== LEITURA =====
+    # Os dicts retornados são os próprios registros em memória: não modificar,
+    # usar atualizar() para alterar.
+    def obter(self, item_id: int) -> Optional[dict]:
+        """Obter um registro pelo id em O(1)"""
+        self.sincronizar()
+        return self._itens.get(item_id)
+
+    def listar(self) -> List[dict]:
+        """Listar todos os registros em ordem de id"""
+        self.sincronizar()
+        with self._lock:
+            # O dict segue a ordem de chegada ("restaurar" traz ids antigos
+            # depois dos novos); a ordem de id vem do índice ordenado
+            return [self._itens[i] for i in self._ordenados["id"]]
+
+    def filtrar(self, **criterios) -> List[dict]:
+        """Listar registros cujos campos são iguais aos critérios
+
+        Campos indexados são resolvidos pelo índice secundário; os demais
+        critérios são verificados apenas sobre os candidatos.
+        """
+        self.sincronizar()
+        with self._lock:
+            indexados = [c for c in criterios if c in self._indices]
+            if indexados:
+                conjuntos = [self._indices[c].get(criterios[c], {}) for c in indexados]
+                ids = min(conjuntos, key=len)
+                candidatos = [
+                    self._itens[i] for i in sorted(ids)
+                    if all(i in outro for outro in conjuntos if outro is not ids)
+                ]
+            else:
+                candidatos = (self._itens[i] for i in self._ordenados["id"])
+            resto = [c for c in criterios if c not in self._indices]
+            return [
+                item for item in candidatos
+                if all(item.get(c) == criterios[c] for c in resto)
+            ]
+
+    def paginar(
+        self,
+        limite: Optional[int] = None,
+        depois: Optional[tuple] = None,
+        ordem: str = "id",
+        decrescente: bool = False,
+        intervalos: Optional[Dict[str, tuple]] = None,
+        **criterios
+    ) -> List[dict]:
+        """Uma página de registros em ordem de (`ordem`, id)
+
+        - **depois**: (valor de `ordem`, id) do último registro da página
+          anterior; a página começa logo após ele
+        - **intervalos**: {campo: (mínimo, máximo)}, inclusivos, None = aberto
+        - **criterios**: igualdade, como em filtrar()
+
+        Percorre o índice ordenado a partir do cursor (busca binária) e para
+        ao completar a página; com um critério indexado seletivo, ordena só os
+        candidatos do índice secundário.
+        """
+        if ordem != "id" and ordem not in self.ordenacoes:
+            raise ValueError(f"Campo sem índice ordenado: {ordem}")
+        intervalos = {c: v for c, v in (intervalos or {}).items() if v != (None, None)}
+        self.sincronizar()
+        with self._lock:
+            indexados = [c for c in criterios if c in self._indices]
+            if indexados:
+                conjuntos = [self._indices[c].get(criterios[c], {}) for c in indexados]
+                ids = min(conjuntos, key=len)
+                if len(ids) * PAGINAR_FRACAO_SCAN > len(self._itens):
+                    # Critério pouco seletivo: sai mais barato percorrer o
+                    # índice ordenado filtrando do que ordenar os candidatos
+                    indexados = []
+            if indexados:
+                entradas = sorted(
+                    i if ordem == "id" else (chave_ordem(self._itens[i].get(ordem)), i)
+                    for i in ids if all(i in outro for outro in conjuntos if outro is not ids)
+                )
+            else:
+                entradas = self._ordenados[ordem]
+
+            # Faixa de posições: intervalo no próprio campo de ordem e cursor
+            inicio, fim = 0, len(entradas)
+            minimo, maximo = intervalos.pop(ordem, (None, None))
+            if minimo is not None:
+                inicio = bisect_left(entradas, minimo if ordem == "id" else (chave_ordem(minimo),))
+            if maximo is not None:
+                fim = bisect_right(entradas, maximo if ordem == "id" else (chave_ordem(maximo), float("inf")))
+            if depois is not None:
+                alvo = depois[1] if ordem == "id" else (chave_ordem(depois[0]), depois[1])
+                if decrescente:
+                    fim = min(fim, bisect_left(entradas, alvo))
+                else:
+                    inicio = max(inicio, bisect_right(entradas, alvo))
+            posicoes = range(fim - 1, inicio - 1, -1) if decrescente else range(inicio, fim)
+
+            resto = [c for c in criterios if c not in indexados]
+            pagina = []
+            for posicao in posicoes:
+                entrada = entradas[posicao]
+                item = self._itens[entrada if ordem == "id" else entrada[1]]
+                if any(item.get(c) != criterios[c] for c in resto):
+                    continue
+                if any(
+                    item.get(c) is None
+                    or (de is not None and item[c] < de)
+                    or (ate is not None and item[c] > ate)
+                    for c, (de, ate) in intervalos.items()
+                ):
+                    continue
+                pagina.append(item)
+                if limite is not None and len(pagina) >= limite:
+                    break
+            return pagina
+
+    @property
+    def proximo_id(self) -> int:
+        """Id que será atribuído ao próximo registro inserido"""
+        self.sincronizar()
+        return self._id_counter
+
+    def __len__(self) -> int:
+        self.sincronizar()
+        return len(self._itens)
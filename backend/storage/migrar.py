@@ -0,0 +1,33 @@
+"""
+Migração única dos arquivos data/*.json para o SQLite
+
+Uso (a partir de backend/):
+    python -m storage.migrar
+
+Lê cada coleção no formato JSON (snapshot + journal) e grava no banco em
+DATABASE_URL preservando os ids. Coleções que já têm registros no banco
+são ignoradas, para que a migração possa ser reexecutada com segurança.
+"""
+
+from storage import DATA_DIR, DATABASE_URL, INDICES, ORDENACOES
+from storage.journal import ColecaoJournal
+from storage.sqlite import ColecaoSQLite
+
+
+def migrar_json_para_sqlite(diretorio: str = DATA_DIR, database_url: str = DATABASE_URL) -> dict:
+    """Copiar todas as coleções JSON para o SQLite; retorna o total por coleção"""
+    totais = {}
+    for nome, indices in INDICES.items():
+        origem = ColecaoJournal(nome, diretorio=diretorio)
+        destino = ColecaoSQLite(nome, database_url, indices=indices, ordenacoes=ORDENACOES[nome])
+        if len(destino) > 0:
+            print(f"{nome}: já existem registros no banco, ignorando")
+            totais[nome] = 0
+            continue
+        totais[nome] = destino.importar(origem.listar(), proximo_id=origem.proximo_id)
+        print(f"{nome}: {totais[nome]} registros migrados")
+    return totais
+
+
+if __name__ == "__main__":
+    migrar_json_para_sqlite()
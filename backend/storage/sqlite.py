@@ -0,0 +1,585 @@
+"""
+Coleção persistida em SQLite (via SQLAlchemy)
+
+Cada coleção vira uma tabela com o registro em JSON na coluna `dados`
+e uma coluna extra, com índice, para cada campo em `indices` e em
+`ordenacoes` (estes também com índices compostos (campo, ordenação) para
+a paginação filtrada).
+O banco roda em modo WAL e as conexões vêm do pool do engine.
+
+Com vários processos (workers do uvicorn), o banco já é compartilhado e as
+transações do SQLite serializam as escritas; o que fica por processo são os
+observadores. A versão de cada coleção (usada nos ETags) fica no próprio
+banco, na tabela _versoes, e é incrementada na transação de cada commit: é a
+mesma em todos os processos e não recomeça num restart. Nesse modo cada commit também grava as mudanças na
+tabela _mudancas, e cada processo, antes das leituras, confere o
+`PRAGMA data_version` (muda quando outra conexão faz commit) e entrega aos
+seus observadores as mudanças gravadas pelos outros.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+from storage.journal import notificar_observadores
+from utils_metricas import medir_etapa
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", 5))
+# Por quanto tempo as mudanças ficam em _mudancas para os outros processos
+MUDANCAS_RETENCAO_S = float(os.getenv("SQLITE_MUDANCAS_RETENCAO_S", 86400))
+# A cada quantos commits um processo apaga as mudanças vencidas
+MUDANCAS_LIMPAR_A_CADA = 1000
+
+# Identifica as mudanças gravadas por este processo (não são reentregues a ele)
+PROCESSO = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+# Uma conexão por banco, fora do pool, só para o PRAGMA data_version
+_vigias: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+
+
+def _configurar_conexao(dbapi_connection, connection_record):
+    """PRAGMAs aplicados em toda conexão nova do pool"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def obter_engine(database_url: str) -> Engine:
+    """Criar (uma única vez por URL) o engine SQLite com pool de conexões"""
+    with _engines_lock:
+        engine = _engines.get(database_url)
+        if engine is None:
+            caminho = database_url.split("sqlite:///", 1)[-1]
+            diretorio = os.path.dirname(caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            engine = create_engine(
+                database_url,
+                pool_size=SQLITE_POOL_SIZE,
+                pool_pre_ping=True,
+                connect_args={"check_same_thread": False}
+            )
+            event.listen(engine, "connect", _configurar_conexao)
+            _engines[database_url] = engine
+        return engine
+
+
+def _vigia(database_url: str) -> Tuple[sqlite3.Connection, threading.Lock]:
+    with _engines_lock:
+        vigia = _vigias.get(database_url)
+        if vigia is None:
+            caminho = database_url.split("sqlite:///", 1)[-1]
+            vigia = _vigias[database_url] = (sqlite3.connect(caminho, check_same_thread=False), threading.Lock())
+        return vigia
+
+
+def _dumps(item: dict) -> str:
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+
+
+class ColecaoSQLite:
+    """Coleção de registros com a mesma interface de ColecaoJournal"""
+
+    def __init__(
+        self,
+        nome: str,
+        database_url: str,
+        indices: Iterable[str] = (),
+        ordenacoes: Iterable[str] = (),
+        multiprocesso: bool = False
+    ):
+        self.nome = nome
+        self.database_url = database_url
+        self.multiprocesso = multiprocesso
+        self.indices = tuple(indices)
+        self.ordenacoes = tuple(ordenacoes)
+        # Colunas extras da tabela (cada campo uma vez)
+        self.colunas = tuple(dict.fromkeys(self.indices + self.ordenacoes))
+        self._engine: Optional[Engine] = None
+        self._lock = threading.Lock()
+        self._observadores: List[Callable] = []
+        self._versao = ""
+        # Serializa a entrega de mudanças (commits deste processo e dos outros)
+        self._lock_mudancas = threading.RLock()
+        # Modo multiprocesso: última mudança vista e último data_version
+        self._ultima_mudanca = 0
+        self._data_version = None
+        self._commits = 0
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = obter_engine(self.database_url)
+                    self._criar_tabela(engine)
+                    if self.multiprocesso:
+                        self._criar_mudancas(engine)
+                    self._engine = engine
+        return self._engine
+
+    def _criar_tabela(self, engine: Engine):
+        colunas = "".join(f", {campo}" for campo in self.colunas)
+        with engine.begin() as conn:
+            # Outro worker pode estar criando/alterando a mesma tabela agora
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.nome} ("
+                f"id INTEGER PRIMARY KEY AUTOINCREMENT, dados TEXT NOT NULL{colunas})"
+            ))
+            # Campos indexados adicionados depois da criação da tabela
+            existentes = {linha[1] for linha in conn.execute(text(f"PRAGMA table_info({self.nome})"))}
+            for campo in self.colunas:
+                if campo not in existentes:
+                    conn.execute(text(f"ALTER TABLE {self.nome} ADD COLUMN {campo}"))
+                    conn.execute(text(
+                        f"UPDATE {self.nome} SET {campo} = json_extract(dados, '$.{campo}')"
+                    ))
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{self.nome}_{campo} ON {self.nome} ({campo})"
+                ))
+            # Versão compartilhada; o id aleatório distingue um banco recriado
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS _versoes "
+                "(colecao TEXT PRIMARY KEY, versao INTEGER NOT NULL, instancia TEXT NOT NULL)"
+            ))
+            conn.execute(
+                text("INSERT OR IGNORE INTO _versoes (colecao, versao, instancia) VALUES (:colecao, 0, :instancia)"),
+                {"colecao": self.nome, "instancia": uuid.uuid4().hex[:12]}
+            )
+            self._versao = self._ler_versao(conn)
+            # Filtro por igualdade + ordenação: a página sai direto do índice
+            for campo in self.indices:
+                for ordem in self.ordenacoes:
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{self.nome}_{campo}_{ordem} "
+                        f"ON {self.nome} ({campo}, {ordem})"
+                    ))
+
+    def _ler_versao(self, conn) -> str:
+        instancia, versao = conn.execute(
+            text("SELECT instancia, versao FROM _versoes WHERE colecao = :colecao"), {"colecao": self.nome}
+        ).one()
+        return f"{instancia}.{versao}"
+
+    def _incrementar_versao(self, conn) -> str:
+        """Nova versão da coleção, dentro da transação do commit"""
+        conn.execute(
+            text("UPDATE _versoes SET versao = versao + 1 WHERE colecao = :colecao"), {"colecao": self.nome}
+        )
+        return self._ler_versao(conn)
+
+    def _criar_mudancas(self, engine: Engine):
+        with engine.begin() as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS _mudancas (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "colecao TEXT NOT NULL, processo TEXT NOT NULL, op TEXT NOT NULL, "
+                "anterior TEXT, atual TEXT, criado_em REAL NOT NULL)"
+            ))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix__mudancas_colecao ON _mudancas (colecao, seq)"))
+            # O estado atual já está nas tabelas: acompanhar só o que vier depois
+            self._ultima_mudanca = conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM _mudancas")).scalar_one()
+
+    def _registrar_mudancas(self, conn, mudancas: List[tuple]):
+        agora = time.time()
+        conn.execute(
+            text(
+                "INSERT INTO _mudancas (colecao, processo, op, anterior, atual, criado_em) "
+                "VALUES (:colecao, :processo, :op, :anterior, :atual, :criado_em)"
+            ),
+            [
+                {
+                    "colecao": self.nome, "processo": PROCESSO, "op": op,
+                    "anterior": None if anterior is None else _dumps(anterior),
+                    "atual": None if atual is None else _dumps(atual),
+                    "criado_em": agora,
+                }
+                for op, anterior, atual in mudancas
+            ]
+        )
+        self._commits += 1
+        if self._commits % MUDANCAS_LIMPAR_A_CADA == 0:
+            conn.execute(
+                text("DELETE FROM _mudancas WHERE criado_em < :limite"),
+                {"limite": agora - MUDANCAS_RETENCAO_S}
+            )
+
+    def sincronizar(self):
+        """Entregar aos observadores as mudanças gravadas por outros processos
+
+        Sem commits de outras conexões custa só um PRAGMA data_version.
+        """
+        if not self.multiprocesso:
+            return
+        engine = self.engine
+        conexao, lock = _vigia(self.database_url)
+        with lock:
+            data_version = conexao.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        with self._lock_mudancas:
+            with engine.connect() as conn:
+                # A versão antes das mudanças: nunca à frente do que os observadores viram
+                versao = self._ler_versao(conn)
+                mudancas = self._mudancas_de_outros(conn)
+            self._data_version = data_version
+            notificar_observadores(self._observadores, mudancas)
+            self._versao = versao
+
+    def _mudancas_de_outros(self, conn) -> List[tuple]:
+        """Mudanças gravadas por outros processos ainda não entregues (com _lock_mudancas)"""
+        linhas = conn.execute(
+            text(
+                "SELECT seq, processo, op, anterior, atual FROM _mudancas "
+                "WHERE colecao = :colecao AND seq > :ultima ORDER BY seq"
+            ),
+            {"colecao": self.nome, "ultima": self._ultima_mudanca}
+        ).all()
+        if linhas:
+            self._ultima_mudanca = linhas[-1][0]
+        return [
+            (op, anterior and json.loads(anterior), atual and json.loads(atual))
+            for seq, processo, op, anterior, atual in linhas if processo != PROCESSO
+        ]
+
+    @property
+    def versao(self) -> str:
+        """Muda a cada commit com alterações, deste ou de outro processo, e é
+        igual em todos os processos (caches de leitura e ETags comparam a versão)"""
+        self.engine  # cria a tabela e lê a versão na primeira chamada
+        self.sincronizar()
+        return self._versao
+
+    def _valores_indices(self, item: dict) -> dict:
+        return {campo: item.get(campo) for campo in self.colunas}
+
+    @staticmethod
+    def _item(linha) -> dict:
+        """Montar o registro a partir de (id, dados)"""
+        return {"id": linha[0], **json.loads(linha[1])}
+
+    # ===== ESCRITA =====
+    # A coluna `dados` guarda o registro sem o id, que vem da chave primária.
+    def _inserir(self, conn, item: dict) -> dict:
+        dados = {k: v for k, v in item.items() if k != "id"}
+        valores = {"dados": _dumps(dados), **self._valores_indices(item)}
+        if "id" in item:
+            valores["id"] = item["id"]
+        colunas = ", ".join(valores)
+        params = ", ".join(f":{c}" for c in valores)
+        novo_id = conn.execute(
+            text(f"INSERT INTO {self.nome} ({colunas}) VALUES ({params})"), valores
+        ).lastrowid
+        return {"id": novo_id, **dados}
+
+    def _atualizar(self, conn, item_id: int, campos: dict) -> Optional[Tuple[dict, dict]]:
+        """Retorna (anterior, atualizado), ou None se o registro não existir"""
+        linha = conn.execute(
+            text(f"SELECT id, dados FROM {self.nome} WHERE id = :id"), {"id": item_id}
+        ).first()
+        if linha is None:
+            return None
+        anterior = self._item(linha)
+        item = {**anterior, **{k: v for k, v in campos.items() if k != "id"}}
+        sets = "".join(f", {campo} = :{campo}" for campo in self.colunas)
+        conn.execute(
+            text(f"UPDATE {self.nome} SET dados = :dados{sets} WHERE id = :id"),
+            {
+                "id": item_id,
+                "dados": _dumps({k: v for k, v in item.items() if k != "id"}),
+                **self._valores_indices(item)
+            }
+        )
+        return anterior, item
+
+    def _alterar(self, conn, item_id: int, funcao) -> Optional[Tuple[dict, dict]]:
+        """Read-modify-write na transação; (anterior, atual), iguais se `funcao` não mudou nada"""
+        linha = conn.execute(
+            text(f"SELECT id, dados FROM {self.nome} WHERE id = :id"), {"id": item_id}
+        ).first()
+        if linha is None:
+            return None
+        anterior = self._item(linha)
+        campos = funcao(anterior)
+        if not campos:
+            return anterior, anterior
+        return self._atualizar(conn, item_id, campos)
+
+    def _substituir(self, conn, item_id: int, item: dict) -> Optional[Tuple[dict, dict]]:
+        """Trocar o registro inteiro; retorna (anterior, novo) ou None"""
+        linha = conn.execute(
+            text(f"SELECT id, dados FROM {self.nome} WHERE id = :id"), {"id": item_id}
+        ).first()
+        if linha is None:
+            return None
+        novo = {**item, "id": item_id}
+        sets = "".join(f", {campo} = :{campo}" for campo in self.colunas)
+        conn.execute(
+            text(f"UPDATE {self.nome} SET dados = :dados{sets} WHERE id = :id"),
+            {
+                "id": item_id,
+                "dados": _dumps({k: v for k, v in novo.items() if k != "id"}),
+                **self._valores_indices(novo)
+            }
+        )
+        return self._item(linha), novo
+
+    def _remover(self, conn, item_id: int) -> Optional[dict]:
+        linha = conn.execute(
+            text(f"SELECT id, dados FROM {self.nome} WHERE id = :id"), {"id": item_id}
+        ).first()
+        if linha is None:
+            return None
+        conn.execute(text(f"DELETE FROM {self.nome} WHERE id = :id"), {"id": item_id})
+        return self._item(linha)
+
+    def aplicar_lote(self, operacoes: List[Tuple[str, tuple]]) -> List[Optional[dict]]:
+        """Aplicar várias operações em uma única transação (um commit)"""
+        engine = self.engine
+        with self._lock_mudancas:
+            ultima_mudanca = self._ultima_mudanca
+            try:
+                retornos, mudancas, versao = self._transacao(engine, operacoes)
+            except Exception:
+                # Rollback: as mudanças de outros processos lidas na transação voltam a ser pendentes
+                self._ultima_mudanca = ultima_mudanca
+                raise
+            notificar_observadores(self._observadores, mudancas)
+            # Depois dos observadores: quem vê a versão nova vê os derivados atualizados
+            if mudancas:
+                self._versao = versao
+        return retornos
+
+    def _transacao(self, engine: Engine, operacoes: List[Tuple[str, tuple]]) -> Tuple[list, List[tuple], str]:
+        executores = {
+            "inserir": self._inserir_novo,
+            "restaurar": self._restaurar,
+            "atualizar": self._atualizar,
+            "alterar": self._alterar,
+            "substituir": self._substituir,
+            "remover": self._remover,
+        }
+        retornos = []
+        with medir_etapa("sqlite_gravacao"), engine.begin() as conn:
+            # Trava de escrita antes das leituras da transação: com outros
+            # processos escrevendo, o estado lido é o final e o commit não
+            # falha por snapshot desatualizado
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            # O que outros processos gravaram antes vai primeiro aos observadores
+            mudancas = self._mudancas_de_outros(conn) if self.multiprocesso else []
+            de_outros = len(mudancas)
+            for op, args in operacoes:
+                if op not in executores:
+                    raise ValueError(f"Operação desconhecida: {op}")
+                retorno = executores[op](conn, *args)
+                if op in ("atualizar", "alterar", "substituir") and retorno is not None:
+                    anterior, retorno = retorno
+                    if retorno is not anterior:
+                        mudancas.append(("atualizar" if op == "alterar" else op, anterior, retorno))
+                elif retorno is not None:
+                    mudancas.append(("inserir", None, retorno) if op in ("inserir", "restaurar") else (op, retorno, None))
+                retornos.append(retorno)
+            if len(mudancas) > de_outros:
+                versao = self._incrementar_versao(conn)
+                if self.multiprocesso:
+                    self._registrar_mudancas(conn, mudancas[de_outros:])
+            else:
+                versao = self._ler_versao(conn)
+        return retornos, mudancas, versao
+
+    def observar(self, callback: Callable[[str, Optional[dict], Optional[dict]], None]):
+        """Registrar `callback(op, anterior, atual)`, chamado após cada commit"""
+        self._observadores.append(callback)
+
+    def _inserir_novo(self, conn, item: dict) -> dict:
+        return self._inserir(conn, {k: v for k, v in item.items() if k != "id"})
+
+    def _restaurar(self, conn, item: dict) -> Optional[dict]:
+        """Inserir mantendo o id (volta do arquivo); None se o id já existe"""
+        existe = conn.execute(
+            text(f"SELECT 1 FROM {self.nome} WHERE id = :id"), {"id": item["id"]}
+        ).first()
+        return None if existe else self._inserir(conn, item)
+
+    def inserir(self, item: dict) -> dict:
+        """Inserir um registro, atribuindo o próximo id"""
+        return self.aplicar_lote([("inserir", (item,))])[0]
+
+    def importar(self, itens: Iterable[dict], proximo_id: int = 1) -> int:
+        """Inserir registros preservando seus ids (usado pelo migrador)
+
+        `proximo_id` garante que ids já usados (e depois removidos) na origem
+        não sejam reaproveitados.
+        """
+        total = 0
+        with self.engine.begin() as conn:
+            for item in itens:
+                self._inserir(conn, item)
+                total += 1
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :nome"), {"nome": self.nome})
+            conn.execute(
+                text("INSERT INTO sqlite_sequence (name, seq) VALUES (:nome, :seq)"),
+                {
+                    "nome": self.nome,
+                    "seq": max(proximo_id - 1, conn.execute(
+                        text(f"SELECT COALESCE(MAX(id), 0) FROM {self.nome}")
+                    ).scalar_one())
+                }
+            )
+            versao = self._incrementar_versao(conn)
+        if total:
+            self._versao = versao
+        return total
+
+    def atualizar(self, item_id: int, campos: dict) -> Optional[dict]:
+        """Atualizar campos de um registro; retorna None se não existir"""
+        return self.aplicar_lote([("atualizar", (item_id, campos))])[0]
+
+    def remover(self, item_id: int) -> Optional[dict]:
+        """Remover um registro; retorna o registro removido ou None"""
+        return self.aplicar_lote([("remover", (item_id,))])[0]
+
+    def compactar(self):
+        """Checkpoint do WAL no arquivo principal do banco"""
+        with self.engine.begin() as conn:
+            if self.multiprocesso:
+                conn.execute(
+                    text("DELETE FROM _mudancas WHERE criado_em < :limite"),
+                    {"limite": time.time() - MUDANCAS_RETENCAO_S}
+                )
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+    # ===== LEITURA =====
+    def obter(self, item_id: int) -> Optional[dict]:
+        """Obter um registro pela chave primária"""
+        self.sincronizar()
+        with self.engine.connect() as conn:
+            linha = conn.execute(
+                text(f"SELECT id, dados FROM {self.nome} WHERE id = :id"), {"id": item_id}
+            ).first()
+        return self._item(linha) if linha else None
+
+    def listar(self) -> List[dict]:
+        """Listar todos os registros em ordem de id"""
+        self.sincronizar()
+        with self.engine.connect() as conn:
+            linhas = conn.execute(text(f"SELECT id, dados FROM {self.nome} ORDER BY id")).all()
+        return [self._item(linha) for linha in linhas]
+
+    def filtrar(self, **criterios) -> List[dict]:
+        """Listar registros cujos campos são iguais aos critérios
+
+        Campos indexados viram cláusulas WHERE (usando os índices da tabela);
+        os demais critérios são verificados em Python sobre o resultado.
+        """
+        self.sincronizar()
+        indexados = {c: v for c, v in criterios.items() if c in self.colunas}
+        # None casa com campo nulo ou ausente, como no ColecaoJournal
+        where = " AND ".join(
+            f"{c} IS NULL" if v is None else f"{c} = :{c}" for c, v in indexados.items()
+        ) or "1 = 1"
+        with self.engine.connect() as conn:
+            linhas = conn.execute(
+                text(f"SELECT id, dados FROM {self.nome} WHERE {where} ORDER BY id"),
+                {c: v for c, v in indexados.items() if v is not None}
+            ).all()
+        itens = [self._item(linha) for linha in linhas]
+        resto = [c for c in criterios if c not in indexados]
+        return [
+            item for item in itens
+            if all(item.get(c) == criterios[c] for c in resto)
+        ]
+
+    def paginar(
+        self,
+        limite: Optional[int] = None,
+        depois: Optional[tuple] = None,
+        ordem: str = "id",
+        decrescente: bool = False,
+        intervalos: Optional[Dict[str, tuple]] = None,
+        **criterios
+    ) -> List[dict]:
+        """Uma página de registros em ordem de (`ordem`, id); ver ColecaoJournal.paginar
+
+        Tudo vira SQL (keyset: WHERE (ordem, id) > cursor ... LIMIT), então o
+        banco lê só a página pelos índices. Campos sem coluna própria são
+        comparados com json_extract.
+        """
+        if ordem != "id" and ordem not in self.ordenacoes:
+            raise ValueError(f"Campo sem índice ordenado: {ordem}")
+        self.sincronizar()
+
+        def expressao(campo: str) -> str:
+            if campo == "id" or campo in self.colunas:
+                return campo
+            if not campo.isidentifier():
+                raise ValueError(f"Campo inválido: {campo}")
+            return f"json_extract(dados, '$.{campo}')"
+
+        condicoes, params = [], {}
+        for i, (campo, valor) in enumerate(criterios.items()):
+            if valor is None:
+                condicoes.append(f"{expressao(campo)} IS NULL")
+            else:
+                condicoes.append(f"{expressao(campo)} = :c{i}")
+                params[f"c{i}"] = valor
+        for i, (campo, (minimo, maximo)) in enumerate((intervalos or {}).items()):
+            if minimo is not None:
+                condicoes.append(f"{expressao(campo)} >= :min{i}")
+                params[f"min{i}"] = minimo
+            if maximo is not None:
+                condicoes.append(f"{expressao(campo)} <= :max{i}")
+                params[f"max{i}"] = maximo
+        if depois is not None:
+            condicoes.append(self._depois(ordem, depois[0], decrescente))
+            if ordem != "id" and depois[0] is not None:
+                params["depois_valor"] = depois[0]
+            params["depois_id"] = depois[1]
+
+        direcao = "DESC" if decrescente else "ASC"
+        ordenacao = f"id {direcao}" if ordem == "id" else f"{ordem} {direcao}, id {direcao}"
+        sql = f"SELECT id, dados FROM {self.nome} WHERE {' AND '.join(condicoes) or '1 = 1'} ORDER BY {ordenacao}"
+        if limite is not None:
+            sql += " LIMIT :limite"
+            params["limite"] = limite
+        with self.engine.connect() as conn:
+            linhas = conn.execute(text(sql), params).all()
+        return [self._item(linha) for linha in linhas]
+
+    @staticmethod
+    def _depois(ordem: str, valor, decrescente: bool) -> str:
+        """Condição keyset "(ordem, id) depois do cursor"
+
+        No SQLite, NULL vem antes de qualquer valor em ORDER BY ASC (como
+        chave_ordem no ColecaoJournal), mas não se compara com = / < / >:
+        um cursor nulo e os registros nulos numa ordem decrescente precisam
+        de IS NULL.
+        """
+        comparacao = "<" if decrescente else ">"
+        if ordem == "id":
+            return f"id {comparacao} :depois_id"
+        if valor is None:
+            if decrescente:
+                return f"({ordem} IS NULL AND id < :depois_id)"
+            return f"({ordem} IS NOT NULL OR id > :depois_id)"
+        condicao = f"{ordem} {comparacao} :depois_valor OR ({ordem} = :depois_valor AND id {comparacao} :depois_id)"
+        if decrescente:
+            condicao += f" OR {ordem} IS NULL"
+        return f"({condicao})"
+
+    def __len__(self) -> int:
+        self.sincronizar()
+        with self.engine.connect() as conn:
+            return conn.execute(text(f"SELECT COUNT(*) FROM {self.nome}")).scalar_one()
@@ -0,0 +1,79 @@
+"""
+Trava entre processos (flock) sobre um arquivo .lock
+
+Com vários workers do uvicorn, cada um tem suas coleções em memória sobre os
+mesmos arquivos em data/: as escritas (e a compactação) de uma coleção
+acontecem com a trava exclusiva, a carga e o acompanhamento das escritas dos
+outros processos com a compartilhada. A trava é do processo: entre as
+threads de um mesmo processo quem serializa é o lock da coleção, que deve
+ser adquirido antes (um bloco aninhado em outro herda a trava de fora, sem
+trocar o modo).
+
+Sem fcntl (Windows) a trava não faz nada: lá só um processo é suportado.
+"""
+
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # sem flock: modo de um processo só
+    fcntl = None
+
+
+class TravaArquivo:
+    """flock exclusivo/compartilhado em `caminho` (criado se não existe)"""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._fd = None
+        # Blocos aninhados (ex: compactação dentro de uma escrita) não
+        # soltam a trava do bloco de fora
+        self._nivel = 0
+
+    def _abrir(self) -> int:
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            self._fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    @contextmanager
+    def exclusiva(self):
+        """Bloco com a trava exclusiva (espera os outros processos)"""
+        with self._travada(fcntl.LOCK_EX if fcntl else None):
+            yield
+
+    @contextmanager
+    def compartilhada(self):
+        """Bloco com a trava compartilhada (só exclui quem tem a exclusiva)"""
+        with self._travada(fcntl.LOCK_SH if fcntl else None):
+            yield
+
+    @contextmanager
+    def _travada(self, modo):
+        if fcntl is None or self._nivel:
+            self._nivel += 1
+            try:
+                yield
+            finally:
+                self._nivel -= 1
+            return
+        fd = self._abrir()
+        fcntl.flock(fd, modo)
+        self._nivel = 1
+        try:
+            yield
+        finally:
+            self._nivel = 0
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def tentar_exclusiva(self) -> bool:
+        """Tentar a trava exclusiva sem esperar; se conseguir, ela fica com o
+        processo até ele terminar (usada para eleger um worker)"""
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._abrir(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
@@ -0,0 +1,79 @@
+"""
+Configuração comum dos testes
+
+O storage cria as coleções na importação, com caminhos relativos ao
+diretório atual (data/, gabaritos_gerados/): antes de qualquer import do
+backend, os testes passam a rodar em um diretório temporário, com o backend
+JSON. Testes de uma coleção isolada criam a própria em `tmp_path`; os testes
+da API compartilham o app (fixture `cliente`) e criam gabaritos novos.
+
+    cd backend
+    python -m pytest -q
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ["STORAGE_BACKEND"] = "json"
+os.environ.setdefault("OMR_WORKERS", "2")
+os.chdir(tempfile.mkdtemp(prefix="testify-testes-"))
+
+
+@pytest.fixture(scope="session")
+def cliente():
+    """TestClient do app, com o lifespan (filas e pools) rodando"""
+    from fastapi.testclient import TestClient
+
+    import main
+    with TestClient(main.app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def criar_gabarito(cliente):
+    """Criar um gabarito pela API; retorna o registro"""
+    def criar(num_questoes: int = 10, alternativas: str = "ABCD", respostas_corretas=None, titulo: str = "Prova"):
+        if respostas_corretas is None:
+            respostas_corretas = [alternativas[q % len(alternativas)] for q in range(num_questoes)]
+        resposta = cliente.post("/api/gabaritos/", json={
+            "titulo": titulo,
+            "num_questoes": num_questoes,
+            "alternativas": list(alternativas),
+            "respostas_corretas": list(respostas_corretas),
+        })
+        assert resposta.status_code == 200, resposta.text
+        return resposta.json()
+    return criar
+
+
+@pytest.fixture
+def folha_preenchida():
+    """Foto (JPEG) da folha de um gabarito com as alternativas marcadas
+
+    `respostas` traz, por questão, as alternativas a pintar ("" = em branco).
+    """
+    from PIL import Image, ImageDraw
+
+    import storage
+
+    def preencher(gabarito_id: int, respostas) -> bytes:
+        gabarito = storage.gabaritos.obter(gabarito_id)
+        with open(gabarito["layout_path"], encoding="utf-8") as f:
+            bolhas = json.load(f)["bubbles"]
+        imagem = Image.open(gabarito["png_path"]).convert("L")
+        desenho = ImageDraw.Draw(imagem)
+        for questao, marcadas in enumerate(respostas):
+            for alternativa in marcadas:
+                x, y = bolhas[questao][gabarito["alternativas"].index(alternativa)]
+                desenho.ellipse([x - 8, y - 8, x + 8, y + 8], fill=0)
+        saida = io.BytesIO()
+        imagem.save(saida, "JPEG")
+        return saida.getvalue()
+    return preencher
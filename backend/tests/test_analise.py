@@ -0,0 +1,47 @@
+"""
+Análise de itens vetorizada (dificuldade, discriminação, KR-20, distratores)
+"""
+
+import math
+
+import numpy as np
+
+from utils_analise import analisar_itens, matriz_respostas
+
+ALTERNATIVAS = list("ABCD")
+
+
+def test_matriz_codifica_branco_invalida_e_completa_linhas_curtas():
+    matriz = matriz_respostas([["A", "", "*", "D"], ["B"]], ALTERNATIVAS, 4)
+    assert matriz.tolist() == [[0, -1, -2, 3], [1, -1, -1, -1]]
+
+
+def test_questoes_sem_chave_ficam_fora_das_notas():
+    # Chave mais curta que a prova: as duas últimas posições ficam em branco
+    chave = matriz_respostas([["A", "B"]], ALTERNATIVAS, 4)[0]
+    matriz = matriz_respostas([
+        ["A", "B", "", ""],
+        ["A", "C", "", ""],
+        ["C", "C", "A", ""],
+    ], ALTERNATIVAS, 4)
+
+    analise = analisar_itens(matriz, chave, len(ALTERNATIVAS))
+
+    assert analise["media"] == 1.0  # 2, 1 e 0 acertos: o branco não "acerta" o branco da chave
+    assert analise["dificuldade"][:2].tolist() == [2 / 3, 1 / 3]
+    for nome in ("dificuldade", "discriminacao", "ponto_bisserial"):
+        assert np.isnan(analise[nome][2:]).all()
+    assert analise["frequencias"][2].tolist() == [1, 0, 0, 0, 2, 0]
+
+
+def test_kr20_igual_ao_calculo_direto():
+    rng = np.random.default_rng(0)
+    matriz = rng.integers(0, 4, size=(60, 10)).astype(np.int8)
+    chave = np.zeros(10, dtype=np.int8)
+
+    analise = analisar_itens(matriz, chave, len(ALTERNATIVAS))
+
+    acertos = (matriz == 0).astype(float)
+    p = acertos.mean(axis=0)
+    esperado = 10 / 9 * (1 - (p * (1 - p)).sum() / acertos.sum(axis=1).var())
+    assert math.isclose(analise["kr20"], esperado)
@@ -0,0 +1,75 @@
+"""
+Cache de respostas GET: versões compartilhadas entre workers e ETag / 304
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from storage.journal import ColecaoJournal
+from storage.sqlite import ColecaoSQLite
+
+
+def abrir(backend: str, diretorio: str):
+    """Uma instância da coleção, como a de um worker (ou de um restart)"""
+    if backend == "json":
+        return ColecaoJournal("itens", diretorio=diretorio)
+    return ColecaoSQLite("itens", f"sqlite:///{diretorio}/itens.db", multiprocesso=True)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_versao_igual_entre_processos_e_depois_de_restart(tmp_path, backend):
+    diretorio = str(tmp_path / "dados")
+    worker_a, worker_b = abrir(backend, diretorio), abrir(backend, diretorio)
+    worker_a.inserir({"n": 1})
+    assert worker_b.versao == worker_a.versao
+
+    antes = worker_b.versao
+    worker_b.atualizar(1, {"n": 2})
+    assert worker_a.versao == worker_b.versao != antes
+    assert abrir(backend, diretorio).versao == worker_a.versao
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_versao_vista_por_outro_processo(tmp_path, backend):
+    diretorio = str(tmp_path / "dados")
+    colecao = abrir(backend, diretorio)
+    colecao.inserir({"n": 1})
+    codigo = (
+        "from tests.test_cache import abrir; import sys; "
+        "colecao = abrir(sys.argv[1], sys.argv[2]); colecao.inserir({'n': 2}); print(colecao.versao)"
+    )
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    versao_outro = subprocess.run(
+        [sys.executable, "-c", codigo, backend, diretorio],
+        cwd=backend_dir, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+    assert colecao.versao == versao_outro
+    assert len(colecao.listar()) == 2
+
+
+def test_versao_nao_se_repete_com_os_dados_recriados(tmp_path):
+    diretorio = str(tmp_path / "dados")
+    colecao = abrir("json", diretorio)
+    colecao.inserir({"n": 1})
+    versao = colecao.versao
+
+    shutil.rmtree(diretorio)
+    recriada = abrir("json", diretorio)
+    recriada.inserir({"n": 1})
+    assert recriada.versao != versao
+
+
+def test_etag_e_304(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=3)
+    url = f"/api/gabaritos/{gabarito['id']}"
+    etag = cliente.get(url).headers["etag"]
+
+    assert cliente.get(url, headers={"If-None-Match": etag}).status_code == 304
+    cliente.post(f"/api/gabaritos/{gabarito['id']}/encerrar")
+    resposta = cliente.get(url, headers={"If-None-Match": etag})
+    assert resposta.status_code == 200 and resposta.json()["encerrado_em"]
@@ -0,0 +1,72 @@
+"""
+FilaCommit: escritor único com group commit
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from storage.fila import FilaCommit
+from storage.journal import ColecaoJournal
+from storage.sqlite import ColecaoSQLite
+
+
+@pytest.fixture
+def colecao(tmp_path):
+    return ColecaoJournal("itens", diretorio=str(tmp_path), indices=("grupo",))
+
+
+def test_insercoes_concorrentes_recebem_ids_distintos(colecao):
+    fila = FilaCommit(janela_ms=2)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = [
+            executor.submit(lambda i=i: fila.submeter(colecao, "inserir", {"grupo": i % 3, "n": i}).result())
+            for i in range(300)
+        ]
+        inseridos = [future.result() for future in futures]
+
+    assert sorted(item["id"] for item in inseridos) == list(range(1, 301))
+    assert len(ColecaoJournal("itens", diretorio=colecao.diretorio)) == 300
+
+
+def test_lote_retorna_na_ordem_das_operacoes(colecao):
+    fila = FilaCommit()
+    a, b = fila.submeter_lote(colecao, [("inserir", ({"n": 1},)), ("inserir", ({"n": 2},))]).result()
+    retornos = fila.submeter_lote(colecao, [
+        ("atualizar", (b["id"], {"n": 20})),
+        ("remover", (a["id"],)),
+        ("atualizar", (999, {"n": 0})),
+    ]).result()
+
+    assert retornos[0] == {"id": b["id"], "n": 20}
+    assert retornos[1] == a
+    assert retornos[2] is None
+    assert colecao.listar() == [{"id": b["id"], "n": 20}]
+
+
+def test_erro_no_commit_chega_ao_future(colecao):
+    fila = FilaCommit()
+    with pytest.raises(ValueError):
+        fila.submeter(colecao, "desconhecida", 1).result()
+    # A thread escritora continua atendendo
+    assert fila.submeter(colecao, "inserir", {"n": 1}).result()["id"] == 1
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_alterar_parte_do_estado_gravado(tmp_path, backend):
+    if backend == "json":
+        colecao = ColecaoJournal("itens", diretorio=str(tmp_path))
+    else:
+        colecao = ColecaoSQLite("itens", f"sqlite:///{tmp_path}/itens.db")
+    fila = FilaCommit(janela_ms=20)
+    item = fila.submeter(colecao, "inserir", {"lista": []}).result()
+
+    def acrescentar(valor):
+        return lambda atual: {"lista": atual["lista"] + [valor]}
+    futures = [fila.submeter(colecao, "alterar", item["id"], acrescentar(i)) for i in range(50)]
+    futures.append(fila.submeter(colecao, "alterar", item["id"], lambda atual: None))
+    retornos = [future.result() for future in futures]
+
+    assert sorted(colecao.obter(item["id"])["lista"]) == list(range(50))
+    assert retornos[-1] == colecao.obter(item["id"])
+    assert fila.submeter(colecao, "alterar", 999, acrescentar(0)).result() is None
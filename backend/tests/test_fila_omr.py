@@ -0,0 +1,72 @@
+"""
+Fila de OMR: leitura no pool de processos, resultado automático e falhas
+"""
+
+import threading
+
+import storage
+import utils_fila_omr
+from utils_fila_omr import fila_omr
+
+TIMEOUT_S = 60
+
+
+def enviar(cliente, gabarito_id: int, imagem: bytes, nome: str = "Ana") -> dict:
+    resposta = cliente.post("/api/provas/", data={
+        "gabarito_id": gabarito_id, "nome_aluno": nome, "matricula_aluno": nome.lower(), "turma_aluno": "3A"
+    }, files={"imagem": ("prova.jpg", imagem, "image/jpeg")})
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def test_prova_enviada_e_lida_e_corrigida(cliente, criar_gabarito, folha_preenchida):
+    gabarito = criar_gabarito(num_questoes=8, respostas_corretas="ABCDABCD")
+    marcadas = ["A", "B", "C", "", "A", "AC", "D", "D"]
+    prova = enviar(cliente, gabarito["id"], folha_preenchida(gabarito["id"], marcadas))
+    assert prova["status"] == "queued"
+
+    lida = fila_omr.acompanhar(prova["id"]).result(TIMEOUT_S)
+    assert lida["status"] == "done", lida.get("erro")
+    assert lida["respostas_detectadas"] == ["A", "B", "C", "", "A", "*", "D", "D"]
+    resultado = cliente.get(f"/api/resultados/{lida['resultado_id']}").json()
+    assert resultado["prova_id"] == prova["id"]
+    assert resultado["acertos"] == 5
+
+
+def test_erro_ao_gravar_a_leitura_marca_a_prova_como_falha(cliente, criar_gabarito, folha_preenchida, monkeypatch):
+    gabarito = criar_gabarito(num_questoes=4)
+
+    def quebrar(*args):
+        raise KeyError("nome_aluno")
+    monkeypatch.setattr(utils_fila_omr, "montar_resultado", quebrar)
+    prova = enviar(cliente, gabarito["id"], folha_preenchida(gabarito["id"], ["A", "B", "C", "D"]))
+    lida = fila_omr.acompanhar(prova["id"]).result(TIMEOUT_S)
+    assert lida["status"] == "failed"
+    assert "nome_aluno" in lida["erro"]
+
+    # A fila continua processando as próximas
+    monkeypatch.undo()
+    prova = enviar(cliente, gabarito["id"], folha_preenchida(gabarito["id"], ["A", "A", "A", "A"]))
+    assert fila_omr.acompanhar(prova["id"]).result(TIMEOUT_S)["status"] == "done"
+
+
+def test_erro_de_storage_no_despacho_nao_derruba_a_fila(cliente, criar_gabarito, folha_preenchida, monkeypatch):
+    gabarito = criar_gabarito(num_questoes=4)
+    obter = storage.provas.obter
+    falhas = []
+
+    def obter_instavel(prova_id):
+        # Só a primeira leitura feita pelo despachante falha
+        if threading.current_thread().name == "fila-omr" and not falhas:
+            falhas.append(prova_id)
+            raise OSError("disco indisponível")
+        return obter(prova_id)
+    monkeypatch.setattr(storage.provas, "obter", obter_instavel)
+
+    primeira = enviar(cliente, gabarito["id"], folha_preenchida(gabarito["id"], ["B", "B", "B", "B"]), "Bia")
+    segunda = enviar(cliente, gabarito["id"], folha_preenchida(gabarito["id"], ["C", "C", "C", "C"]), "Caio")
+
+    falhou = fila_omr.acompanhar(primeira["id"]).result(TIMEOUT_S)
+    assert falhas == [primeira["id"]]
+    assert falhou["status"] == "failed" and "disco" in falhou["erro"]
+    assert fila_omr.acompanhar(segunda["id"]).result(TIMEOUT_S)["status"] == "done"
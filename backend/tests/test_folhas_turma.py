@@ -0,0 +1,36 @@
+"""
+Folhas personalizadas: códigos de folha únicos mesmo com pedidos concorrentes
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+
+def test_pedidos_concorrentes_nao_repetem_codigos(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=5)
+
+    def pedir(turma: int) -> int:
+        alunos = [{"nome_aluno": f"Aluno {turma}.{i}", "matricula_aluno": f"{turma}-{i}"} for i in range(5)]
+        return cliente.post(f"/api/gabaritos/{gabarito['id']}/folhas",
+                            json={"turma_aluno": f"T{turma}", "alunos": alunos}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(pedir, range(8))) == [200] * 8
+
+    folhas = storage.gabaritos.obter(gabarito["id"])["folhas"]
+    assert len(folhas) == 40
+    assert sorted(folha["codigo"] for folha in folhas) == list(range(1, 41))
+
+
+def test_aluno_repetido_mantem_o_codigo(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=5)
+    pedido = {"turma_aluno": "3A", "alunos": [{"nome_aluno": "Ana", "matricula_aluno": "1"}]}
+    for _ in range(2):
+        assert cliente.post(f"/api/gabaritos/{gabarito['id']}/folhas", json=pedido).status_code == 200
+    assert [folha["codigo"] for folha in storage.gabaritos.obter(gabarito["id"])["folhas"]] == [1]
+
+
+def test_gabarito_inexistente(cliente):
+    pedido = {"turma_aluno": "3A", "alunos": [{"nome_aluno": "Ana", "matricula_aluno": "1"}]}
+    assert cliente.post("/api/gabaritos/999999/folhas", json=pedido).status_code == 404
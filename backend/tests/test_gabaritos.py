@@ -0,0 +1,23 @@
+"""
+Folha do gabarito: cada renderização grava arquivos novos
+"""
+
+import storage
+from utils_omr import carregar_layout
+
+
+def test_rerenderizar_no_mesmo_segundo_nao_reaproveita_o_layout(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=4)
+    caminhos = [storage.gabaritos.obter(gabarito["id"])["layout_path"]]
+    carregar_layout(caminhos[0])
+    for num_questoes in (6, 8):
+        resposta = cliente.put(f"/api/gabaritos/{gabarito['id']}", json={
+            "titulo": "Prova", "num_questoes": num_questoes, "alternativas": list("ABCD"),
+            "respostas_corretas": ["A"] * num_questoes
+        })
+        assert resposta.status_code == 200, resposta.text
+        caminhos.append(storage.gabaritos.obter(gabarito["id"])["layout_path"])
+        # carregar_layout() é cacheado pelo caminho: um caminho repetido leria o layout antigo
+        assert carregar_layout(caminhos[-1])["num_questions"] == num_questoes
+
+    assert len(set(caminhos)) == 3
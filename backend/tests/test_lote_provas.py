@@ -0,0 +1,50 @@
+"""
+POST /api/provas/lote: folhas soltas ou em ZIP, com a lista de alunos
+"""
+
+import io
+import json
+import zipfile
+
+import pytest
+
+import storage
+
+
+def test_alunos_seguem_a_ordem_das_folhas_com_uma_rejeitada(cliente, criar_gabarito, folha_preenchida):
+    gabarito = criar_gabarito(num_questoes=4)
+    pacote = io.BytesIO()
+    with zipfile.ZipFile(pacote, "w") as zf:
+        zf.writestr("01.jpg", folha_preenchida(gabarito["id"], ["A", "B", "C", "D"]))
+        zf.writestr("02.txt", "não é imagem")
+        zf.writestr("03.jpg", folha_preenchida(gabarito["id"], ["A", "A", "A", "A"]))
+    alunos = [
+        {"nome_aluno": "Ana", "matricula_aluno": "1"},
+        {"nome_aluno": "Bruno", "matricula_aluno": "2"},
+        {"nome_aluno": "Carla", "matricula_aluno": "3"},
+    ]
+
+    resposta = cliente.post("/api/provas/lote", data={
+        "gabarito_id": gabarito["id"], "turma_aluno": "3A", "alunos": json.dumps(alunos), "aguardar": "true"
+    }, files=[("imagens", ("turma.zip", pacote.getvalue(), "application/zip"))])
+
+    assert resposta.status_code == 200, resposta.text
+    lote = resposta.json()
+    assert (lote["total"], lote["aceitas"], lote["rejeitadas"]) == (3, 2, 1)
+    folhas = {folha["arquivo"]: folha for folha in lote["folhas"]}
+    assert folhas["02.txt"]["status"] == "rejected"
+    for arquivo, nome, matricula in (("01.jpg", "Ana", "1"), ("03.jpg", "Carla", "3")):
+        folha = folhas[arquivo]
+        assert folha["status"] == "done"
+        prova = storage.provas.obter(folha["prova_id"])
+        assert (prova["nome_aluno"], prova["matricula_aluno"], prova["turma_aluno"]) == (nome, matricula, "3A")
+        assert storage.resultados.obter(folha["resultado_id"])["nome_aluno"] == nome
+    assert folhas["01.jpg"]["respostas_detectadas"] == ["A", "B", "C", "D"]
+
+
+@pytest.mark.parametrize("alunos", ['{"nome_aluno": "Ana"}', "[1, 2]", '"Ana"', "[{]"])
+def test_alunos_invalido_responde_400(cliente, criar_gabarito, alunos):
+    gabarito = criar_gabarito(num_questoes=4)
+    resposta = cliente.post("/api/provas/lote", data={"gabarito_id": gabarito["id"], "alunos": alunos},
+                            files=[("imagens", ("a.txt", b"x", "text/plain"))])
+    assert resposta.status_code == 400
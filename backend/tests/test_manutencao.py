@@ -0,0 +1,118 @@
+"""
+Manutenção: arquivo de provas encerradas, cascata ao deletar e coleta de órfãos
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import storage
+import utils_manutencao
+from utils_fila_omr import fila_omr
+
+TIMEOUT_S = 60
+
+
+def corrigir(cliente, gabarito_id: int, imagem: bytes, nome: str) -> dict:
+    """Enviar uma folha e esperar a leitura (e o resultado automático)"""
+    resposta = cliente.post("/api/provas/", data={
+        "gabarito_id": gabarito_id, "nome_aluno": nome, "matricula_aluno": nome.lower(), "turma_aluno": "3A"
+    }, files={"imagem": ("prova.jpg", imagem, "image/jpeg")})
+    assert resposta.status_code == 200, resposta.text
+    prova = fila_omr.acompanhar(resposta.json()["id"]).result(TIMEOUT_S)
+    assert prova["status"] == "done", prova.get("erro")
+    return prova
+
+
+def test_arquivar_e_restaurar_mantem_os_ids(cliente, criar_gabarito, folha_preenchida):
+    gabarito = criar_gabarito(num_questoes=4, respostas_corretas="ABCD")
+    provas = [
+        corrigir(cliente, gabarito["id"], folha_preenchida(gabarito["id"], marcadas), nome)
+        for nome, marcadas in (("Ana", ["A", "B", "C", "D"]), ("Bia", ["A", "A", "A", "A"]))
+    ]
+    estatisticas = cliente.get(f"/api/resultados/gabarito/{gabarito['id']}/estatisticas").json()
+
+    # Só prova encerrada pode ser arquivada
+    assert cliente.post(f"/api/gabaritos/{gabarito['id']}/arquivar").status_code == 409
+    cliente.post(f"/api/gabaritos/{gabarito['id']}/encerrar")
+    arquivado = cliente.post(f"/api/gabaritos/{gabarito['id']}/arquivar").json()
+    assert arquivado["arquivado_em"]
+    assert storage.provas.filtrar(gabarito_id=gabarito["id"]) == []
+    assert storage.resultados.filtrar(gabarito_id=gabarito["id"]) == []
+    for prova in provas:
+        # Imagens iguais são guardadas uma vez só: a de outra prova fica
+        compartilhada = bool(storage.provas.filtrar(imagem_hash=prova["imagem_hash"]))
+        assert os.path.exists(prova["imagem_url"]) == compartilhada
+
+    # Leituras vêm do arquivo, sem restaurar
+    for prova in provas:
+        assert cliente.get(f"/api/provas/{prova['id']}").json()["nome_aluno"] == prova["nome_aluno"]
+        resultado = cliente.get(f"/api/resultados/{prova['resultado_id']}").json()
+        assert resultado["prova_id"] == prova["id"]
+        assert cliente.get(f"/api/provas/{prova['id']}/miniatura").status_code == 200
+    listadas = cliente.get("/api/provas/", params={"gabarito_id": gabarito["id"]}).json()
+    assert [p["id"] for p in listadas] == [p["id"] for p in provas]
+    exportado = cliente.get("/api/resultados/exportar", params={"gabarito_id": gabarito["id"]}).text
+    assert len(exportado.strip().splitlines()) == 1 + len(provas)
+    assert cliente.get(f"/api/resultados/gabarito/{gabarito['id']}/estatisticas").json() == estatisticas
+    assert cliente.get(f"/api/resultados/gabarito/{gabarito['id']}/analise").status_code == 200
+    assert cliente.get("/api/provas/999999").status_code == 404
+    assert storage.gabaritos.obter(gabarito["id"])["arquivado_em"]
+    assert storage.provas.filtrar(gabarito_id=gabarito["id"]) == []
+    assert utils_manutencao.localizar("provas", provas[0]["id"]) == gabarito["id"]
+
+    # Só o restaurar explícito traz o gabarito de volta, com os mesmos ids
+    assert cliente.post(f"/api/gabaritos/{gabarito['id']}/restaurar").json()["arquivado_em"] is None
+    assert utils_manutencao.localizar("provas", provas[0]["id"]) is None
+    for prova in provas:
+        assert storage.provas.obter(prova["id"])["nome_aluno"] == prova["nome_aluno"]
+        assert storage.resultados.obter(prova["resultado_id"])["prova_id"] == prova["id"]
+        assert os.path.exists(prova["imagem_url"])
+    assert cliente.get(f"/api/resultados/gabarito/{gabarito['id']}/estatisticas").json() == estatisticas
+
+
+def test_deletar_gabarito_remove_dependentes(cliente, criar_gabarito, folha_preenchida):
+    gabarito = criar_gabarito(num_questoes=4)
+    prova = corrigir(cliente, gabarito["id"], folha_preenchida(gabarito["id"], ["D", "C", "B", "A"]), "Caio")
+    png_path = storage.gabaritos.obter(gabarito["id"])["png_path"]
+
+    assert cliente.delete(f"/api/gabaritos/{gabarito['id']}").status_code == 200
+    assert storage.provas.obter(prova["id"]) is None
+    assert storage.resultados.obter(prova["resultado_id"]) is None
+    assert storage.chaves.filtrar(gabarito_id=gabarito["id"]) == []
+    compartilhada = bool(storage.provas.filtrar(imagem_hash=prova["imagem_hash"]))
+    assert os.path.exists(prova["imagem_url"]) == compartilhada
+    assert not os.path.exists(png_path)
+
+
+def test_coleta_de_orfaos_respeita_a_carencia(cliente, monkeypatch):
+    antigo = (datetime.now() - timedelta(days=1)).isoformat()
+    recente = datetime.now().isoformat()
+    # Gabarito que não existe: as provas são órfãs, mas a recente pode ser
+    # de um gabarito que ainda está sendo gravado
+    orfa = storage.provas.inserir({"gabarito_id": 987654, "nome_aluno": "Ana", "criado_em": antigo})
+    nova = storage.provas.inserir({"gabarito_id": 987654, "nome_aluno": "Bia", "criado_em": recente})
+    monkeypatch.setattr(utils_manutencao, "MANUTENCAO_CARENCIA_S", 3600)
+
+    removidos = utils_manutencao.coletar_orfaos()
+
+    assert removidos["provas"] == 1
+    assert storage.provas.obter(orfa["id"]) is None
+    assert storage.provas.obter(nova["id"]) == nova
+
+
+def test_coleta_de_orfaos_nao_toca_gabarito_criado_depois_da_listagem(cliente, monkeypatch):
+    antigo = (datetime.now() - timedelta(days=1)).isoformat()
+    prova = storage.provas.inserir({"gabarito_id": 0, "nome_aluno": "Ana", "criado_em": antigo})
+    gabarito = {}
+    listar = storage.gabaritos.listar
+
+    def listar_e_criar():
+        # O gabarito aparece logo depois da listagem feita pela coleta
+        gabaritos = listar()
+        gabarito.update(storage.gabaritos.inserir({"titulo": "Nova", "num_questoes": 1}))
+        storage.provas.atualizar(prova["id"], {"gabarito_id": gabarito["id"]})
+        return gabaritos
+    monkeypatch.setattr(storage.gabaritos, "listar", listar_e_criar)
+
+    assert utils_manutencao.coletar_orfaos()["provas"] == 0
+    assert storage.provas.obter(prova["id"])["gabarito_id"] == gabarito["id"]
@@ -0,0 +1,119 @@
+"""
+Respostas compactas (um byte por questão) e versões da chave
+"""
+
+import asyncio
+import base64
+
+import pytest
+
+import storage
+from utils_respostas import EM_BRANCO, MULTIPLA, codificar, expandir, versoes_chave
+
+
+def test_ida_e_volta_com_em_branco_e_multipla():
+    alternativas = list("ABCDE")
+    respostas = ["A", "", "E", "*", "C", ""]
+    texto = codificar(respostas, alternativas)
+    dados = base64.b64decode(texto)
+    assert list(dados) == [0, EM_BRANCO, 4, MULTIPLA, 2, EM_BRANCO]
+    assert expandir(dados, alternativas) == respostas
+
+
+def test_maior_numero_de_alternativas_que_cabe():
+    # 254 alternativas usam os códigos 0..253; 254 e 255 são "*" e ""
+    alternativas = [f"x{i}" for i in range(MULTIPLA)]
+    respostas = ["x0", "x252", "x253", "*", ""]
+    dados = base64.b64decode(codificar(respostas, alternativas))
+    assert list(dados) == [0, 252, 253, MULTIPLA, EM_BRANCO]
+    assert expandir(dados, alternativas) == respostas
+
+
+@pytest.mark.parametrize("alternativas, respostas", [
+    ([f"x{i}" for i in range(MULTIPLA + 1)], ["x0"]),  # a 255ª alternativa colidiria com "*"
+    (list("ABCD"), ["A", "Z"]),  # valor fora das alternativas
+    (list("ABCD"), ["A", None]),
+])
+def test_respostas_que_nao_cabem_ficam_como_lista(alternativas, respostas):
+    assert codificar(respostas, alternativas) is None
+
+
+def test_resultado_gravado_compacto_volta_igual_pela_api(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=5, alternativas="ABCDE", respostas_corretas="ABCDE")
+    prova = storage.provas.inserir({"gabarito_id": gabarito["id"], "nome_aluno": "Ana",
+                                    "matricula_aluno": "1", "turma_aluno": "3A"})
+    respostas = ["A", "", "*", "D", "C"]
+    criado = cliente.post("/api/resultados/", json={
+        "prova_id": prova["id"], "gabarito_id": gabarito["id"], "respostas_aluno": respostas
+    }).json()
+
+    gravado = storage.resultados.obter(criado["id"])
+    assert "respostas_aluno" not in gravado and "respostas_corretas" not in gravado
+    assert storage.chaves.obter(gravado["chave_id"])["gabarito_id"] == gabarito["id"]
+    lido = cliente.get(f"/api/resultados/{criado['id']}").json()
+    assert lido["respostas_aluno"] == respostas
+    assert lido["respostas_corretas"] == list("ABCDE")
+    assert lido["acertos"] == 2
+
+
+def test_resposta_fora_das_alternativas_e_gravada_como_lista(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=3, alternativas="ABC", respostas_corretas="ABC")
+    prova = storage.provas.inserir({"gabarito_id": gabarito["id"], "nome_aluno": "Bia",
+                                    "matricula_aluno": "2", "turma_aluno": "3A"})
+    criado = cliente.post("/api/resultados/", json={
+        "prova_id": prova["id"], "gabarito_id": gabarito["id"], "respostas_aluno": ["A", "Z", "C"]
+    }).json()
+
+    assert storage.resultados.obter(criado["id"])["respostas_aluno"] == ["A", "Z", "C"]
+    assert cliente.get(f"/api/resultados/{criado['id']}").json()["respostas_aluno"] == ["A", "Z", "C"]
+
+
+def test_resultado_antigo_aponta_para_a_chave_com_que_foi_corrigido(cliente, criar_gabarito):
+    gabarito = criar_gabarito(num_questoes=3, alternativas="ABC", respostas_corretas="ABC")
+    prova = storage.provas.inserir({"gabarito_id": gabarito["id"], "nome_aluno": "Caio",
+                                    "matricula_aluno": "3", "turma_aluno": "3A"})
+    criado = cliente.post("/api/resultados/", json={
+        "prova_id": prova["id"], "gabarito_id": gabarito["id"], "respostas_aluno": ["A", "B", "B"]
+    }).json()
+    chave_antiga = storage.resultados.obter(criado["id"])["chave_id"]
+
+    # Alternativas novas (mesma chave): a versão muda, o resultado gravado não
+    cliente.put(f"/api/gabaritos/{gabarito['id']}", json={
+        "titulo": "Prova", "num_questoes": 3, "alternativas": list("CBA"), "respostas_corretas": list("ABC")
+    })
+    novo = cliente.post("/api/resultados/", json={
+        "prova_id": prova["id"], "gabarito_id": gabarito["id"], "respostas_aluno": ["A", "B", "B"]
+    }).json()
+
+    assert storage.resultados.obter(novo["id"])["chave_id"] != chave_antiga
+    for resultado_id in (criado["id"], novo["id"]):
+        lido = cliente.get(f"/api/resultados/{resultado_id}").json()
+        assert lido["respostas_aluno"] == ["A", "B", "B"]
+        assert lido["acertos"] == 2
+
+
+def test_chave_resolvida_uma_vez_fora_do_event_loop(cliente, criar_gabarito, monkeypatch):
+    gabarito = criar_gabarito(num_questoes=3, alternativas="ABC", respostas_corretas="ABC")
+    prova = storage.provas.inserir({"gabarito_id": gabarito["id"], "nome_aluno": "Davi",
+                                    "matricula_aluno": "4", "turma_aluno": "3A"})
+    chamadas = []
+    atual = versoes_chave.atual
+
+    def atual_registrando(gabarito_id):
+        try:
+            asyncio.get_running_loop()
+            chamadas.append("event loop")
+        except RuntimeError:
+            chamadas.append("thread")
+        return atual(gabarito_id)
+    monkeypatch.setattr(versoes_chave, "atual", atual_registrando)
+
+    resposta = cliente.post("/api/resultados/", json={
+        "prova_id": prova["id"], "gabarito_id": gabarito["id"], "respostas_aluno": ["A", "B", "A"]
+    })
+    assert resposta.status_code == 200 and resposta.json()["acertos"] == 2
+    resposta = cliente.post("/api/resultados/lote", json={
+        "gabarito_id": gabarito["id"], "itens": [{"prova_id": prova["id"], "respostas_aluno": ["C", "B", "A"]}]
+    })
+    assert resposta.status_code == 200
+    assert chamadas == ["thread", "thread"]
@@ -0,0 +1,80 @@
+"""
+ColecaoJournal: carga, journal truncado, compactação e leitura concorrente
+"""
+
+import json
+import os
+
+from storage.journal import ColecaoJournal
+
+
+def nova_colecao(diretorio, **opcoes) -> ColecaoJournal:
+    return ColecaoJournal("itens", diretorio=str(diretorio), indices=("turma",), ordenacoes=("nota",), **opcoes)
+
+
+def test_recarga_reaplica_o_journal(tmp_path):
+    colecao = nova_colecao(tmp_path)
+    a = colecao.inserir({"turma": "A", "nota": 5})
+    b = colecao.inserir({"turma": "B", "nota": 7})
+    colecao.atualizar(a["id"], {"nota": 9})
+    colecao.remover(b["id"])
+
+    recarregada = nova_colecao(tmp_path)
+    assert recarregada.listar() == [{"id": a["id"], "turma": "A", "nota": 9}]
+    assert recarregada.filtrar(turma="B") == []
+    # Ids removidos não são reaproveitados
+    assert recarregada.inserir({"turma": "C", "nota": 1})["id"] == b["id"] + 1
+
+
+def test_linha_truncada_e_descartada(tmp_path):
+    colecao = nova_colecao(tmp_path)
+    colecao.inserir({"turma": "A", "nota": 1})
+    colecao.inserir({"turma": "A", "nota": 2})
+    # Queda no meio de uma escrita: metade de uma linha no fim do journal
+    with open(colecao.journal_path, "ab") as f:
+        f.write(b'{"op":"inserir","item":{"id":3,"tur')
+
+    recarregada = nova_colecao(tmp_path)
+    assert [item["id"] for item in recarregada.listar()] == [1, 2]
+    novo = recarregada.inserir({"turma": "B", "nota": 3})
+    assert novo["id"] == 3
+
+    # A escrita seguinte sobrescreveu a sobra: o journal volta a ser todo válido
+    with open(recarregada.journal_path, "rb") as f:
+        linhas = f.read().splitlines()
+    assert all(json.loads(linha) for linha in linhas)
+    assert [item["nota"] for item in nova_colecao(tmp_path).listar()] == [1, 2, 3]
+
+
+def test_compactacao_preserva_registros_e_ids(tmp_path):
+    colecao = nova_colecao(tmp_path, compactar_apos=5)
+    ids = [colecao.inserir({"turma": "A", "nota": n})["id"] for n in range(12)]
+    for item_id in ids[:4]:
+        colecao.remover(item_id)
+    colecao.atualizar(ids[5], {"nota": 99})
+
+    assert os.path.exists(colecao.snapshot_path)
+    with open(colecao.journal_path, "rb") as f:
+        assert len(f.read().splitlines()) <= 6
+
+    recarregada = nova_colecao(tmp_path, compactar_apos=5)
+    assert [item["id"] for item in recarregada.listar()] == ids[4:]
+    assert recarregada.obter(ids[5])["nota"] == 99
+    assert recarregada.paginar(limite=1, ordem="nota", decrescente=True)[0]["id"] == ids[5]
+    assert recarregada.inserir({"turma": "B", "nota": 0})["id"] == ids[-1] + 1
+
+
+def test_atualizar_nao_altera_o_registro_ja_lido(tmp_path):
+    colecao = nova_colecao(tmp_path)
+    item = colecao.inserir({"turma": "A", "nota": 5})
+    lido = colecao.obter(item["id"])
+    mudancas = []
+    colecao.observar(lambda op, anterior, atual: mudancas.append((op, anterior, atual)))
+
+    atualizado = colecao.atualizar(item["id"], {"turma": "B", "nota": 8})
+
+    assert lido == {"id": item["id"], "turma": "A", "nota": 5}
+    assert atualizado == colecao.obter(item["id"]) == {"id": item["id"], "turma": "B", "nota": 8}
+    assert mudancas == [("atualizar", lido, atualizado)]
+    assert colecao.filtrar(turma="A") == []
+    assert colecao.filtrar(turma="B") == [atualizado]
@@ -0,0 +1,97 @@
+"""
+ColecaoJournal e ColecaoSQLite respondem igual a filtrar() e paginar()
+"""
+
+import random
+
+import pytest
+
+from storage.journal import ColecaoJournal
+from storage.sqlite import ColecaoSQLite
+
+INDICES = ("turma",)
+ORDENACOES = ("nota",)
+
+
+def registros() -> list:
+    """Registros com campos nulos e ausentes (como os antigos, sem nota)"""
+    aleatorio = random.Random(7)
+    itens = []
+    for i in range(60):
+        item = {"turma": aleatorio.choice(["A", "B", None]), "nota": aleatorio.choice([None, 1.0, 2.0, 3.5]),
+                "status": aleatorio.choice(["done", "queued"])}
+        if i % 7 == 0:
+            del item["turma"]
+        if i % 11 == 0:
+            del item["nota"]
+        itens.append(item)
+    return itens
+
+
+@pytest.fixture
+def colecoes(tmp_path):
+    journal = ColecaoJournal("itens", diretorio=str(tmp_path), indices=INDICES, ordenacoes=ORDENACOES)
+    sqlite = ColecaoSQLite("itens", f"sqlite:///{tmp_path}/itens.db", indices=INDICES, ordenacoes=ORDENACOES)
+    for colecao in (journal, sqlite):
+        colecao.aplicar_lote([("inserir", (item,)) for item in registros()])
+    return journal, sqlite
+
+
+def ids(itens) -> list:
+    return [item["id"] for item in itens]
+
+
+@pytest.mark.parametrize("criterios", [
+    {"turma": "A"},
+    {"turma": None},
+    {"status": "done"},
+    {"turma": "B", "status": "queued"},
+    {"turma": None, "status": "done"},
+])
+def test_filtrar(colecoes, criterios):
+    journal, sqlite = colecoes
+    esperado = ids(journal.filtrar(**criterios))
+    assert esperado
+    assert ids(sqlite.filtrar(**criterios)) == esperado
+
+
+def percorrer(colecao, limite: int, **opcoes) -> list:
+    """Todas as páginas, seguindo o cursor (valor de ordenação, id) do último item"""
+    ordem = opcoes.get("ordem", "id")
+    vistos, depois = [], None
+    while True:
+        pagina = colecao.paginar(limite=limite, depois=depois, **opcoes)
+        if not pagina:
+            return vistos
+        vistos += ids(pagina)
+        depois = (pagina[-1].get(ordem), pagina[-1]["id"])
+
+
+@pytest.mark.parametrize("ordem", ["id", "nota"])
+@pytest.mark.parametrize("decrescente", [False, True])
+@pytest.mark.parametrize("criterios", [{}, {"turma": "A"}, {"turma": None}, {"status": "queued"}])
+def test_paginar_com_cursor(colecoes, ordem, decrescente, criterios):
+    journal, sqlite = colecoes
+    completo = ids(journal.paginar(ordem=ordem, decrescente=decrescente, **criterios))
+    # Cursor passando por valores nulos da ordenação: nada some nem se repete
+    assert sorted(completo) == ids(journal.filtrar(**criterios))
+    for colecao in (journal, sqlite):
+        assert percorrer(colecao, 4, ordem=ordem, decrescente=decrescente, **criterios) == completo
+
+
+def test_paginar_com_intervalo(colecoes):
+    journal, sqlite = colecoes
+    opcoes = {"ordem": "nota", "intervalos": {"nota": (1.5, 3.5)}, "turma": "A"}
+    esperado = ids(journal.paginar(**opcoes))
+    assert esperado and all(journal.obter(i)["nota"] in (2.0, 3.5) for i in esperado)
+    assert ids(sqlite.paginar(**opcoes)) == esperado
+    assert percorrer(sqlite, 3, **opcoes) == esperado
+
+
+def test_restaurados_voltam_em_ordem_de_id(colecoes):
+    for colecao in colecoes:
+        removidos = colecao.aplicar_lote([("remover", (i,)) for i in (2, 5, 30)])
+        colecao.aplicar_lote([("restaurar", (item,)) for item in reversed(removidos)])
+    journal, sqlite = colecoes
+    assert ids(journal.listar()) == ids(sqlite.listar()) == list(range(1, 61))
+    assert ids(journal.filtrar(status="done")) == ids(sqlite.filtrar(status="done"))
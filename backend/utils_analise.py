@@ -0,0 +1,141 @@
+"""
+Análise de itens (psicometria clássica) com NumPy
+
+A partir dos resultados de um gabarito monta a matriz alunos × questões
+com o índice da alternativa marcada e calcula, de uma vez para todas as
+questões: dificuldade, índice de discriminação (27% superior/inferior),
+correlação ponto-bisserial, frequência de cada alternativa (distratores)
+e a confiabilidade KR-20 da prova.
+"""
+
+from itertools import chain
+from typing import List, Optional
+
+import numpy as np
+
+from utils_respostas import respostas_aluno
+
+# Códigos na matriz de respostas além dos índices das alternativas
+EM_BRANCO = -1
+INVALIDA = -2  # marcação múltipla ou valor fora das alternativas
+# Fração dos alunos em cada grupo do índice de discriminação
+FRACAO_GRUPOS = 0.27
+
+
+def matriz_respostas(respostas: List[List[str]], alternativas: List[str], num_questoes: int) -> np.ndarray:
+    """Matriz (alunos, questões) de int8 com o índice da alternativa marcada"""
+    codigos = {alternativa: indice for indice, alternativa in enumerate(alternativas)}
+    codigos[""] = EM_BRANCO
+    # Completar/cortar cada lista no número de questões do gabarito
+    linhas = [
+        r if len(r) == num_questoes else list(r[:num_questoes]) + [""] * (num_questoes - len(r))
+        for r in respostas
+    ]
+    return np.fromiter(
+        (codigos.get(resposta, INVALIDA) for resposta in chain.from_iterable(linhas)),
+        dtype=np.int8,
+        count=len(linhas) * num_questoes
+    ).reshape(len(linhas), num_questoes)
+
+
+def _ou_none(valores: np.ndarray) -> List[Optional[float]]:
+    """Arredondar, trocando NaN (variância zero) por None"""
+    return [None if np.isnan(v) else round(float(v), 4) for v in valores]
+
+
+def analisar_itens(matriz: np.ndarray, chave: np.ndarray, num_alternativas: int) -> dict:
+    """Estatísticas de todos os itens a partir da matriz de respostas
+
+    `chave` é o índice da alternativa correta de cada questão; a matriz
+    precisa ter pelo menos um aluno. Questões sem alternativa correta válida
+    na chave (chave mais curta que a prova, em branco ou fora das
+    alternativas) ficam fora das notas e do KR-20 e têm as estatísticas NaN:
+    senão um aluno em branco "acertaria" uma posição em branco da chave.
+    """
+    alunos, questoes = matriz.shape
+    com_chave = chave >= 0
+    acertos = ((matriz == chave[None, :]) & com_chave[None, :]).astype(np.float64)
+    totais = acertos.sum(axis=1)
+
+    dificuldade = acertos.mean(axis=0)
+
+    # Discriminação: acerto no grupo superior menos no inferior (por nota total)
+    tamanho_grupo = max(1, int(round(alunos * FRACAO_GRUPOS)))
+    ordem = np.argsort(totais, kind="stable")
+    discriminacao = (
+        acertos[ordem[-tamanho_grupo:]].mean(axis=0) - acertos[ordem[:tamanho_grupo]].mean(axis=0)
+    )
+
+    # Ponto-bisserial entre o acerto no item e a nota total
+    desvio_total = totais.std()
+    desvio_itens = np.sqrt(dificuldade * (1 - dificuldade))
+    covariancia = (acertos * totais[:, None]).mean(axis=0) - dificuldade * totais.mean()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ponto_bisserial = covariancia / (desvio_itens * desvio_total)
+    ponto_bisserial[~np.isfinite(ponto_bisserial)] = np.nan
+    for estatistica in (discriminacao, ponto_bisserial):
+        estatistica[~com_chave] = np.nan
+
+    # Frequência de cada alternativa por questão, de uma vez (bincount nas
+    # colunas deslocadas): [alternativas..., em branco, inválida]
+    categorias = num_alternativas + 2
+    codigos = np.where(matriz >= 0, matriz, num_alternativas - 1 - matriz.astype(np.int64))
+    deslocados = (codigos + np.arange(questoes)[None, :] * categorias).ravel()
+    frequencias = np.bincount(deslocados, minlength=questoes * categorias).reshape(questoes, categorias)
+
+    # KR-20 (variância populacional das notas totais), só com as questões com chave
+    variancia_total = totais.var()
+    avaliadas = int(com_chave.sum())
+    if avaliadas > 1 and variancia_total > 0:
+        kr20 = avaliadas / (avaliadas - 1) * (1 - (dificuldade * (1 - dificuldade)).sum() / variancia_total)
+    else:
+        kr20 = None
+
+    return {
+        "dificuldade": np.where(com_chave, dificuldade, np.nan),
+        "discriminacao": discriminacao,
+        "ponto_bisserial": ponto_bisserial,
+        "frequencias": frequencias,
+        "kr20": kr20,
+        "media": float(totais.mean()),
+        "desvio_padrao": float(desvio_total),
+    }
+
+
+def analisar_gabarito(gabarito: dict, resultados: List[dict]) -> dict:
+    """Análise de itens de um gabarito, no formato de AnaliseItensResponse"""
+    alternativas = list(gabarito["alternativas"])
+    num_questoes = gabarito["num_questoes"]
+    corretas = list(gabarito["respostas_corretas"])[:num_questoes]
+    chave = matriz_respostas([corretas], alternativas, num_questoes)[0]
+
+    matriz = matriz_respostas([respostas_aluno(r) for r in resultados], alternativas, num_questoes)
+    analise = analisar_itens(matriz, chave, len(alternativas))
+
+    dificuldade = _ou_none(analise["dificuldade"])
+    discriminacao = _ou_none(analise["discriminacao"])
+    ponto_bisserial = _ou_none(analise["ponto_bisserial"])
+    frequencias = analise["frequencias"].tolist()
+    questoes = []
+    for q in range(num_questoes):
+        contagens = frequencias[q]
+        questoes.append({
+            "questao": q,
+            "correta": corretas[q] if q < len(corretas) else None,
+            "dificuldade": dificuldade[q],
+            "discriminacao": discriminacao[q],
+            "ponto_bisserial": ponto_bisserial[q],
+            "distratores": dict(zip(alternativas, contagens[:len(alternativas)])),
+            "em_branco": contagens[len(alternativas)],
+            "invalidas": contagens[len(alternativas) + 1],
+        })
+
+    return {
+        "gabarito_id": gabarito["id"],
+        "total_alunos": len(resultados),
+        "num_questoes": num_questoes,
+        "media_acertos": round(analise["media"], 4),
+        "desvio_padrao": round(analise["desvio_padrao"], 4),
+        "kr20": None if analise["kr20"] is None else round(float(analise["kr20"]), 4),
+        "questoes": questoes,
+    }
@@ -0,0 +1,135 @@
+"""
+Cache de respostas GET já serializadas, com ETag / 304
+
+Cada coleção do storage tem uma versão que cresce a cada commit. A resposta
+de uma rota de leitura é guardada pronta (bytes JSON e, sob demanda, a versão
+gzip), com chave pelo caminho + query string, junto das versões das coleções
+de que ela depende: enquanto nenhuma delas muda, as requisições seguintes
+não tocam no storage nem serializam nada. O ETag é derivado das versões,
+então um If-None-Match atual recebe 304 antes até da consulta ao cache. As
+versões vêm do storage e são as mesmas em todos os workers e depois de um
+restart: o ETag recebido de um worker vale em qualquer outro.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Tuple
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from utils_http import etag_confere
+
+try:
+    import orjson
+except ImportError:  # serializador mais rápido é opcional
+    orjson = None
+
+RESPOSTAS_CACHE_ITENS = int(os.getenv("RESPOSTAS_CACHE_ITENS", 512))
+# Corpos menores que isso vão sem gzip (não compensa)
+RESPOSTAS_GZIP_MIN = int(os.getenv("RESPOSTAS_GZIP_MIN", 1024))
+CACHE_CONTROL_API = os.getenv("CACHE_CONTROL_API", "private, no-cache")
+
+
+def json_bytes(dados) -> bytes:
+    """Serializar para JSON compacto (orjson, se instalado)"""
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EntradaCache:
+    """Resposta pronta de uma URL em um conjunto de versões"""
+
+    __slots__ = ("versoes", "etag", "corpo", "corpo_gzip", "headers")
+
+    def __init__(self, versoes: tuple, etag: str, corpo: bytes, headers: dict):
+        self.versoes = versoes
+        self.etag = etag
+        self.corpo = corpo
+        self.corpo_gzip: Optional[bytes] = None
+        self.headers = headers
+
+
+class CacheRespostas:
+    """LRU de respostas por URL; a versão guardada é substituída quando as coleções mudam"""
+
+    def __init__(self, max_itens: int = RESPOSTAS_CACHE_ITENS):
+        self.max_itens = max_itens
+        self._entradas: "OrderedDict[str, EntradaCache]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(url: str, versoes: tuple) -> str:
+        resumo = hashlib.sha1(f"{url}|{versoes}".encode()).hexdigest()[:16]
+        return f'"{resumo}"'
+
+    def obter(self, url: str, versoes: tuple) -> Optional[EntradaCache]:
+        with self._lock:
+            entrada = self._entradas.get(url)
+            if entrada is None or entrada.versoes != versoes:
+                return None
+            self._entradas.move_to_end(url)
+            return entrada
+
+    def guardar(self, url: str, entrada: EntradaCache):
+        with self._lock:
+            self._entradas[url] = entrada
+            self._entradas.move_to_end(url)
+            while len(self._entradas) > self.max_itens:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+cache_respostas = CacheRespostas()
+
+
+def _aceita_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def _montar_entrada(versoes: tuple, etag: str, gerar: Callable[[], Tuple[object, dict]]) -> EntradaCache:
+    dados, extras = gerar()
+    return EntradaCache(versoes, etag, json_bytes(dados), extras)
+
+
+async def responder_com_cache(
+    request: Request,
+    colecoes: Sequence,
+    gerar: Callable[[], Tuple[object, dict]]
+) -> Response:
+    """Resposta JSON de uma rota GET que só depende de `colecoes`
+
+    `gerar()` devolve (dados, headers extras) e só é chamado quando não há
+    resposta guardada para as versões atuais; ele, a serialização e o gzip
+    rodam no threadpool, fora do event loop. Exceções (ex: 404) passam
+    direto e não são guardadas.
+    """
+    versoes = tuple(colecao.versao for colecao in colecoes)
+    url = request.url.path + ("?" + request.url.query if request.url.query else "")
+    etag = CacheRespostas.etag(url, versoes)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_API, "Vary": "Accept-Encoding"}
+    if etag_confere(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    entrada = cache_respostas.obter(url, versoes)
+    if entrada is None:
+        entrada = await run_in_threadpool(_montar_entrada, versoes, etag, gerar)
+        cache_respostas.guardar(url, entrada)
+    headers.update(entrada.headers)
+
+    corpo = entrada.corpo
+    if len(corpo) >= RESPOSTAS_GZIP_MIN and _aceita_gzip(request):
+        if entrada.corpo_gzip is None:
+            entrada.corpo_gzip = await run_in_threadpool(gzip.compress, corpo, compresslevel=5)
+        corpo = entrada.corpo_gzip
+        headers["Content-Encoding"] = "gzip"
+    return Response(corpo, media_type="application/json", headers=headers)
@@ -0,0 +1,265 @@
+"""
+Correção de provas: uma a uma, vetorizada e recorreção em lote
+
+`montar_resultado` monta o registro de resultado de uma prova corrigida;
+`corrigir_lote` corrige muitas listas de respostas contra uma chave com uma
+única comparação de matrizes, com as mesmas regras de calcular_resultado.
+A chave de respostas vem das versões em cache de utils_respostas
+(`versoes_chave`), invalidadas pelo observador da coleção de gabaritos.
+
+Quando as respostas corretas de um gabarito mudam, todos os resultados
+dele são recorrigidos em background (`recorrecao`): a matriz inteira é
+recalculada de uma vez e as alterações vão para o storage em um único
+commit. O gabarito fica marcado com "recorrecao_pendente" até o fim, então
+uma recorreção interrompida por restart é refeita na inicialização.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import storage
+from utils_respostas import Chave, campos_respostas, compactar_resultado, respostas_aluno, versoes_chave
+
+STATUS_NA_FILA = "queued"
+STATUS_PROCESSANDO = "processing"
+STATUS_CONCLUIDO = "done"
+STATUS_FALHOU = "failed"
+STATUS_PENDENTES = (STATUS_NA_FILA, STATUS_PROCESSANDO)
+
+
+class GabaritoNaoEncontrado(Exception):
+    """Gabarito da correção não existe (ou foi removido)"""
+
+
+def obter_chave(gabarito_id: int) -> Chave:
+    """Versão atual da chave de respostas do gabarito (em cache)"""
+    chave = versoes_chave.atual(gabarito_id)
+    if chave is None:
+        raise GabaritoNaoEncontrado("Gabarito não encontrado")
+    return chave
+
+
+def calcular_resultado(respostas_aluno: List[str], chave: Chave) -> dict:
+    """
+    Calcular o resultado da correção
+    """
+    respostas_corretas = chave.corretas
+
+    acertos = sum(
+        1 for a, c in zip(respostas_aluno, respostas_corretas) if a == c
+    )
+    erros = len(respostas_aluno) - acertos
+    percentual = (acertos / len(respostas_aluno) * 100) if respostas_aluno else 0
+    nota = (acertos / len(respostas_aluno) * 10) if respostas_aluno else 0
+
+    return {
+        "acertos": acertos,
+        "erros": erros,
+        "percentual_acerto": round(percentual, 2),
+        "nota": round(nota, 2)
+    }
+
+
+def montar_resultado(prova: dict, chave: Chave, respostas_aluno: List[str]) -> dict:
+    """Montar o registro de resultado (ainda sem id) de uma prova corrigida
+
+    `chave` é a versão da chave já resolvida por obter_chave() (que pode
+    gravar uma versão nova: fora do event loop). As respostas são gravadas
+    compactas, com referência a ela (ver utils_respostas);
+    expandir_resultado monta o formato da API.
+    """
+    calculo = calcular_resultado(respostas_aluno, chave)
+
+    return {
+        "prova_id": prova["id"],
+        "gabarito_id": chave.gabarito_id,
+        "nome_aluno": prova["nome_aluno"],
+        "matricula_aluno": prova["matricula_aluno"],
+        "turma_aluno": prova["turma_aluno"],
+        **campos_respostas(respostas_aluno, chave),
+        **calculo,
+        "criado_em": datetime.now().isoformat()
+    }
+
+
+def _codificar(linhas: Sequence[Sequence[str]], largura: int, vocabulario: Dict[str, int], vazio: int) -> np.ndarray:
+    """Matriz (linhas, largura) com um código inteiro por resposta distinta
+
+    Posições além do fim de cada lista recebem `vazio`.
+    """
+    completas = [
+        linha if len(linha) == largura else list(linha) + [None] * (largura - len(linha))
+        for linha in linhas
+    ]
+    return np.fromiter(
+        (vazio if r is None else vocabulario.setdefault(r, len(vocabulario)) for r in chain.from_iterable(completas)),
+        dtype=np.int32,
+        count=len(completas) * largura
+    ).reshape(len(completas), largura)
+
+
+def corrigir_lote(respostas: Sequence[Sequence[str]], corretas: Sequence[str]) -> dict:
+    """Corrigir várias listas de respostas contra a mesma chave
+
+    Mesmas regras de calcular_resultado: compara posição a posição até o fim
+    da lista mais curta e as porcentagens são sobre o número de respostas do
+    aluno. Retorna arrays "acertos", "erros", "percentual_acerto" e "nota"
+    (sem arredondar) na ordem de `respostas`.
+    """
+    if not respostas:
+        vazio = np.zeros(0)
+        return {"acertos": vazio.astype(np.int64), "erros": vazio.astype(np.int64),
+                "percentual_acerto": vazio, "nota": vazio}
+    largura = max(len(corretas), max(len(r) for r in respostas))
+    vocabulario: Dict[str, int] = {}
+    chave = _codificar([corretas], largura, vocabulario, -2)[0]
+    matriz = _codificar(respostas, largura, vocabulario, -1)
+
+    acertos = (matriz == chave[None, :]).sum(axis=1)
+    tamanhos = np.fromiter((len(r) for r in respostas), dtype=np.int64, count=len(respostas))
+    proporcao = np.divide(acertos, tamanhos, out=np.zeros(len(respostas)), where=tamanhos > 0)
+    return {
+        "acertos": acertos,
+        "erros": tamanhos - acertos,
+        "percentual_acerto": proporcao * 100,
+        "nota": proporcao * 10,
+    }
+
+
+def campos_corrigidos(correcao: dict, i: int, chave: Chave) -> dict:
+    """Campos de correção do i-ésimo item de um corrigir_lote, como em calcular_resultado"""
+    return {
+        "chave_id": chave.id,
+        "acertos": int(correcao["acertos"][i]),
+        "erros": int(correcao["erros"][i]),
+        "percentual_acerto": round(float(correcao["percentual_acerto"][i]), 2),
+        "nota": round(float(correcao["nota"][i]), 2),
+    }
+
+
+class FilaRecorrecao:
+    """Recorreções de gabaritos em background, uma de cada vez"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recorrecao")
+        self._lock = threading.Lock()
+        # Última recorreção de cada gabarito (progresso consultado pela API)
+        self._tarefas: Dict[int, dict] = {}
+        self._futures: Dict[int, Future] = {}
+
+    def iniciar(self):
+        """Refazer as recorreções que ficaram pendentes antes de um restart"""
+        for gabarito in storage.gabaritos.listar():
+            if gabarito.get("recorrecao_pendente"):
+                self.agendar(gabarito["id"])
+
+    def agendar(self, gabarito_id: int) -> dict:
+        """Enfileirar a recorreção de um gabarito (uma já na fila é reaproveitada)"""
+        with self._lock:
+            tarefa = self._tarefas.get(gabarito_id)
+            if tarefa is not None and tarefa["status"] == STATUS_NA_FILA:
+                return dict(tarefa)
+            tarefa = self._tarefas[gabarito_id] = {
+                "gabarito_id": gabarito_id,
+                "status": STATUS_NA_FILA,
+                "total": None,
+                "processados": 0,
+                "alterados": 0,
+                "erro": None,
+                "criado_em": datetime.now().isoformat(),
+                "concluido_em": None,
+            }
+            self._futures[gabarito_id] = self._executor.submit(self._executar, tarefa)
+            return dict(tarefa)
+
+    def obter(self, gabarito_id: int) -> Optional[dict]:
+        """Progresso da última recorreção do gabarito
+
+        O progresso detalhado só existe no worker que executa a recorreção;
+        nos outros, o estado vem da marca "recorrecao_pendente" do gabarito.
+        """
+        with self._lock:
+            tarefa = self._tarefas.get(gabarito_id)
+            if tarefa:
+                return dict(tarefa)
+        gabarito = storage.gabaritos.obter(gabarito_id)
+        if gabarito is None or "recorrecao_pendente" not in gabarito:
+            return None
+        return {
+            "gabarito_id": gabarito_id,
+            "status": STATUS_PROCESSANDO if gabarito["recorrecao_pendente"] else STATUS_CONCLUIDO,
+            "total": None,
+            "processados": 0,
+            "alterados": 0,
+            "erro": None,
+            "criado_em": gabarito.get("atualizado_em") or gabarito.get("criado_em"),
+            "concluido_em": None,
+        }
+
+    def aguardar(self, gabarito_id: int, timeout: Optional[float] = None) -> Optional[dict]:
+        """Esperar a recorreção agendada do gabarito terminar"""
+        future = self._futures.get(gabarito_id)
+        if future is not None:
+            future.result(timeout)
+        return self.obter(gabarito_id)
+
+    def _atualizar_tarefa(self, tarefa: dict, **campos):
+        with self._lock:
+            tarefa.update(campos)
+
+    def _executar(self, tarefa: dict):
+        gabarito_id = tarefa["gabarito_id"]
+        self._atualizar_tarefa(tarefa, status=STATUS_PROCESSANDO)
+        try:
+            alterados = self.recorrigir(gabarito_id, tarefa)
+        except Exception as e:
+            self._atualizar_tarefa(tarefa, status=STATUS_FALHOU, erro=str(e),
+                                   concluido_em=datetime.now().isoformat())
+            return
+        self._atualizar_tarefa(tarefa, status=STATUS_CONCLUIDO, alterados=alterados,
+                               concluido_em=datetime.now().isoformat())
+
+    def recorrigir(self, gabarito_id: int, tarefa: Optional[dict] = None) -> int:
+        """Recorrigir todos os resultados do gabarito com a chave atual
+
+        Grava, em um único commit, só os resultados que mudaram e desmarca
+        "recorrecao_pendente". Retorna quantos resultados foram alterados.
+        """
+        chave = versoes_chave.atual(gabarito_id)
+        if chave is None:
+            return 0
+        corretas = list(chave.corretas)
+        resultados = storage.resultados.filtrar(gabarito_id=gabarito_id)
+        if tarefa is not None:
+            self._atualizar_tarefa(tarefa, total=len(resultados))
+
+        correcao = corrigir_lote([respostas_aluno(r) for r in resultados], corretas)
+        operacoes = []
+        for i, resultado in enumerate(resultados):
+            campos = campos_corrigidos(correcao, i, chave)
+            if all(resultado.get(campo) == valor for campo, valor in campos.items()):
+                continue
+            anterior = versoes_chave.obter(resultado.get("chave_id"))
+            if anterior is not None and anterior.alternativas == chave.alternativas:
+                operacoes.append(("atualizar", (resultado["id"], campos)))
+            else:
+                # Alternativas mudaram (ou resultado antigo): regravar as respostas
+                operacoes.append(("substituir", (resultado["id"], {**compactar_resultado(resultado, chave), **campos})))
+        if tarefa is not None:
+            self._atualizar_tarefa(tarefa, processados=len(resultados))
+
+        if operacoes:
+            storage.fila.submeter_lote(storage.resultados, operacoes).result()
+        # Se a chave mudou de novo no meio do caminho, a próxima recorreção desmarca
+        atual = storage.gabaritos.obter(gabarito_id)
+        if atual is not None and list(atual["respostas_corretas"]) == corretas:
+            storage.fila.submeter(storage.gabaritos, "atualizar", gabarito_id, {"recorrecao_pendente": False}).result()
+        return len(operacoes)
+
+
+recorrecao = FilaRecorrecao()
@@ -0,0 +1,262 @@
+"""
+Desempenho por turma e por aluno, em todos os gabaritos, mantido de forma incremental
+
+Como as estatísticas por gabarito (utils_estatisticas), os agregados são
+montados uma vez a partir dos resultados e depois atualizados pelo observador
+da coleção de resultados. Para cada par (turma, gabarito) ficam as notas
+ordenadas dos alunos, de onde saem a posição e o percentil de cada um em
+O(log n); por turma, a soma das notas de cada aluno; por matrícula, as provas
+em que o aluno aparece. As rotas de desempenho só leem esses agregados.
+
+Se um aluno tem mais de um resultado no mesmo gabarito (prova corrigida de
+novo), vale o mais recente (maior id); ao removê-lo, volta a valer o anterior.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import storage
+
+
+def chave_aluno(resultado: dict) -> str:
+    """Aluno de um resultado na turma: a matrícula ou, sem ela, a própria prova"""
+    return resultado["matricula_aluno"] or f"#prova{resultado['prova_id']}"
+
+
+def posicao_e_percentil(notas: List[float], nota: float) -> Tuple[int, float]:
+    """Posição (1 = maior nota; empates dividem a posição) e percentil de `nota` em `notas` (ordenada)"""
+    abaixo = bisect_left(notas, nota)
+    ate = bisect_right(notas, nota)
+    posicao = len(notas) - ate + 1
+    # Percentil de posição: os que ficaram abaixo mais metade dos empatados
+    percentil = 100 * (abaixo + (ate - abaixo) / 2) / len(notas)
+    return posicao, percentil
+
+
+def mediana(notas: List[float]) -> float:
+    """Mediana de uma lista já ordenada"""
+    meio = len(notas) // 2
+    return notas[meio] if len(notas) % 2 else (notas[meio - 1] + notas[meio]) / 2
+
+
+def tendencia(notas: List[float]) -> Optional[float]:
+    """Inclinação da reta de mínimos quadrados das notas, em pontos por prova (None com menos de 2)"""
+    if len(notas) < 2:
+        return None
+    return float(np.polyfit(np.arange(len(notas)), notas, 1)[0])
+
+
+class ProvaTurma:
+    """Notas dos alunos de uma turma em um gabarito
+
+    `resultados` guarda, por aluno, a parte de cada resultado dele
+    (resultado_id -> (nota, percentual, criado_em, nome, matrícula)); a nota
+    que conta é a do maior id. `notas` é a lista ordenada dessas notas.
+    """
+
+    __slots__ = ("resultados", "notas", "soma_nota", "soma_percentual")
+
+    def __init__(self):
+        self.resultados: Dict[str, Dict[int, tuple]] = {}
+        self.notas: List[float] = []
+        self.soma_nota = 0.0
+        self.soma_percentual = 0.0
+
+    def efetivo(self, aluno: str) -> Optional[Tuple[int, tuple]]:
+        """(resultado_id, parte) do resultado que conta para o aluno"""
+        partes = self.resultados.get(aluno)
+        if not partes:
+            return None
+        resultado_id = max(partes)
+        return resultado_id, partes[resultado_id]
+
+    def contar(self, parte: tuple, sinal: int):
+        nota, percentual = parte[0], parte[1]
+        if sinal > 0:
+            insort(self.notas, nota)
+        else:
+            del self.notas[bisect_left(self.notas, nota)]
+        self.soma_nota += sinal * nota
+        self.soma_percentual += sinal * percentual
+
+
+class DesempenhoTurmas:
+    """Agregados por turma e por matrícula, alimentados pelo observador de resultados"""
+
+    def __init__(self, resultados):
+        self._resultados = resultados
+        self._provas: Dict[Tuple[str, int], ProvaTurma] = {}
+        # turma -> gabaritos com resultados dela
+        self._gabaritos_turma: Dict[str, Counter] = {}
+        # turma -> aluno -> [soma das notas, nº de provas, nome, matrícula] (só resultados que contam)
+        self._medias_turma: Dict[str, Dict[str, list]] = {}
+        # matrícula -> (turma, gabarito) -> nº de resultados
+        self._provas_aluno: Dict[str, Counter] = {}
+        # resultado_id -> (turma, gabarito_id, aluno): o que foi somado por id
+        self._origens: Dict[int, Tuple[str, int, str]] = {}
+        self._lock = threading.Lock()
+        self._montado = False
+        resultados.observar(self._ao_mudar)
+
+    def _garantir_montado(self):
+        if self._montado:
+            return
+        with self._lock:
+            if self._montado:
+                return
+            for resultado in self._resultados.listar():
+                self._somar(resultado)
+            self._montado = True
+
+    def _trocar(self, turma: str, prova: ProvaTurma, aluno: str, antes: Optional[tuple], depois: Optional[tuple]):
+        # Só o resultado que conta entra nas notas e nas médias do aluno
+        if antes == depois:
+            return
+        medias = self._medias_turma.setdefault(turma, {})
+        for efetivo, sinal in ((antes, -1), (depois, 1)):
+            if efetivo is None:
+                continue
+            prova.contar(efetivo[1], sinal)
+            media = medias.setdefault(aluno, [0.0, 0, "", ""])
+            media[0] += sinal * efetivo[1][0]
+            media[1] += sinal
+            if sinal > 0:
+                media[2:] = efetivo[1][3:]  # nome e matrícula do último resultado somado
+            if not media[1]:
+                del medias[aluno]
+        if not medias:
+            del self._medias_turma[turma]
+
+    def _somar(self, resultado: dict):
+        self._retirar(resultado)
+        turma, gabarito_id, aluno = resultado["turma_aluno"], resultado["gabarito_id"], chave_aluno(resultado)
+        prova = self._provas.setdefault((turma, gabarito_id), ProvaTurma())
+        antes = prova.efetivo(aluno)
+        prova.resultados.setdefault(aluno, {})[resultado["id"]] = (
+            resultado["nota"], resultado["percentual_acerto"], resultado["criado_em"],
+            resultado["nome_aluno"], resultado["matricula_aluno"],
+        )
+        self._trocar(turma, prova, aluno, antes, prova.efetivo(aluno))
+        self._origens[resultado["id"]] = (turma, gabarito_id, aluno)
+        self._gabaritos_turma.setdefault(turma, Counter())[gabarito_id] += 1
+        if resultado["matricula_aluno"]:
+            self._provas_aluno.setdefault(aluno, Counter())[(turma, gabarito_id)] += 1
+
+    def _retirar(self, resultado: dict):
+        # Pela origem guardada: retira o que foi somado, mesmo que o resultado tenha mudado de turma
+        origem = self._origens.pop(resultado["id"], None)
+        if origem is None:
+            return
+        turma, gabarito_id, aluno = origem
+        prova = self._provas[(turma, gabarito_id)]
+        antes = prova.efetivo(aluno)
+        partes = prova.resultados[aluno]
+        del partes[resultado["id"]]
+        if not partes:
+            del prova.resultados[aluno]
+        self._trocar(turma, prova, aluno, antes, prova.efetivo(aluno))
+        if not prova.resultados:
+            del self._provas[(turma, gabarito_id)]
+        self._descontar(self._gabaritos_turma, turma, gabarito_id)
+        if not aluno.startswith("#prova"):
+            self._descontar(self._provas_aluno, aluno, (turma, gabarito_id))
+
+    @staticmethod
+    def _descontar(indice: Dict[str, Counter], chave: str, item):
+        contagem = indice[chave]
+        contagem[item] -= 1
+        if contagem[item] <= 0:
+            del contagem[item]
+            if not contagem:
+                del indice[chave]
+
+    def _ao_mudar(self, op: str, anterior: Optional[dict], atual: Optional[dict]):
+        with self._lock:
+            if not self._montado:
+                return  # a montagem inicial vai ler o estado já gravado
+            if anterior is not None:
+                self._retirar(anterior)
+            if atual is not None:
+                self._somar(atual)
+
+    def _sincronizado(self):
+        self._garantir_montado()
+        # Resultados gravados por outros workers chegam pelo observador
+        self._resultados.sincronizar()
+
+    def turma(self, turma: str) -> Optional[dict]:
+        """Desempenho de uma turma: cada gabarito e a média de cada aluno, ou None sem resultados"""
+        self._sincronizado()
+        with self._lock:
+            gabaritos = self._gabaritos_turma.get(turma)
+            if not gabaritos:
+                return None
+            provas = []
+            for gabarito_id in gabaritos:
+                prova = self._provas[(turma, gabarito_id)]
+                total = len(prova.notas)
+                provas.append({
+                    "gabarito_id": gabarito_id,
+                    "total_alunos": total,
+                    "media_nota": prova.soma_nota / total,
+                    "media_percentual": prova.soma_percentual / total,
+                    "menor_nota": prova.notas[0],
+                    "maior_nota": prova.notas[-1],
+                    "mediana_nota": mediana(prova.notas),
+                })
+            medias = self._medias_turma[turma].values()
+            ordenadas = sorted(soma / n for soma, n, _, _ in medias)
+            alunos = []
+            for soma, n, nome, matricula in medias:
+                posicao, percentil = posicao_e_percentil(ordenadas, soma / n)
+                alunos.append({
+                    "matricula_aluno": matricula,
+                    "nome_aluno": nome,
+                    "total_provas": n,
+                    "media_nota": soma / n,
+                    "posicao": posicao,
+                    "percentil": percentil,
+                })
+        alunos.sort(key=lambda a: (a["posicao"], a["nome_aluno"]))
+        return {"provas": provas, "alunos": alunos, "media_nota": sum(ordenadas) / len(ordenadas)}
+
+    def aluno(self, matricula: str) -> Optional[dict]:
+        """Histórico de um aluno: nota, posição e percentil na turma em cada gabarito, ou None"""
+        self._sincronizado()
+        with self._lock:
+            chaves = self._provas_aluno.get(matricula)
+            if not chaves:
+                return None
+            provas = []
+            for turma, gabarito_id in chaves:
+                prova = self._provas[(turma, gabarito_id)]
+                resultado_id, parte = prova.efetivo(matricula)
+                posicao, percentil = posicao_e_percentil(prova.notas, parte[0])
+                provas.append({
+                    "gabarito_id": gabarito_id,
+                    "turma_aluno": turma,
+                    "resultado_id": resultado_id,
+                    "nota": parte[0],
+                    "percentual_acerto": parte[1],
+                    "criado_em": parte[2],
+                    "nome_aluno": parte[3],
+                    "posicao": posicao,
+                    "total_turma": len(prova.notas),
+                    "percentil": percentil,
+                    "media_turma": prova.soma_nota / len(prova.notas),
+                })
+        provas.sort(key=lambda p: (p["criado_em"], p["resultado_id"]))
+        notas = [p["nota"] for p in provas]
+        return {
+            "nome_aluno": provas[-1]["nome_aluno"],
+            "media_nota": sum(notas) / len(notas),
+            "tendencia": tendencia(notas),
+            "provas": provas,
+        }
+
+
+desempenho = DesempenhoTurmas(storage.resultados)
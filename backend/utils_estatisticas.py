@@ -0,0 +1,144 @@
+"""
+Estatísticas por gabarito mantidas de forma incremental
+
+Os agregados de cada gabarito (contagem, somas, erros por questão e
+histograma das notas) são montados uma única vez a partir dos resultados
+existentes e, depois, atualizados pelo observador da coleção de resultados
+a cada inserção, atualização ou remoção, em O(questões). A rota de
+estatísticas só lê os agregados, sem percorrer os resultados.
+"""
+
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+import storage
+from utils_respostas import acertos_questoes
+
+# Faixas de 10 pontos percentuais; 100% entra na última
+FAIXAS_HISTOGRAMA = 10
+
+
+def contribuicao(resultado: dict) -> tuple:
+    """Parte de um resultado nos agregados: (acertos, erros, percentual, questões erradas, faixa)"""
+    # Mesma regra da correção: compara até a menor das duas listas
+    erradas = np.flatnonzero(~acertos_questoes(resultado))
+    faixa = int(resultado["percentual_acerto"] // (100 / FAIXAS_HISTOGRAMA))
+    return (
+        resultado["acertos"],
+        resultado["erros"],
+        resultado["percentual_acerto"],
+        erradas,
+        min(max(faixa, 0), FAIXAS_HISTOGRAMA - 1),
+    )
+
+
+class AgregadoGabarito:
+    """Somas e contagens dos resultados de um gabarito
+
+    Guarda a contribuição de cada resultado contado, para retirar
+    exatamente o que foi somado quando ele muda ou é removido.
+    """
+
+    __slots__ = ("contribuicoes", "soma_acertos", "soma_erros", "soma_percentual", "erros_por_questao", "histograma")
+
+    def __init__(self):
+        self.contribuicoes: Dict[int, tuple] = {}
+        self.soma_acertos = 0
+        self.soma_erros = 0
+        self.soma_percentual = 0.0
+        self.erros_por_questao = np.zeros(0, dtype=np.int64)
+        self.histograma = np.zeros(FAIXAS_HISTOGRAMA, dtype=np.int64)
+
+    def _aplicar(self, parte: tuple, sinal: int):
+        acertos, erros, percentual, erradas, faixa = parte
+        self.soma_acertos += sinal * acertos
+        self.soma_erros += sinal * erros
+        self.soma_percentual += sinal * percentual
+        if len(erradas) and erradas[-1] >= len(self.erros_por_questao):
+            self.erros_por_questao = np.pad(
+                self.erros_por_questao, (0, erradas[-1] + 1 - len(self.erros_por_questao))
+            )
+        self.erros_por_questao[erradas] += sinal
+        self.histograma[faixa] += sinal
+
+    def somar(self, resultado_id: int, parte: tuple):
+        self.retirar(resultado_id)
+        self.contribuicoes[resultado_id] = parte
+        self._aplicar(parte, 1)
+
+    def retirar(self, resultado_id: int):
+        parte = self.contribuicoes.pop(resultado_id, None)
+        if parte is not None:
+            self._aplicar(parte, -1)
+
+
+class EstatisticasGabaritos:
+    """Agregados de todos os gabaritos, alimentados pelo observador de resultados"""
+
+    def __init__(self, resultados):
+        self._resultados = resultados
+        self._agregados: Dict[int, AgregadoGabarito] = {}
+        self._lock = threading.Lock()
+        self._montado = False
+        resultados.observar(self._ao_mudar)
+
+    def _garantir_montado(self):
+        if self._montado:
+            return
+        with self._lock:
+            if self._montado:
+                return
+            for resultado in self._resultados.listar():
+                self._somar(resultado)
+            self._montado = True
+
+    # somar/retirar trabalham pela contribuição guardada por id, então uma
+    # mudança gravada enquanto a montagem inicial lia a coleção não é contada duas vezes
+    def _somar(self, resultado: dict):
+        agregado = self._agregados.setdefault(resultado["gabarito_id"], AgregadoGabarito())
+        agregado.somar(resultado["id"], contribuicao(resultado))
+
+    def _retirar(self, resultado: dict):
+        agregado = self._agregados.get(resultado["gabarito_id"])
+        if agregado is not None:
+            agregado.retirar(resultado["id"])
+            if not agregado.contribuicoes:
+                del self._agregados[resultado["gabarito_id"]]
+
+    def _ao_mudar(self, op: str, anterior: Optional[dict], atual: Optional[dict]):
+        with self._lock:
+            if not self._montado:
+                return  # a montagem inicial vai ler o estado já gravado
+            if anterior is not None:
+                self._retirar(anterior)
+            if atual is not None:
+                self._somar(atual)
+
+    def obter(self, gabarito_id: int) -> Optional[dict]:
+        """Estatísticas de um gabarito, ou None se ele não tem resultados"""
+        self._garantir_montado()
+        # Resultados gravados por outros workers chegam pelo observador
+        self._resultados.sincronizar()
+        with self._lock:
+            agregado = self._agregados.get(gabarito_id)
+            if agregado is None:
+                return None
+            total = len(agregado.contribuicoes)
+            erros = agregado.erros_por_questao
+            com_erro = np.flatnonzero(erros > 0)
+            return {
+                "total": total,
+                "media_acertos": agregado.soma_acertos / total,
+                "media_erros": agregado.soma_erros / total,
+                "media_percentual": agregado.soma_percentual / total,
+                # Entre as questões com pelo menos um erro (0 se ninguém errou)
+                "questao_mais_errada": int(com_erro[erros[com_erro].argmax()]) if len(com_erro) else 0,
+                "questao_mais_acertada": int(com_erro[erros[com_erro].argmin()]) if len(com_erro) else 0,
+                "erros_por_questao": erros.tolist(),
+                "histograma_percentual": agregado.histograma.tolist(),
+            }
+
+
+estatisticas = EstatisticasGabaritos(storage.resultados)
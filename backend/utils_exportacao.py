@@ -0,0 +1,76 @@
+"""
+Exportação de resultados em CSV ou NDJSON, em streaming
+
+Os resultados são lidos do storage de EXPORTACAO_LOTE em EXPORTACAO_LOTE
+registros (paginação por cursor) e cada lote vira um pedaço da resposta:
+a memória usada não depende de quantos resultados são exportados e o
+cliente começa a receber linhas imediatamente.
+"""
+
+import csv
+import io
+import json
+import os
+from typing import Iterator, List, Optional
+
+from utils_listagem import percorrer
+from utils_respostas import acertos_questoes
+
+EXPORTACAO_LOTE = int(os.getenv("EXPORTACAO_LOTE", 500))
+
+# Colunas exportadas (mesmos nomes de ResultadoResponse, sem as listas de respostas)
+CAMPOS_EXPORTACAO = (
+    "id", "prova_id", "gabarito_id", "nome_aluno", "matricula_aluno", "turma_aluno",
+    "acertos", "erros", "percentual_acerto", "nota", "criado_em",
+)
+FORMATOS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def acertos_por_questao(resultado: dict, num_questoes: int) -> List[Optional[int]]:
+    """1 (acertou) / 0 (errou) por questão; None além das respostas do aluno"""
+    acertos = acertos_questoes(resultado)[:num_questoes].tolist()
+    return [int(acerto) for acerto in acertos] + [None] * (num_questoes - len(acertos))
+
+
+def _lotes(colecao, ordem: str, decrescente: bool, **kwargs) -> Iterator[List[dict]]:
+    lote = []
+    for resultado in percorrer(colecao, EXPORTACAO_LOTE, ordem, decrescente, **kwargs):
+        lote.append(resultado)
+        if len(lote) >= EXPORTACAO_LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def exportar_csv(colecao, num_questoes: int = 0, ordem: str = "id", decrescente: bool = False, **kwargs) -> Iterator[bytes]:
+    """CSV com cabeçalho; com `num_questoes`, colunas q1..qN de acerto (1/0)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n")
+    escritor.writerow(list(CAMPOS_EXPORTACAO) + [f"q{q + 1}" for q in range(num_questoes)])
+    for lote in _lotes(colecao, ordem, decrescente, **kwargs):
+        for resultado in lote:
+            linha = [resultado.get(campo) for campo in CAMPOS_EXPORTACAO]
+            if num_questoes:
+                linha += ["" if acerto is None else acerto for acerto in acertos_por_questao(resultado, num_questoes)]
+            escritor.writerow(linha)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def exportar_ndjson(colecao, num_questoes: int = 0, ordem: str = "id", decrescente: bool = False, **kwargs) -> Iterator[bytes]:
+    """Um objeto JSON por linha; com `num_questoes`, campo "questoes" com os acertos"""
+    for lote in _lotes(colecao, ordem, decrescente, **kwargs):
+        linhas = []
+        for resultado in lote:
+            objeto = {campo: resultado.get(campo) for campo in CAMPOS_EXPORTACAO}
+            if num_questoes:
+                objeto["questoes"] = acertos_por_questao(resultado, num_questoes)
+            linhas.append(json.dumps(objeto, ensure_ascii=False, separators=(",", ":")))
+        yield ("\n".join(linhas) + "\n").encode("utf-8")
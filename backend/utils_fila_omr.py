@@ -0,0 +1,300 @@
+"""
+Fila de reconhecimento (OMR) das provas enviadas
+
+A leitura das bolhas é CPU-bound, então roda em um ProcessPoolExecutor
+limitado (OMR_WORKERS processos), fora do event loop do uvicorn. O status
+de cada prova fica persistido no próprio registro (campo "status"), o que
+permite reenfileirar na inicialização tudo que não terminou antes de um
+restart. Cada tarefa normaliza a foto (utils_imagens) e lê as bolhas na
+cópia de trabalho. Ao concluir, o resultado da prova é criado automaticamente.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+import storage
+from utils_correcao import (
+    GabaritoNaoEncontrado, montar_resultado, obter_chave,
+    STATUS_CONCLUIDO, STATUS_FALHOU, STATUS_PENDENTES, STATUS_PROCESSANDO
+)
+from utils_imagens import ingerir_e_ler
+from utils_metricas import FALHAS, registrar_etapa
+from utils_omr import CODIGO_BITS_GABARITO
+from utils_workers import cpus_por_worker
+
+# Por worker do uvicorn (padrão: as CPUs divididas entre os workers)
+OMR_WORKERS = int(os.getenv("OMR_WORKERS", cpus_por_worker()))
+
+
+class FilaOMR:
+    """Despacha as provas na fila para o pool de processos"""
+
+    def __init__(self, max_workers: int = OMR_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._pendentes: "queue.Queue[Optional[int]]" = queue.Queue()
+        # Só entrega ao pool quando há um worker livre, para o status
+        # "processing" refletir o que está de fato em execução
+        self._vagas = threading.Semaphore(self.max_workers)
+        # Leituras terminadas no pool, gravadas por uma thread própria: o
+        # callback do Future roda na thread de gerenciamento do pool e não
+        # pode esperar commits
+        self._concluidas: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._despachante: Optional[threading.Thread] = None
+        self._gravador: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Futures de quem está acompanhando uma prova até o fim
+        self._conclusoes: Dict[int, Future] = {}
+
+    def _garantir_iniciada(self):
+        if self._pool is not None:
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._despachante = threading.Thread(
+                    target=self._despachar, name="fila-omr", daemon=True
+                )
+                self._despachante.start()
+                self._gravador = threading.Thread(
+                    target=self._gravar_concluidas, name="fila-omr-leituras", daemon=True
+                )
+                self._gravador.start()
+
+    def iniciar(self, reenfileirar: bool = True):
+        """Subir o pool e reenfileirar as provas que ficaram pendentes
+
+        Com vários workers, só um reenfileira (`reenfileirar=False` nos demais).
+        """
+        self._garantir_iniciada()
+        if not reenfileirar:
+            return
+        for prova in storage.provas.listar():
+            if prova.get("status") in STATUS_PENDENTES:
+                self._pendentes.put(prova["id"])
+
+    def parar(self):
+        """Encerrar o pool (as provas pendentes continuam persistidas)"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self._pendentes.put(None)  # acordar o despachante para ele encerrar
+                self._concluidas.put(None)
+
+    def enfileirar(self, prova_id: int):
+        """Colocar uma prova (já gravada com status "queued") na fila"""
+        self._garantir_iniciada()
+        self._pendentes.put(prova_id)
+
+    def pendentes(self) -> int:
+        """Provas na fila deste worker aguardando o despacho"""
+        return self._pendentes.qsize()
+
+    def acompanhar(self, prova_id: int) -> Future:
+        """Future que resolve com a prova quando ela chegar a done/failed"""
+        with self._lock:
+            future = self._conclusoes.get(prova_id)
+            if future is None:
+                future = self._conclusoes[prova_id] = Future()
+        prova = storage.provas.obter(prova_id)
+        if prova is None or prova.get("status") not in STATUS_PENDENTES:
+            self._notificar(prova_id, prova)
+        return future
+
+    # ===== EXECUÇÃO =====
+    def _notificar(self, prova_id: int, prova: Optional[dict]):
+        with self._lock:
+            future = self._conclusoes.pop(prova_id, None)
+        if future is not None and not future.done():
+            future.set_result(prova)
+
+    def _atualizar_prova(self, prova_id: int, campos: dict):
+        prova = storage.fila.submeter(storage.provas, "atualizar", prova_id, campos).result()
+        if campos.get("status") in (STATUS_CONCLUIDO, STATUS_FALHOU):
+            self._notificar(prova_id, prova)
+
+    def _despachar(self):
+        while True:
+            prova_id = self._pendentes.get()
+            if prova_id is None:
+                return
+            try:
+                if not self._despachar_prova(prova_id):
+                    return
+            except Exception as e:
+                # Erro de storage em uma prova não pode derrubar o despachante
+                self._falhar(prova_id, e)
+
+    def _despachar_prova(self, prova_id: int) -> bool:
+        """Ler (ou entregar ao pool) uma prova da fila; False se o pool foi encerrado"""
+        prova = storage.provas.obter(prova_id)
+        if prova is None:
+            self._notificar(prova_id, None)
+            return True  # removida enquanto esperava
+        gabarito = storage.gabaritos.obter(prova["gabarito_id"])
+        if not gabarito or not gabarito.get("layout_path"):
+            self._atualizar_prova(prova_id, {
+                "status": STATUS_FALHOU,
+                "erro": "Gabarito sem layout de folha para leitura"
+            })
+            return True
+
+        # Mesma imagem já lida para este gabarito: reaproveitar a leitura
+        leitura = self._leitura_existente(prova)
+        if leitura is not None:
+            self._registrar_leitura(prova_id, leitura)
+            return True
+
+        self._vagas.acquire()
+        pool = self._pool
+        if pool is None:
+            # Pool encerrado: a prova continua "queued" para o próximo start
+            self._vagas.release()
+            return False
+        try:
+            self._atualizar_prova(prova_id, {"status": STATUS_PROCESSANDO})
+            future = pool.submit(
+                ingerir_e_ler, prova["imagem_url"], prova.get("imagem_hash"), gabarito["layout_path"]
+            )
+        except Exception:
+            self._vagas.release()
+            raise
+        future.add_done_callback(
+            lambda f, prova_id=prova_id: self._ao_terminar(prova_id, f)
+        )
+        return True
+
+    def _falhar(self, prova_id: int, erro: Exception):
+        """Marcar a prova como "failed" depois de um erro inesperado"""
+        print(f"Erro na leitura da prova {prova_id}: {erro}")
+        FALHAS.inc(etapa="omr")
+        try:
+            self._atualizar_prova(prova_id, {"status": STATUS_FALHOU, "erro": str(erro)})
+        except Exception as e:
+            print(f"Erro ao marcar a prova {prova_id} como falha: {e}")
+            self._notificar(prova_id, None)
+
+    def _leitura_existente(self, prova: dict) -> Optional[dict]:
+        """Leitura já feita da mesma imagem (mesmo hash) para o mesmo gabarito"""
+        if not prova.get("imagem_hash"):
+            return None
+        for outra in storage.provas.filtrar(imagem_hash=prova["imagem_hash"]):
+            if (
+                outra["id"] != prova["id"]
+                and outra["gabarito_id"] == prova["gabarito_id"]
+                and outra.get("status") == STATUS_CONCLUIDO
+            ):
+                codigo = outra.get("folha_codigo")
+                return {
+                    "respostas": outra["respostas_detectadas"],
+                    "em_branco": outra.get("questoes_em_branco") or [],
+                    "multiplas": outra.get("questoes_multiplas") or [],
+                    "codigo": (prova["gabarito_id"] % (1 << CODIGO_BITS_GABARITO), codigo) if codigo else None,
+                    "imagens": {
+                        "trabalho": outra.get("imagem_trabalho"),
+                        "miniatura": outra.get("imagem_miniatura"),
+                    },
+                }
+        return None
+
+    def _ao_terminar(self, prova_id: int, future: Future):
+        # Thread de gerenciamento do pool: só libera a vaga e repassa
+        self._vagas.release()
+        self._concluidas.put((prova_id, future))
+
+    def _gravar_concluidas(self):
+        while True:
+            item = self._concluidas.get()
+            if item is None:
+                return
+            prova_id, future = item
+            try:
+                self._concluir(prova_id, future)
+            except Exception as e:
+                self._falhar(prova_id, e)
+
+    def _concluir(self, prova_id: int, future: Future):
+        if future.cancelled():
+            return  # shutdown: fica "processing" e é reenfileirada no próximo start
+        try:
+            leitura = future.result()
+        except Exception as e:
+            FALHAS.inc(etapa="omr")
+            self._atualizar_prova(prova_id, {"status": STATUS_FALHOU, "erro": str(e)})
+            return
+        for etapa, segundos in leitura.get("tempos", {}).items():
+            registrar_etapa(etapa, segundos)
+        self._registrar_leitura(prova_id, leitura)
+
+    def _aluno_da_folha(self, prova: dict, codigo) -> Optional[dict]:
+        """Aluno de uma folha personalizada, pelo código lido na faixa
+
+        Levanta ValueError se a folha foi impressa para outro gabarito.
+        """
+        if not codigo:
+            return None
+        gabarito_codigo, folha_codigo = codigo
+        if gabarito_codigo != prova["gabarito_id"] % (1 << CODIGO_BITS_GABARITO):
+            raise ValueError("Folha impressa para outro gabarito")
+        gabarito = storage.gabaritos.obter(prova["gabarito_id"]) or {}
+        for folha in gabarito.get("folhas") or []:
+            if folha["codigo"] == folha_codigo:
+                return {
+                    "nome_aluno": folha["nome_aluno"],
+                    "matricula_aluno": folha["matricula_aluno"],
+                    "turma_aluno": folha["turma_aluno"],
+                    "folha_codigo": folha_codigo,
+                }
+        return None
+
+    def _registrar_leitura(self, prova_id: int, leitura: dict):
+        """Gravar as respostas lidas e criar o resultado da prova"""
+        prova = storage.provas.obter(prova_id)
+        if prova is None:
+            self._notificar(prova_id, None)
+            return
+        campos = {
+            "respostas_detectadas": leitura["respostas"],
+            "questoes_em_branco": leitura["em_branco"],
+            "questoes_multiplas": leitura["multiplas"],
+            "status": STATUS_CONCLUIDO,
+            "erro": None,
+        }
+        imagens = leitura.get("imagens") or {}
+        if imagens.get("trabalho"):
+            campos["imagem_trabalho"] = imagens["trabalho"]
+            campos["imagem_miniatura"] = imagens["miniatura"]
+        # Folha personalizada: o aluno vem do código impresso, não do formulário
+        try:
+            aluno = self._aluno_da_folha(prova, leitura.get("codigo"))
+        except ValueError as e:
+            self._atualizar_prova(prova_id, {**campos, "status": STATUS_FALHOU, "erro": str(e)})
+            return
+        if aluno:
+            campos.update(aluno)
+            prova = {**prova, **aluno}
+        try:
+            # Reprocessamento após restart: não duplicar o resultado
+            existente = storage.resultados.filtrar(prova_id=prova_id)
+            if existente:
+                resultado = existente[0]
+            else:
+                resultado = storage.fila.submeter(
+                    storage.resultados, "inserir",
+                    montar_resultado(prova, obter_chave(prova["gabarito_id"]), leitura["respostas"])
+                ).result()
+            campos["resultado_id"] = resultado["id"]
+        except GabaritoNaoEncontrado as e:
+            campos.update({"status": STATUS_FALHOU, "erro": str(e)})
+        self._atualizar_prova(prova_id, campos)
+
+
+fila_omr = FilaOMR()
@@ -0,0 +1,132 @@
+"""
+Folhas de resposta personalizadas de uma turma, em um único PDF
+
+Cada folha (com nome, matrícula e a faixa de código do aluno) é desenhada
+em um ProcessPoolExecutor (FOLHAS_WORKERS processos) e o PDF é escrito
+página a página, na ordem da lista de alunos, conforme as folhas ficam
+prontas: a resposta começa a ser enviada antes de a turma inteira ter sido
+renderizada e o PDF nunca fica inteiro em memória.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils_gabarito import renderizar_folha_aluno
+from utils_workers import cpus_por_worker
+
+# Por worker do uvicorn (padrão: as CPUs divididas entre os workers)
+FOLHAS_WORKERS = int(os.getenv("FOLHAS_WORKERS", cpus_por_worker()))
+# Largura da página no PDF, em pontos (A4 paisagem); a altura segue a proporção da folha
+PDF_LARGURA_PT = 842
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def obter_pool() -> ProcessPoolExecutor:
+    """Pool de processos de renderização (criado no primeiro uso)"""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(1, FOLHAS_WORKERS),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def encerrar_pool():
+    """Encerrar o pool de renderização (shutdown da aplicação)"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def identificacao_aluno(aluno: dict) -> List[str]:
+    """Linhas impressas no lugar do subtítulo da folha"""
+    return [
+        f"Nome: {aluno['nome_aluno']}",
+        f"Matrícula: {aluno.get('matricula_aluno') or '-'}   Turma: {aluno.get('turma_aluno') or '-'}",
+    ]
+
+
+def _renderizar(tarefa: Tuple[dict, List[str], int, int]) -> bytes:
+    return renderizar_folha_aluno(*tarefa)
+
+
+def escrever_pdf(paginas: Iterator[bytes], tamanho_px: Tuple[int, int]) -> Iterator[bytes]:
+    """Montar um PDF com uma imagem JPEG em tons de cinza por página
+
+    Escreve cada página assim que ela chega; a árvore de páginas e a tabela
+    xref vão no final, quando todos os offsets são conhecidos.
+    """
+    largura_px, altura_px = tamanho_px
+    largura_pt = PDF_LARGURA_PT
+    altura_pt = round(PDF_LARGURA_PT * altura_px / largura_px, 2)
+    offsets: Dict[int, int] = {}
+    posicao = 0
+
+    def objeto(numero: int, conteudo: bytes) -> bytes:
+        nonlocal posicao
+        offsets[numero] = posicao
+        dados = f"{numero} 0 obj\n".encode() + conteudo + b"\nendobj\n"
+        posicao += len(dados)
+        return dados
+
+    cabecalho = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    posicao += len(cabecalho)
+    yield cabecalho
+
+    # 1 = catálogo, 2 = árvore de páginas; cada página usa 3 objetos a partir do 3
+    paginas_ids = []
+    for i, jpeg in enumerate(paginas):
+        imagem_id, conteudo_id, pagina_id = 3 + 3 * i, 4 + 3 * i, 5 + 3 * i
+        desenho = f"q {largura_pt} 0 0 {altura_pt} 0 0 cm /Im0 Do Q".encode()
+        yield objeto(imagem_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {largura_px} /Height {altura_px} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /DCTDecode "
+            f"/Length {len(jpeg)} >>\nstream\n"
+        ).encode() + jpeg + b"\nendstream")
+        yield objeto(conteudo_id, f"<< /Length {len(desenho)} >>\nstream\n".encode() + desenho + b"\nendstream")
+        yield objeto(pagina_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {largura_pt} {altura_pt}] "
+            f"/Resources << /XObject << /Im0 {imagem_id} 0 R >> >> /Contents {conteudo_id} 0 R >>"
+        ).encode())
+        paginas_ids.append(pagina_id)
+
+    kids = " ".join(f"{p} 0 R" for p in paginas_ids)
+    yield objeto(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(paginas_ids)} >>".encode())
+    yield objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    total = max(offsets) + 1
+    xref = [f"xref\n0 {total}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[n]:010d} 00000 n \n" for n in range(1, total)]
+    xref.append(f"trailer\n<< /Size {total} /Root 1 0 R >>\nstartxref\n{posicao}\n%%EOF\n")
+    yield "".join(xref).encode()
+
+
+def gerar_pdf_folhas(
+    parametros: dict,
+    gabarito_id: int,
+    alunos: List[dict],
+    tamanho_px: Tuple[int, int]
+) -> Iterator[bytes]:
+    """PDF (em partes) com uma folha por aluno, renderizadas em paralelo
+
+    `alunos` precisam ter "codigo" (atribuído no gabarito) além de
+    nome_aluno / matricula_aluno / turma_aluno.
+    """
+    tarefas = [
+        (parametros, identificacao_aluno(aluno), gabarito_id, aluno["codigo"])
+        for aluno in alunos
+    ]
+    chunksize = max(1, len(tarefas) // (4 * max(1, FOLHAS_WORKERS)))
+    # map devolve na ordem dos alunos; fechar o gerador cancela o que falta
+    paginas = obter_pool().map(_renderizar, tarefas, chunksize=chunksize)
+    yield from escrever_pdf(paginas, tamanho_px)
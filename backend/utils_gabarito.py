@@ -4,9 +4,183 @@ Adaptado do código fornecido
 """
 
 from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import inspect
+import io
+import json
 import math
 import os
+import tempfile
+import threading
+import numpy as np
 from datetime import datetime
+from typing import List, Optional, Tuple
+from utils_metricas import medir_etapa
+from utils_omr import binarizar, medir_preenchimento, codificar_codigo, CODIGO_BITS
+
+# Marcas de alinhamento (quadrados pretos nos cantos) usadas pelo OMR
+FIDUCIAL_SIZE = 24
+FIDUCIAL_OFFSET = 6
+
+# Faixa de identificação (folhas personalizadas): barras na margem esquerda,
+# entre as marcas de alinhamento; barras não são quadradas, então nunca se
+# confundem com as marcas
+CODIGO_BARRA = (24, 8)  # largura, altura
+CODIGO_PASSO = 20
+CODIGO_TOPO = 2 * FIDUCIAL_OFFSET + FIDUCIAL_SIZE + 20
+
+# Identificação do aluno nas folhas personalizadas (área do subtítulo)
+IDENTIFICACAO_LARGURA = 500
+IDENTIFICACAO_FONTE_MAX = 32
+IDENTIFICACAO_FONTE_MIN = 14
+
+DEFAULT_FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+# Cache de folhas renderizadas (memória e disco), limitado em bytes
+CACHE_FOLHAS_MEMORIA_MB = float(os.getenv("CACHE_FOLHAS_MEMORIA_MB", 32))
+CACHE_FOLHAS_DISCO_MB = float(os.getenv("CACHE_FOLHAS_DISCO_MB", 256))
+CACHE_FOLHAS_DIR = os.path.join("gabaritos_gerados", "cache")
+# Mudar quando o desenho da folha mudar, para invalidar o cache
+VERSAO_RENDER = 2
+
+def layout_path_para(filename: str) -> str:
+    """Caminho do descritor de layout que acompanha um PNG de gabarito"""
+    return os.path.splitext(filename)[0] + ".layout.json"
+
+@lru_cache(maxsize=8)
+def carregar_fontes(font_path: Optional[str] = None) -> tuple:
+    """Fontes (título, subtítulo, questão, alternativa), carregadas uma vez por processo"""
+    try:
+        if font_path is None:
+            font_path = DEFAULT_FONT_PATH
+        
+        if not os.path.exists(font_path):
+            # Fallback para Windows/Mac
+            default = ImageFont.load_default()
+            return default, default, default, default
+        return (
+            ImageFont.truetype(font_path, 80),
+            ImageFont.truetype(font_path, 48),
+            ImageFont.truetype(font_path, 36),
+            ImageFont.truetype(font_path, 48),
+        )
+    except Exception:
+        default = ImageFont.load_default()
+        return default, default, default, default
+
+@lru_cache(maxsize=32)
+def carregar_fonte(font_path: Optional[str], tamanho: int):
+    """Uma fonte em um tamanho qualquer (cacheada por processo)"""
+    try:
+        return ImageFont.truetype(font_path or DEFAULT_FONT_PATH, tamanho)
+    except Exception:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=4096)
+def medir_texto(fonte, texto: str) -> Tuple[int, int, int, int]:
+    """Bounding box de `texto` na `fonte` (mesmo valor de draw.textbbox em (0, 0))"""
+    return fonte.getbbox(texto)
+
+def gravar_atomico(caminho: str, dados: bytes):
+    """Gravar em arquivo temporário e renomear: um leitor (outra thread ou
+    worker) nunca vê o arquivo pela metade"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(caminho) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+        os.replace(tmp_path, caminho)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class CacheFolhas:
+    """Cache LRU de folhas renderizadas (PNG + layout), em memória e em disco
+
+    A chave é o hash de todos os parâmetros de desenho, então folhas com os
+    mesmos parâmetros são renderizadas uma única vez.
+    """
+
+    def __init__(self, diretorio: str, max_memoria: int, max_disco: int):
+        self.diretorio = diretorio
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self._memoria: "OrderedDict[str, Tuple[bytes, dict]]" = OrderedDict()
+        self._bytes_memoria = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def chave(**parametros) -> str:
+        conteudo = json.dumps({**parametros, "versao": VERSAO_RENDER}, sort_keys=True, default=list)
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def _caminhos(self, chave: str) -> Tuple[str, str]:
+        png_path = os.path.join(self.diretorio, chave + ".png")
+        return png_path, layout_path_para(png_path)
+
+    def obter(self, chave: str) -> Optional[Tuple[bytes, dict]]:
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                self._memoria.move_to_end(chave)
+                return item
+        png_path, layout_path = self._caminhos(chave)
+        try:
+            with open(png_path, "rb") as f:
+                png = f.read()
+            with open(layout_path, "r", encoding="utf-8") as f:
+                layout = json.load(f)
+            os.utime(png_path)  # marca de uso para a evicção do disco
+        except (OSError, ValueError):
+            return None
+        if not png.startswith(b"\x89PNG"):
+            return None  # arquivo gravado pela metade antes das gravações atômicas
+        self._guardar_memoria(chave, png, layout)
+        return png, layout
+
+    def guardar(self, chave: str, png: bytes, layout: dict):
+        self._guardar_memoria(chave, png, layout)
+        os.makedirs(self.diretorio, exist_ok=True)
+        png_path, layout_path = self._caminhos(chave)
+        # Layout por último: obter() só encontra o par quando o PNG já está completo
+        gravar_atomico(png_path, png)
+        gravar_atomico(layout_path, json.dumps(layout).encode("utf-8"))
+        self._evictar_disco()
+
+    def _guardar_memoria(self, chave: str, png: bytes, layout: dict):
+        with self._lock:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                return
+            self._memoria[chave] = (png, layout)
+            self._bytes_memoria += len(png)
+            while self._bytes_memoria > self.max_memoria and len(self._memoria) > 1:
+                _, (antigo, _) = self._memoria.popitem(last=False)
+                self._bytes_memoria -= len(antigo)
+
+    def _evictar_disco(self):
+        """Remover os PNGs usados há mais tempo até caber no limite"""
+        arquivos = []
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith(".png"):
+                caminho = os.path.join(self.diretorio, nome)
+                info = os.stat(caminho)
+                arquivos.append((info.st_mtime, info.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.max_disco:
+                break
+            for path in (caminho, layout_path_para(caminho)):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= tamanho
+
+cache_folhas = CacheFolhas(
+    CACHE_FOLHAS_DIR,
+    max_memoria=int(CACHE_FOLHAS_MEMORIA_MB * 1024 * 1024),
+    max_disco=int(CACHE_FOLHAS_DISCO_MB * 1024 * 1024)
+)
 
 def generate_gabarito_png(
     filename: str = "gabarito.png",
@@ -21,6 +195,10 @@ def generate_gabarito_png(
 ) -> str:
     """
     Gera um gabarito em PNG com bolhas para preenchimento
+
+    Junto do PNG é gravado o descritor de layout (ver layout_path_para) com
+    os centros das bolhas, diâmetro, colunas, marcas de alinhamento e o
+    preenchimento da folha em branco, usado por utils_omr para ler a folha.
     
     Args:
         filename: nome do arquivo de saída
@@ -36,28 +214,53 @@ def generate_gabarito_png(
     Returns:
         Caminho do arquivo gerado
     """
-    
-    try:
-        if font_path is None:
-            font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-        
-        if not os.path.exists(font_path):
-            # Fallback para Windows/Mac
-            font_path = None
-            title_font = ImageFont.load_default()
-            subtitle_font = ImageFont.load_default()
-            q_font = ImageFont.load_default()
-            choice_font = ImageFont.load_default()
-        else:
-            title_font = ImageFont.truetype(font_path, 80)
-            subtitle_font = ImageFont.truetype(font_path, 48)
-            q_font = ImageFont.truetype(font_path, 36)
-            choice_font = ImageFont.truetype(font_path, 48)
-    except Exception:
-        title_font = ImageFont.load_default()
-        subtitle_font = ImageFont.load_default()
-        q_font = ImageFont.load_default()
-        choice_font = ImageFont.load_default()
+    parametros = dict(
+        num_questions=num_questions,
+        choices=tuple(choices),
+        margin=margin,
+        spacing_y=spacing_y,
+        bubble_diameter=bubble_diameter,
+        title=title,
+        subtitle=subtitle,
+        font_path=font_path
+    )
+    # Folha idêntica já renderizada: só copiar
+    chave = CacheFolhas.chave(**parametros)
+    em_cache = cache_folhas.obter(chave)
+    if em_cache is None:
+        with medir_etapa("png_renderizacao"):
+            em_cache = _renderizar_gabarito(**parametros)
+        cache_folhas.guardar(chave, *em_cache)
+    png, layout = em_cache
+
+    gravar_atomico(filename, png)
+    gravar_atomico(layout_path_para(filename), json.dumps(layout).encode("utf-8"))
+    return filename
+
+def _renderizar_gabarito(**parametros) -> Tuple[bytes, dict]:
+    """Desenhar a folha; retorna (bytes do PNG, descritor de layout)"""
+    img, layout = _desenhar_gabarito(**parametros)
+    # Preenchimento da folha em branco (letras e contornos dentro das bolhas)
+    cinza = np.asarray(img.convert("L"))
+    layout["preenchimento_base"] = medir_preenchimento(binarizar(cinza), layout).round(4).tolist()
+
+    # Salvar com qualidade
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", dpi=(300, 300))
+    return buffer.getvalue(), layout
+
+def _desenhar_gabarito(
+    num_questions: int,
+    choices: tuple,
+    margin: int,
+    spacing_y: int,
+    bubble_diameter: int,
+    title: str,
+    subtitle: str,
+    font_path: Optional[str]
+) -> Tuple[Image.Image, dict]:
+    """Desenhar a folha em memória; retorna (imagem, layout sem o preenchimento base)"""
+    title_font, subtitle_font, q_font, choice_font = carregar_fontes(font_path)
 
     # Calcular layout
     if num_questions > 10:
@@ -81,12 +284,13 @@ def generate_gabarito_png(
     col_width = (w - 2*margin) / columns
     row_height = min(spacing_y + bubble_diameter, usable_height / rows_per_col)
 
+    bubbles = []  # centros (x, y) das bolhas de cada questão, na ordem de choices
     q = 1
     for col in range(columns):
         x0 = margin + col * col_width
         x_question_num = x0
         
-        temp_bbox = draw.textbbox((0, 0), f"{q:02d}.", font=q_font)
+        temp_bbox = medir_texto(q_font, f"{q:02d}.")
         q_text_width = temp_bbox[2] - temp_bbox[0]
         x_choices_start = x_question_num + q_text_width + 10
 
@@ -98,9 +302,11 @@ def generate_gabarito_png(
             draw.text((x_question_num, y), f"{q:02d}.", font=q_font, fill="black")
             
             # Desenhar bolhas
+            centros = []
             for i, ch in enumerate(choices):
                 cx = int(x_choices_start + i * (bubble_diameter + 20))
                 cy = int(y + (bubble_diameter/4) - bubble_diameter/2)
+                centros.append([cx + bubble_diameter / 2, cy + bubble_diameter / 2])
                 
                 # Desenhar círculo
                 draw.ellipse(
@@ -110,7 +316,7 @@ def generate_gabarito_png(
                 )
                 
                 # Adicionar letra
-                bbox = draw.textbbox((0, 0), ch, font=choice_font)
+                bbox = medir_texto(choice_font, ch)
                 w_ch = bbox[2] - bbox[0]
                 h_ch = bbox[3] - bbox[1]
                 
@@ -118,6 +324,7 @@ def generate_gabarito_png(
                 ty = cy + (bubble_diameter - h_ch) / 2 - 1
                 draw.text((tx, ty), ch, font=choice_font, fill="black")
             
+            bubbles.append(centros)
             q += 1
 
     # Adicionar footer
@@ -125,9 +332,117 @@ def generate_gabarito_png(
     draw.text((w - margin - 500, h - margin - 15), subtitle, font=subtitle_font, fill="black")
     draw.text((w - margin - 500, h - margin), footer_text, font=subtitle_font, fill="black")
 
-    # Salvar com qualidade
-    img.save(filename, dpi=(300, 300))
-    return filename
+    fiducials = _desenhar_marcas(draw, page_size)
+
+    layout = {
+        "page_size": list(page_size),
+        "num_questions": num_questions,
+        "choices": list(choices),
+        "columns": columns,
+        "rows_per_col": rows_per_col,
+        "bubble_diameter": bubble_diameter,
+        "bubbles": bubbles,
+        "fiducials": fiducials,  # TL, TR, BR, BL
+        "fiducial_size": FIDUCIAL_SIZE,
+        "codigo": {
+            "celulas": celulas_codigo(page_size),
+            "largura": CODIGO_BARRA[0],
+            "altura": CODIGO_BARRA[1],
+        },
+    }
+    return img, layout
+
+def _desenhar_marcas(draw: ImageDraw.ImageDraw, page_size: tuple) -> list:
+    """Marcas de alinhamento nos cantos (com borda branca para ficarem isoladas)"""
+    w, h = page_size
+    fiducials = []
+    for fx, fy in (
+        (FIDUCIAL_OFFSET, FIDUCIAL_OFFSET),
+        (w - FIDUCIAL_OFFSET - FIDUCIAL_SIZE, FIDUCIAL_OFFSET),
+        (w - FIDUCIAL_OFFSET - FIDUCIAL_SIZE, h - FIDUCIAL_OFFSET - FIDUCIAL_SIZE),
+        (FIDUCIAL_OFFSET, h - FIDUCIAL_OFFSET - FIDUCIAL_SIZE),
+    ):
+        draw.rectangle(
+            [fx - FIDUCIAL_OFFSET, fy - FIDUCIAL_OFFSET,
+             fx + FIDUCIAL_SIZE + FIDUCIAL_OFFSET, fy + FIDUCIAL_SIZE + FIDUCIAL_OFFSET],
+            fill="white"
+        )
+        draw.rectangle([fx, fy, fx + FIDUCIAL_SIZE - 1, fy + FIDUCIAL_SIZE - 1], fill="black")
+        fiducials.append([fx + FIDUCIAL_SIZE / 2, fy + FIDUCIAL_SIZE / 2])
+    return fiducials
+
+def celulas_codigo(page_size: tuple) -> list:
+    """Centros das barras da faixa de identificação, na ordem dos bits"""
+    x = FIDUCIAL_OFFSET + 2 + CODIGO_BARRA[0] / 2
+    return [
+        [x, CODIGO_TOPO + i * CODIGO_PASSO + CODIGO_BARRA[1] / 2]
+        for i in range(CODIGO_BITS)
+    ]
+
+def _parametros_padrao() -> dict:
+    """Valores padrão dos parâmetros de desenho de generate_gabarito_png"""
+    return {
+        nome: parametro.default
+        for nome, parametro in inspect.signature(generate_gabarito_png).parameters.items()
+        if nome != "filename"
+    }
+
+@lru_cache(maxsize=4)
+def _folha_base(parametros_json: str) -> Image.Image:
+    """Folha sem subtítulo, desenhada uma vez por processo e copiada por aluno"""
+    parametros = json.loads(parametros_json)
+    parametros["choices"] = tuple(parametros["choices"])
+    img, _ = _desenhar_gabarito(**{**parametros, "subtitle": ""})
+    return img
+
+def renderizar_folha_aluno(
+    parametros: dict,
+    identificacao: List[str],
+    gabarito_id: int,
+    codigo: int,
+    qualidade_jpeg: int = 90
+) -> bytes:
+    """Folha personalizada de um aluno, em JPEG (para montar o PDF)
+
+    Igual à folha do gabarito (mesmas bolhas, mesmo layout), com as linhas de
+    `identificacao` no lugar do subtítulo e a faixa de código na margem
+    esquerda. `parametros` são os mesmos de generate_gabarito_png.
+    Roda nos processos do pool de utils_folhas.
+    """
+    parametros = {**_parametros_padrao(), **parametros}
+    base = _folha_base(json.dumps(parametros, sort_keys=True, default=list))
+    img = base.copy()
+    draw = ImageDraw.Draw(img)
+    w, h = img.size
+    margin = parametros["margin"]
+
+    # Identificação logo acima do rodapé, com a fonte reduzida até caber
+    x = w - margin - IDENTIFICACAO_LARGURA
+    tamanho = IDENTIFICACAO_FONTE_MAX
+    while True:
+        fonte = carregar_fonte(parametros["font_path"], tamanho)
+        caixas = [medir_texto(fonte, linha) for linha in identificacao]
+        if tamanho <= IDENTIFICACAO_FONTE_MIN or max(b[2] for b in caixas) <= IDENTIFICACAO_LARGURA:
+            break
+        tamanho -= 2
+    y = h - margin - 15
+    for linha, caixa in zip(reversed(identificacao), reversed(caixas)):
+        y -= caixa[3] + 6
+        draw.text((x, y), linha, font=fonte, fill="black")
+
+    largura, altura = CODIGO_BARRA
+    for (cx, cy), bit in zip(celulas_codigo(img.size), codificar_codigo(gabarito_id, codigo)):
+        if bit:
+            draw.rectangle(
+                [cx - largura / 2, cy - altura / 2, cx + largura / 2 - 1, cy + altura / 2 - 1],
+                fill="black"
+            )
+    # Nada desenhado depois da folha base pode invadir as marcas de alinhamento
+    _desenhar_marcas(draw, img.size)
+
+    buffer = io.BytesIO()
+    img.convert("L").save(buffer, format="JPEG", quality=qualidade_jpeg)
+    return buffer.getvalue()
 
 def create_gabaritos_directory():
     """Criar diretório para armazenar gabaritos gerados"""
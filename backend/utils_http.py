@@ -0,0 +1,114 @@
+"""
+Respostas HTTP com validação condicional (ETag / If-None-Match) e Range
+
+O Starlette da versão fixada em requirements.txt não responde 304 nem 206
+sozinho, então os arquivos servidos pela API (folhas de gabarito, imagens)
+passam por aqui.
+"""
+
+import os
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeInvalido(Exception):
+    """Cabeçalho Range fora do tamanho do arquivo"""
+
+
+def etag_arquivo(caminho: str) -> str:
+    """ETag forte a partir do tamanho e da data de modificação do arquivo"""
+    info = os.stat(caminho)
+    return f'"{info.st_size:x}-{info.st_mtime_ns:x}"'
+
+
+def etag_confere(request: Request, etag: str) -> bool:
+    """Se o If-None-Match da requisição já inclui `etag` (cliente tem a versão atual)"""
+    cabecalho = request.headers.get("if-none-match")
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    valor = etag.removeprefix("W/")
+    return any(parte.strip().removeprefix("W/") == valor for parte in cabecalho.split(","))
+
+
+def intervalo_pedido(request: Request, tamanho: int, etag: str) -> Optional[Tuple[int, int]]:
+    """Intervalo (início, fim inclusivo) pedido em Range, ou None para o arquivo inteiro
+
+    Só um intervalo por requisição é atendido; pedidos com vários intervalos
+    ou com If-Range desatualizado recebem o arquivo inteiro.
+    """
+    cabecalho = request.headers.get("range")
+    if not cabecalho or not cabecalho.startswith("bytes="):
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        return None
+    especificacao = cabecalho[len("bytes="):].strip()
+    if "," in especificacao:
+        return None
+    inicio_txt, _, fim_txt = especificacao.partition("-")
+    try:
+        if inicio_txt:
+            inicio = int(inicio_txt)
+            fim = min(int(fim_txt), tamanho - 1) if fim_txt else tamanho - 1
+        else:
+            # "bytes=-N": os últimos N bytes
+            sufixo = int(fim_txt)
+            if sufixo <= 0:
+                raise RangeInvalido()
+            inicio, fim = max(tamanho - sufixo, 0), tamanho - 1
+    except ValueError:
+        return None
+    if inicio >= tamanho or inicio > fim:
+        raise RangeInvalido()
+    return inicio, fim
+
+
+def _ler_intervalo(caminho: str, inicio: int, fim: int):
+    with open(caminho, "rb") as f:
+        f.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            bloco = f.read(min(CHUNK_SIZE, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
+
+
+def servir_arquivo(request: Request, caminho: str, media_type: str, cache_control: str) -> Response:
+    """Servir um arquivo com ETag, Cache-Control, 304 e 206 (Range)"""
+    etag = etag_arquivo(caminho)
+    cabecalhos = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if etag_confere(request, etag):
+        return Response(status_code=304, headers=cabecalhos)
+
+    tamanho = os.path.getsize(caminho)
+    try:
+        intervalo = intervalo_pedido(request, tamanho, etag)
+    except RangeInvalido:
+        return Response(status_code=416, headers={**cabecalhos, "Content-Range": f"bytes */{tamanho}"})
+    if intervalo is None:
+        return FileResponse(caminho, media_type=media_type, headers=cabecalhos)
+
+    inicio, fim = intervalo
+    return StreamingResponse(
+        _ler_intervalo(caminho, inicio, fim),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            **cabecalhos,
+            "Content-Range": f"bytes {inicio}-{fim}/{tamanho}",
+            "Content-Length": str(fim - inicio + 1),
+        }
+    )
@@ -0,0 +1,135 @@
+"""
+Normalização das fotos enviadas e miniaturas
+
+As fotos de celular chegam com vários megabytes, em qualquer formato e com
+a orientação só na tag EXIF. Antes da leitura das bolhas, cada imagem passa
+por uma etapa de ingestão (no mesmo worker da fila de OMR): é decodificada
+já reduzida (draft do JPEG), tem a orientação EXIF aplicada e é gravada em
+tons de cinza, na resolução que o reconhecimento usa (cópia de trabalho),
+junto de uma miniatura para pré-visualização.
+
+Os derivados ficam em UPLOAD_DIR/derivados/ab/cd/<sha256>_<tipo>.jpg,
+endereçados pelo conteúdo do original como os uploads: a mesma foto enviada
+duas vezes é normalizada uma vez só. Com IMAGENS_MANTER_ORIGINAL=false o
+original é apagado depois de normalizado.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from utils_omr import FolhaNaoReconhecida, ler_folha
+from utils_upload import CHUNK_SIZE, UPLOAD_DIR
+
+# Maior lado da cópia de trabalho (a folha tem 1240x877 no layout)
+IMAGEM_LADO_TRABALHO = int(os.getenv("IMAGEM_LADO_TRABALHO", 2000))
+IMAGEM_QUALIDADE_TRABALHO = int(os.getenv("IMAGEM_QUALIDADE_TRABALHO", 90))
+MINIATURA_LADO = int(os.getenv("MINIATURA_LADO", 320))
+MINIATURA_QUALIDADE = int(os.getenv("MINIATURA_QUALIDADE", 75))
+MANTER_ORIGINAL = os.getenv("IMAGENS_MANTER_ORIGINAL", "true").lower() in ("1", "true", "sim", "yes")
+
+DERIVADOS_DIR = os.path.join(UPLOAD_DIR, "derivados")
+TIPOS_DERIVADOS = ("trabalho", "miniatura")
+
+
+def caminho_derivado(sha256: str, tipo: str) -> str:
+    """Caminho de um derivado ("trabalho" ou "miniatura") de um conteúdo"""
+    return os.path.join(DERIVADOS_DIR, sha256[:2], sha256[2:4], f"{sha256}_{tipo}.jpg")
+
+
+def derivados_existentes(sha256: Optional[str]) -> Optional[Dict[str, str]]:
+    """Caminhos dos derivados se já foram gerados para este conteúdo"""
+    if not sha256:
+        return None
+    caminhos = {tipo: caminho_derivado(sha256, tipo) for tipo in TIPOS_DERIVADOS}
+    if all(os.path.exists(caminho) for caminho in caminhos.values()):
+        return caminhos
+    return None
+
+
+def _hash_arquivo(caminho: str) -> str:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _gravar_jpeg(imagem: Image.Image, destino: str, qualidade: int):
+    # Grava em arquivo temporário e renomeia: um leitor nunca vê o JPEG pela metade
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            imagem.save(f, "JPEG", quality=qualidade, optimize=True)
+        os.replace(tmp_path, destino)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def normalizar_imagem(
+    original: str,
+    sha256: Optional[str] = None,
+    tempos: Optional[Dict[str, float]] = None
+) -> Dict[str, str]:
+    """Gerar (se ainda não existem) a cópia de trabalho e a miniatura de uma foto
+
+    Retorna {"trabalho", "miniatura"} com os caminhos. Levanta
+    FolhaNaoReconhecida se a imagem não pode ser decodificada. Com
+    `tempos`, acumula ali os segundos de "decodificacao" e "normalizacao".
+    """
+    tempos = {} if tempos is None else tempos
+    existentes = derivados_existentes(sha256)
+    if existentes is None:
+        if not os.path.exists(original):
+            raise FolhaNaoReconhecida(f"Imagem original não encontrada: {original}")
+        sha256 = sha256 or _hash_arquivo(original)
+        inicio = time.perf_counter()
+        try:
+            with Image.open(original) as imagem:
+                # JPEG: decodificar já em escala reduzida (1/2, 1/4, 1/8) e em cinza
+                imagem.draft("L", (IMAGEM_LADO_TRABALHO, IMAGEM_LADO_TRABALHO))
+                imagem = ImageOps.exif_transpose(imagem).convert("L")
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise FolhaNaoReconhecida(f"Não foi possível decodificar a imagem: {e}")
+        decodificada = time.perf_counter()
+        tempos["decodificacao"] = tempos.get("decodificacao", 0.0) + decodificada - inicio
+        imagem.thumbnail((IMAGEM_LADO_TRABALHO, IMAGEM_LADO_TRABALHO), Image.LANCZOS)
+        existentes = {tipo: caminho_derivado(sha256, tipo) for tipo in TIPOS_DERIVADOS}
+        _gravar_jpeg(imagem, existentes["trabalho"], IMAGEM_QUALIDADE_TRABALHO)
+        imagem.thumbnail((MINIATURA_LADO, MINIATURA_LADO), Image.LANCZOS)
+        _gravar_jpeg(imagem, existentes["miniatura"], MINIATURA_QUALIDADE)
+        tempos["normalizacao"] = tempos.get("normalizacao", 0.0) + time.perf_counter() - decodificada
+    if not MANTER_ORIGINAL and os.path.exists(original):
+        os.remove(original)
+    return existentes
+
+
+def ingerir_e_ler(original: str, sha256: Optional[str], layout_path: str) -> dict:
+    """Tarefa da fila de OMR: normalizar a foto e ler as respostas na cópia de trabalho
+
+    Retorna a leitura de ler_folha com os caminhos dos derivados em
+    "imagens" e a duração de cada etapa em "tempos" (registrada nas métricas
+    pelo processo principal).
+    """
+    tempos: Dict[str, float] = {}
+    imagens = normalizar_imagem(original, sha256, tempos)
+    leitura = ler_folha(imagens["trabalho"], layout_path, tempos)
+    leitura["imagens"] = imagens
+    leitura["tempos"] = tempos
+    return leitura
+
+
+def remover_derivados(sha256: Optional[str]):
+    """Apagar os derivados de um conteúdo (imagem sem nenhuma prova)"""
+    if not sha256:
+        return
+    for tipo in TIPOS_DERIVADOS:
+        caminho = caminho_derivado(sha256, tipo)
+        if os.path.exists(caminho):
+            os.remove(caminho)
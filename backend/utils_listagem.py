@@ -0,0 +1,156 @@
+"""
+Listagens paginadas por cursor (keyset)
+
+As rotas de listagem aceitam `limit`, `after` (cursor da página anterior),
+`sort`, `fields` e filtros; a página vem de `colecao.paginar`, que usa os
+índices do storage, então o custo acompanha o tamanho da página e não o da
+coleção. O cursor da próxima página vai nos headers X-Next-Cursor e Link.
+
+Os registros já estão no formato dos schemas de resposta: em vez de validar
+item a item pelo response_model, cada um é projetado nos campos do schema
+(ou nos pedidos em `fields`) e serializado direto.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+LISTAGEM_LIMITE_MAX = int(os.getenv("LISTAGEM_LIMITE_MAX", 1000))
+
+
+def codificar_cursor(ordem: str, valor, item_id: int) -> str:
+    """Cursor opaco (base64url) apontando para logo após o registro"""
+    bruto = json.dumps([ordem, valor, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, ordem: str) -> tuple:
+    """(valor, id) de um cursor gerado com a mesma ordenação"""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ordem_cursor, valor, item_id = json.loads(bruto)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if ordem_cursor != ordem or not isinstance(item_id, int):
+        raise HTTPException(status_code=400, detail="Cursor não corresponde à ordenação pedida")
+    return valor, item_id
+
+
+def limite_data(texto: Optional[str], fim: bool = False) -> Optional[str]:
+    """Data/hora ISO do filtro no formato de criado_em (hora local, sem fuso)
+
+    Só a data em `fim` inclui o dia inteiro.
+    """
+    if not texto:
+        return None
+    try:
+        valor = datetime.fromisoformat(texto)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Data inválida: {texto}")
+    if valor.tzinfo is not None:
+        valor = valor.astimezone().replace(tzinfo=None)
+    if fim and len(texto) == 10:
+        valor += timedelta(days=1, microseconds=-1)
+    return valor.isoformat()
+
+
+def campos_projecao(fields: Optional[str], modelo: Type[BaseModel]) -> List[str]:
+    """Campos devolvidos: os do schema, ou os pedidos em `fields` (sempre com o id)"""
+    disponiveis = list(modelo.model_fields)
+    if not fields:
+        return disponiveis
+    pedidos = [campo.strip() for campo in fields.split(",") if campo.strip()]
+    invalidos = [campo for campo in pedidos if campo not in disponiveis]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Campos inválidos em fields: {', '.join(invalidos)}")
+    return list(dict.fromkeys(["id"] + pedidos))
+
+
+def ordenacao(colecao, sort: str) -> tuple:
+    """(campo, decrescente) de um parâmetro sort ("campo" ou "-campo")"""
+    ordem = sort.lstrip("-")
+    if ordem != "id" and ordem not in colecao.ordenacoes:
+        permitidos = ", ".join(("id",) + colecao.ordenacoes)
+        raise HTTPException(status_code=400, detail=f"Ordenação inválida: {sort} (use {permitidos})")
+    return ordem, sort.startswith("-")
+
+
+def intervalo_criacao(criado_de: Optional[str], criado_ate: Optional[str]) -> dict:
+    """Intervalo de criado_em no formato de `colecao.paginar`"""
+    return {"criado_em": (limite_data(criado_de), limite_data(criado_ate, fim=True))}
+
+
+def percorrer(colecao, lote: int, ordem: str = "id", decrescente: bool = False, **kwargs) -> Iterator[dict]:
+    """Todos os registros de uma consulta, buscados de `lote` em `lote` pelo cursor
+
+    Só uma página fica em memória por vez; mudanças gravadas entre as
+    páginas não fazem registros serem repetidos nem pulados.
+    """
+    depois = None
+    while True:
+        pagina = colecao.paginar(limite=lote, depois=depois, ordem=ordem, decrescente=decrescente, **kwargs)
+        yield from pagina
+        if len(pagina) < lote:
+            return
+        depois = (pagina[-1].get(ordem), pagina[-1]["id"])
+
+
+def projetar(item: dict, campos: List[str]) -> dict:
+    """Registro reduzido aos campos do schema de resposta (sem validação)"""
+    return {campo: item.get(campo) for campo in campos}
+
+
+def pagina_listagem(
+    request: Request,
+    colecao,
+    modelo: Type[BaseModel],
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    sort: str = "id",
+    fields: Optional[str] = None,
+    criado_de: Optional[str] = None,
+    criado_ate: Optional[str] = None,
+    expandir: Optional[Callable[[dict], dict]] = None,
+    **filtros
+) -> Tuple[List[dict], dict]:
+    """Itens projetados de uma página e os headers do cursor da próxima
+
+    - **sort**: "id" ou um campo de `colecao.ordenacoes`; "-" na frente
+      inverte a ordem
+    - **expandir**: converte o registro gravado no formato do schema
+      (ex: resultados com respostas compactas)
+    - **filtros**: igualdade; valores None são ignorados
+    """
+    ordem, decrescente = ordenacao(colecao, sort)
+    campos = campos_projecao(fields, modelo)
+
+    pagina = colecao.paginar(
+        limite=limit,
+        depois=decodificar_cursor(after, ordem) if after else None,
+        ordem=ordem,
+        decrescente=decrescente,
+        intervalos=intervalo_criacao(criado_de, criado_ate),
+        **{campo: valor for campo, valor in filtros.items() if valor is not None}
+    )
+
+    headers = {}
+    if limit is not None and len(pagina) == limit:
+        ultimo = pagina[-1]
+        cursor = codificar_cursor(ordem, ultimo.get(ordem), ultimo["id"])
+        headers["X-Next-Cursor"] = cursor
+        headers["Link"] = f'<{request.url.include_query_params(after=cursor)}>; rel="next"'
+    if expandir is not None:
+        pagina = [expandir(item) for item in pagina]
+    return [projetar(item, campos) for item in pagina], headers
+
+
+def listar_pagina(request: Request, colecao, modelo: Type[BaseModel], *args, **kwargs) -> JSONResponse:
+    """Resposta de uma rota de listagem (lista JSON + cursor nos headers); ver pagina_listagem"""
+    itens, headers = pagina_listagem(request, colecao, modelo, *args, **kwargs)
+    return JSONResponse(itens, headers=headers)
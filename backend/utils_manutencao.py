@@ -0,0 +1,645 @@
+"""
+Manutenção em background: remoção em cascata, coleta de órfãos e arquivo
+
+Remover um gabarito remove junto suas provas, resultados e versões da chave,
+o PNG/layout da folha e as imagens que nenhuma outra prova usa. Uma thread
+(só no worker líder) roda a cada MANUTENCAO_INTERVALO_S:
+- coleta de órfãos: registros de gabaritos que não existem mais (ex: de
+  antes da cascata), uploads e derivados sem prova, folhas PNG antigas (cada
+  edição gera um arquivo novo) e pacotes de arquivo sem gabarito. Arquivos
+  e registros mais novos que MANUTENCAO_CARENCIA_S nunca são coletados: o
+  upload é gravado antes da prova que o referencia;
+- arquivo: gabaritos encerrados (POST /api/gabaritos/{id}/encerrar) há mais
+  de ARQUIVO_IDADE_DIAS saem do armazenamento principal.
+
+Um gabarito arquivado continua na coleção, com "arquivado_em"; suas provas,
+resultados e imagens vão para ARQUIVO_DIR/gabarito_<id>/:
+- provas.json / resultados.json: os registros, no formato de snapshot da
+  ColecaoJournal;
+- pacote.tar.gz: os arquivos de imagem, comprimidos;
+- colunas/*.npy: os resultados em colunas (id, nota, respostas como matriz
+  uint8...), sem compressão, para leitura com np.load(mmap_mode="r") (ver
+  colunas_arquivadas);
+- manifesto.json: contagens, hashes das imagens (consultado pela coleta) e
+  o caminho original de cada imagem do pacote.
+Os ids arquivados de todos os gabaritos ficam em um índice só,
+ARQUIVO_DIR/indice.npz: achar (ou não achar) uma prova/resultado pelo id é
+uma busca binária, sem abrir pacote nenhum.
+
+Leituras não restauram: as rotas leem as provas e resultados de um gabarito
+arquivado direto do pacote (colecao_de_leitura, obter_ou_arquivado,
+extrair_arquivado para as imagens), com o gabarito aberto só para leitura em
+cada worker. Só POST /api/gabaritos/{id}/restaurar e as escritas nas provas
+e resultados do gabarito (garantir_restaurado / obter_ou_restaurar) o trazem
+de volta, com os mesmos ids. Arquivar e restaurar são serializados entre os
+workers por uma trava de arquivo e podem ser refeitos depois de uma
+interrupção.
+"""
+
+import base64
+import io
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+import storage
+from storage.journal import ColecaoJournal
+from storage.trava import TravaArquivo
+from utils_correcao import STATUS_PENDENTES
+from utils_estatisticas import EstatisticasGabaritos
+from utils_gabarito import CACHE_FOLHAS_DIR, create_gabaritos_directory, gravar_atomico
+from utils_imagens import DERIVADOS_DIR, TIPOS_DERIVADOS, remover_derivados
+from utils_respostas import EM_BRANCO, MULTIPLA, versoes_chave
+from utils_upload import UPLOAD_DIR
+
+MANUTENCAO_INTERVALO_S = float(os.getenv("MANUTENCAO_INTERVALO_S", 3600))
+MANUTENCAO_CARENCIA_S = float(os.getenv("MANUTENCAO_CARENCIA_S", 3600))
+# Idade (desde o encerramento) para arquivar; negativo desliga o arquivo automático
+ARQUIVO_IDADE_DIAS = float(os.getenv("ARQUIVO_IDADE_DIAS", 180))
+ARQUIVO_DIR = os.getenv("ARQUIVO_DIR", os.path.join(storage.DATA_DIR, "arquivo"))
+REMOCAO_LOTE = 500
+
+# Gabaritos arquivados mantidos abertos para leitura, por processo
+ARQUIVO_ABERTOS = int(os.getenv("ARQUIVO_ABERTOS", 8))
+ARQUIVO_INDICE = os.path.join(ARQUIVO_DIR, "indice.npz")
+COLECOES_ARQUIVADAS = ("provas", "resultados")
+
+_lock = threading.Lock()
+_trava = TravaArquivo(os.path.join(ARQUIVO_DIR, "arquivo.lock"))
+# (marca do arquivo de índice, coleção -> matriz de [id, gabarito_id]), ver _ler_indice
+_indice: tuple = (None, {})
+_abertos: "OrderedDict[int, GabaritoArquivado]" = OrderedDict()
+_abertos_lock = threading.Lock()
+
+
+def diretorio_arquivo(gabarito_id: int) -> str:
+    return os.path.join(ARQUIVO_DIR, f"gabarito_{gabarito_id}")
+
+
+def _remover_lote(colecao, ids: List[int]):
+    """Remover registros em commits de até REMOCAO_LOTE (roda fora do event loop)"""
+    for inicio in range(0, len(ids), REMOCAO_LOTE):
+        operacoes = [("remover", (item_id,)) for item_id in ids[inicio:inicio + REMOCAO_LOTE]]
+        storage.fila.submeter_lote(colecao, operacoes).result()
+
+
+def _remover_arquivo(caminho: Optional[str]):
+    if caminho and os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def _hashes_arquivados() -> set:
+    """Hashes das imagens guardadas nos pacotes de arquivo"""
+    hashes = set()
+    if not os.path.isdir(ARQUIVO_DIR):
+        return hashes
+    for nome in os.listdir(ARQUIVO_DIR):
+        caminho = os.path.join(ARQUIVO_DIR, nome, "manifesto.json")
+        if os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as f:
+                hashes.update(json.load(f)["hashes"])
+    return hashes
+
+
+def remover_imagem_se_orfa(prova: dict):
+    """Apagar a imagem (e os derivados) de uma prova removida se nenhuma outra a usa"""
+    imagem_hash = prova.get("imagem_hash")
+    if imagem_hash and storage.provas.filtrar(imagem_hash=imagem_hash):
+        return
+    _remover_arquivo(prova.get("imagem_url"))
+    remover_derivados(imagem_hash)
+
+
+# ===== CASCATA =====
+def remover_dependentes(gabarito: dict):
+    """Remover o que pertence a um gabarito já removido: registros, folha, imagens e arquivo"""
+    gabarito_id = gabarito["id"]
+    with _lock, _trava.exclusiva():
+        shutil.rmtree(diretorio_arquivo(gabarito_id), ignore_errors=True)
+        _gravar_indice(gabarito_id)
+        _fechar_arquivado(gabarito_id)
+    _remover_lote(storage.resultados, [r["id"] for r in storage.resultados.filtrar(gabarito_id=gabarito_id)])
+    provas = storage.provas.filtrar(gabarito_id=gabarito_id)
+    _remover_lote(storage.provas, [p["id"] for p in provas])
+    for prova in provas:
+        remover_imagem_se_orfa(prova)
+    # Versões da chave: só as que nenhum resultado (de outro gabarito) referencia
+    chaves = [
+        c["id"] for c in storage.chaves.filtrar(gabarito_id=gabarito_id)
+        if not storage.resultados.filtrar(chave_id=c["id"])
+    ]
+    _remover_lote(storage.chaves, chaves)
+    _remover_arquivo(gabarito.get("png_path"))
+    _remover_arquivo(gabarito.get("layout_path"))
+
+
+# ===== COLETA DE ÓRFÃOS =====
+def _arquivos_antigos(diretorio: str, ignorar: tuple = ()) -> Iterator[str]:
+    """Arquivos de `diretorio` (recursivo) modificados há mais de MANUTENCAO_CARENCIA_S"""
+    limite = time.time() - MANUTENCAO_CARENCIA_S
+    for raiz, subdirs, arquivos in os.walk(diretorio):
+        subdirs[:] = [d for d in subdirs if os.path.join(raiz, d) not in ignorar]
+        for nome in arquivos:
+            caminho = os.path.join(raiz, nome)
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    yield caminho
+            except FileNotFoundError:
+                pass
+
+
+def coletar_orfaos() -> Dict[str, int]:
+    """Remover registros e arquivos sem dono; retorna quantos de cada tipo"""
+    removidos = {"provas": 0, "resultados": 0, "chaves": 0, "arquivos": 0}
+    gabaritos = {g["id"]: g for g in storage.gabaritos.listar()}
+    limite = (datetime.now() - timedelta(seconds=MANUTENCAO_CARENCIA_S)).isoformat()
+    removido: Dict[int, bool] = {}
+
+    def gabarito_removido(gabarito_id: int) -> bool:
+        # Conferido de novo na hora: um gabarito criado depois da listagem
+        # acima não pode ter as provas e resultados novos coletados
+        if gabarito_id in gabaritos:
+            return False
+        if gabarito_id not in removido:
+            removido[gabarito_id] = storage.gabaritos.obter(gabarito_id) is None
+        return removido[gabarito_id]
+
+    # Registros de gabaritos removidos (os criados há menos que a carência ficam)
+    for nome in ("resultados", "provas"):
+        colecao = getattr(storage, nome)
+        orfaos = [
+            item for item in colecao.listar()
+            if item["gabarito_id"] not in gabaritos
+            and (item.get("criado_em") or "") < limite
+            and gabarito_removido(item["gabarito_id"])
+        ]
+        _remover_lote(colecao, [item["id"] for item in orfaos])
+        removidos[nome] = len(orfaos)
+        if nome == "provas":
+            for prova in orfaos:
+                remover_imagem_se_orfa(prova)
+    chaves = [
+        c["id"] for c in storage.chaves.listar()
+        if c["gabarito_id"] not in gabaritos and not storage.resultados.filtrar(chave_id=c["id"])
+    ]
+    _remover_lote(storage.chaves, chaves)
+    removidos["chaves"] = len(chaves)
+
+    # Uploads e derivados que nenhuma prova (nem pacote de arquivo) usa
+    arquivados = _hashes_arquivados()
+
+    def em_uso(imagem_hash: str) -> bool:
+        return imagem_hash in arquivados or bool(storage.provas.filtrar(imagem_hash=imagem_hash))
+
+    tmp_upload = os.path.join(UPLOAD_DIR, "tmp")
+    for caminho in _arquivos_antigos(UPLOAD_DIR, ignorar=(DERIVADOS_DIR, tmp_upload)):
+        if not em_uso(os.path.splitext(os.path.basename(caminho))[0]):
+            _remover_arquivo(caminho)
+            removidos["arquivos"] += 1
+    for caminho in _arquivos_antigos(tmp_upload):
+        _remover_arquivo(caminho)
+        removidos["arquivos"] += 1
+    for caminho in _arquivos_antigos(DERIVADOS_DIR):
+        imagem_hash, _, tipo = os.path.splitext(os.path.basename(caminho))[0].rpartition("_")
+        if tipo not in TIPOS_DERIVADOS or not em_uso(imagem_hash):
+            _remover_arquivo(caminho)
+            removidos["arquivos"] += 1
+
+    # Folhas PNG (e layouts) que nenhum gabarito referencia mais
+    referenciados = {
+        os.path.normpath(caminho) for g in gabaritos.values()
+        for caminho in (g.get("png_path"), g.get("layout_path")) if caminho
+    }
+    for caminho in _arquivos_antigos(create_gabaritos_directory(), ignorar=(CACHE_FOLHAS_DIR,)):
+        if os.path.normpath(caminho) not in referenciados:
+            _remover_arquivo(caminho)
+            removidos["arquivos"] += 1
+
+    # Pacotes (e entradas do índice) de gabaritos que não existem mais e pacotes interrompidos
+    if os.path.isdir(ARQUIVO_DIR):
+        with _lock, _trava.exclusiva():
+            for nome in os.listdir(ARQUIVO_DIR):
+                caminho = os.path.join(ARQUIVO_DIR, nome)
+                if not os.path.isdir(caminho):
+                    continue
+                prefixo, _, gabarito_id = nome.partition("_")
+                if prefixo == "gabarito" and gabarito_id.isdigit() and int(gabarito_id) in gabaritos:
+                    continue
+                shutil.rmtree(caminho, ignore_errors=True)
+                removidos["arquivos"] += 1
+            indexados = {int(g) for matriz in _ler_indice().values() for g in np.unique(matriz[:, 1])}
+            for gabarito_id in indexados - set(gabaritos):
+                _gravar_indice(gabarito_id)
+                _fechar_arquivado(gabarito_id)
+    return removidos
+
+
+# ===== ARQUIVO =====
+def _codigos_respostas(resultado: dict, num_questoes: int) -> bytes:
+    """Respostas do resultado como um byte por questão (formato de utils_respostas)"""
+    if "respostas" in resultado:
+        dados = base64.b64decode(resultado["respostas"])
+    else:
+        chave = versoes_chave.obter(resultado.get("chave_id"))
+        codigos = {alternativa: i for i, alternativa in enumerate(chave.alternativas if chave else ())}
+        codigos[""] = EM_BRANCO
+        dados = bytes(codigos.get(resposta, MULTIPLA) for resposta in resultado["respostas_aluno"])
+    return dados[:num_questoes].ljust(num_questoes, bytes([EM_BRANCO]))
+
+
+def _data(valor: Optional[str]) -> np.datetime64:
+    try:
+        return np.datetime64(valor, "us")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT", "us")
+
+
+def colunas_resultados(resultados: List[dict], num_questoes: int) -> Dict[str, np.ndarray]:
+    """Resultados (ordenados por id) em colunas NumPy
+
+    "respostas" é a matriz (resultados, questões) de uint8 com o índice da
+    alternativa marcada na versão da chave do resultado ("chave_id").
+    """
+    resultados = sorted(resultados, key=lambda r: r["id"])
+    respostas = np.frombuffer(
+        b"".join(_codigos_respostas(r, num_questoes) for r in resultados), dtype=np.uint8
+    ).reshape(len(resultados), num_questoes)
+    return {
+        "id": np.array([r["id"] for r in resultados], dtype=np.int64),
+        "prova_id": np.array([r["prova_id"] for r in resultados], dtype=np.int64),
+        "chave_id": np.array([r.get("chave_id") or -1 for r in resultados], dtype=np.int64),
+        "acertos": np.array([r["acertos"] for r in resultados], dtype=np.int32),
+        "erros": np.array([r["erros"] for r in resultados], dtype=np.int32),
+        "nota": np.array([r["nota"] for r in resultados], dtype=np.float32),
+        "percentual_acerto": np.array([r["percentual_acerto"] for r in resultados], dtype=np.float32),
+        "criado_em": np.array([_data(r.get("criado_em")) for r in resultados], dtype="datetime64[us]"),
+        "matricula_aluno": np.array([r["matricula_aluno"] for r in resultados], dtype=np.str_),
+        "turma_aluno": np.array([r["turma_aluno"] for r in resultados], dtype=np.str_),
+        "respostas": respostas,
+    }
+
+
+def colunas_arquivadas(gabarito_id: int) -> Optional[Dict[str, np.ndarray]]:
+    """Colunas dos resultados de um gabarito arquivado, mapeadas em memória (None se não arquivado)"""
+    diretorio = os.path.join(diretorio_arquivo(gabarito_id), "colunas")
+    if not os.path.isdir(diretorio):
+        return None
+    return {
+        os.path.splitext(nome)[0]: np.load(os.path.join(diretorio, nome), mmap_mode="r")
+        for nome in os.listdir(diretorio) if nome.endswith(".npy")
+    }
+
+
+def _ler_indice() -> Dict[str, np.ndarray]:
+    """Índice dos ids arquivados: coleção -> matriz (n, 2) de [id, gabarito_id], ordenada por id
+
+    Relido só quando o arquivo muda (outro worker arquivou ou restaurou):
+    cada consulta custa um stat e uma busca binária.
+    """
+    global _indice
+    try:
+        estado = os.stat(ARQUIVO_INDICE)
+    except FileNotFoundError:
+        return {nome: np.zeros((0, 2), dtype=np.int64) for nome in COLECOES_ARQUIVADAS}
+    marca = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    if _indice[0] != marca:
+        with np.load(ARQUIVO_INDICE) as dados:
+            _indice = (marca, {nome: dados[nome] for nome in COLECOES_ARQUIVADAS})
+    return _indice[1]
+
+
+def _gravar_indice(gabarito_id: int, ids: Optional[Dict[str, List[int]]] = None):
+    """Trocar no índice os ids arquivados de um gabarito (sem `ids`, só tirá-los)
+
+    Chamado com _lock e a trava exclusiva do arquivo.
+    """
+    indice = {}
+    for nome, matriz in _ler_indice().items():
+        novos = [(item_id, gabarito_id) for item_id in (ids or {}).get(nome, ())]
+        matriz = np.concatenate([
+            matriz[matriz[:, 1] != gabarito_id], np.array(novos, dtype=np.int64).reshape(-1, 2)
+        ])
+        indice[nome] = matriz[np.argsort(matriz[:, 0], kind="stable")]
+    saida = io.BytesIO()
+    np.savez(saida, **indice)
+    os.makedirs(ARQUIVO_DIR, exist_ok=True)
+    gravar_atomico(ARQUIVO_INDICE, saida.getvalue())
+
+
+def _ids_no_indice(gabarito_id: int) -> Dict[str, set]:
+    """Ids de provas e resultados que o índice dá como arquivados no gabarito"""
+    return {
+        nome: set(matriz[matriz[:, 1] == gabarito_id, 0].tolist()) for nome, matriz in _ler_indice().items()
+    }
+
+
+def localizar(colecao: str, item_id: int) -> Optional[int]:
+    """Gabarito arquivado que guarda a prova/resultado `item_id`, se algum"""
+    matriz = _ler_indice()[colecao]
+    i = np.searchsorted(matriz[:, 0], item_id)
+    if i < len(matriz) and matriz[i, 0] == item_id:
+        return int(matriz[i, 1])
+    return None
+
+
+class GabaritoArquivado:
+    """Provas e resultados de um gabarito arquivado, abertos só para leitura
+
+    As coleções são ColecaoJournal carregadas dos snapshots do pacote, com os
+    mesmos índices do armazenamento principal: filtrar, paginar e exportar
+    funcionam igual, e as estatísticas são montadas dos resultados arquivados.
+    Nada é gravado de volta.
+    """
+
+    def __init__(self, gabarito_id: int, arquivado_em: str):
+        diretorio = diretorio_arquivo(gabarito_id)
+        self.arquivado_em = arquivado_em
+        self.provas, self.resultados = (
+            ColecaoJournal(nome, diretorio=diretorio, indices=storage.INDICES[nome], ordenacoes=storage.ORDENACOES[nome])
+            for nome in COLECOES_ARQUIVADAS
+        )
+        for colecao in (self.provas, self.resultados):
+            colecao.sincronizar()  # carregadas agora, com a trava do arquivo
+        self.estatisticas = EstatisticasGabaritos(self.resultados)
+
+
+def abrir_arquivado(gabarito_id: Optional[int]) -> Optional[GabaritoArquivado]:
+    """As coleções de leitura do gabarito, se ele está arquivado (None se não está)
+
+    Os ARQUIVO_ABERTOS gabaritos lidos por último ficam abertos no processo;
+    um gabarito restaurado (ou arquivado de novo) em outro worker muda
+    "arquivado_em" e é reaberto.
+    """
+    if gabarito_id is None:
+        return None
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    arquivado_em = gabarito.get("arquivado_em") if gabarito else None
+    with _abertos_lock:
+        aberto = _abertos.pop(gabarito_id, None)
+        if aberto is not None and aberto.arquivado_em == arquivado_em:
+            _abertos[gabarito_id] = aberto
+            return aberto
+    if not arquivado_em:
+        return None
+    with _lock, _trava.compartilhada():
+        if not os.path.exists(os.path.join(diretorio_arquivo(gabarito_id), "manifesto.json")):
+            return None
+        aberto = GabaritoArquivado(gabarito_id, arquivado_em)
+    with _abertos_lock:
+        _abertos[gabarito_id] = aberto
+        while len(_abertos) > ARQUIVO_ABERTOS:
+            _abertos.popitem(last=False)
+    return aberto
+
+
+def _fechar_arquivado(gabarito_id: int):
+    with _abertos_lock:
+        _abertos.pop(gabarito_id, None)
+
+
+def extrair_arquivado(gabarito_id: int, caminho: Optional[str]) -> Optional[str]:
+    """Uma imagem de prova arquivada, lida do pacote sem restaurar
+
+    Se o arquivo original ainda existe (outra prova usa a mesma imagem), ele
+    mesmo; senão, uma cópia extraída (uma vez) para <pacote>/extraidos/. None
+    se a imagem não está no pacote.
+    """
+    if not caminho:
+        return None
+    if os.path.exists(caminho):
+        return caminho
+    diretorio = diretorio_arquivo(gabarito_id)
+    destino = os.path.join(diretorio, "extraidos", os.path.basename(caminho))
+    if os.path.exists(destino):
+        return destino
+    with _lock, _trava.compartilhada():
+        try:
+            with open(os.path.join(diretorio, "manifesto.json"), encoding="utf-8") as f:
+                arquivos = json.load(f)["arquivos"]
+        except FileNotFoundError:
+            return None
+        membro = next((nome for nome, original in arquivos.items() if original == caminho), None)
+        if membro is None:
+            return None
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with tarfile.open(os.path.join(diretorio, "pacote.tar.gz"), "r:gz") as pacote:
+            with pacote.extractfile(membro) as origem:
+                gravar_atomico(destino, origem.read())
+    return destino
+
+
+def _gravar_registros(diretorio: str, nome: str, itens: List[dict]):
+    """Registros no formato de snapshot da ColecaoJournal (lidos por GabaritoArquivado e restaurar)"""
+    itens = sorted(itens, key=lambda item: item["id"])
+    dados = {nome: itens, "id_counter": itens[-1]["id"] + 1 if itens else 1}
+    with open(os.path.join(diretorio, f"{nome}.json"), "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def _descartar_quentes(gabarito_id: int, provas: List[dict], resultados: List[dict]):
+    """Tirar do armazenamento principal o que já está no pacote"""
+    _remover_lote(storage.resultados, [r["id"] for r in resultados])
+    _remover_lote(storage.provas, [p["id"] for p in provas])
+    for prova in provas:
+        remover_imagem_se_orfa(prova)
+
+
+def arquivar(gabarito_id: int) -> bool:
+    """Mover provas, resultados e imagens de um gabarito encerrado para o arquivo
+
+    Retorna False se o gabarito não existe, não está encerrado, já foi
+    arquivado ou tem provas na fila de leitura.
+    """
+    with _lock, _trava.exclusiva():
+        storage.gabaritos.sincronizar()
+        gabarito = storage.gabaritos.obter(gabarito_id)
+        if not gabarito or not gabarito.get("encerrado_em") or gabarito.get("arquivado_em"):
+            return False
+        provas = storage.provas.filtrar(gabarito_id=gabarito_id)
+        if any(p.get("status") in STATUS_PENDENTES for p in provas):
+            return False
+        resultados = storage.resultados.filtrar(gabarito_id=gabarito_id)
+
+        # Pacote montado ao lado e renomeado: um pacote no lugar está sempre completo
+        destino = diretorio_arquivo(gabarito_id)
+        tmp = destino + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, "colunas"))
+        arquivos = {}
+        with tarfile.open(os.path.join(tmp, "pacote.tar.gz"), "w:gz") as pacote:
+            for prova in provas:
+                for caminho in (prova.get("imagem_url"), prova.get("imagem_trabalho"), prova.get("imagem_miniatura")):
+                    if caminho and caminho not in arquivos.values() and os.path.exists(caminho):
+                        nome = f"arquivos/{len(arquivos)}"
+                        pacote.add(caminho, arcname=nome)
+                        arquivos[nome] = caminho
+        _gravar_registros(tmp, "provas", provas)
+        _gravar_registros(tmp, "resultados", resultados)
+        for nome, coluna in colunas_resultados(resultados, gabarito["num_questoes"]).items():
+            np.save(os.path.join(tmp, "colunas", f"{nome}.npy"), coluna)
+        agora = datetime.now().isoformat()
+        with open(os.path.join(tmp, "manifesto.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "gabarito_id": gabarito_id,
+                "arquivado_em": agora,
+                "provas": len(provas),
+                "resultados": len(resultados),
+                "hashes": sorted({p["imagem_hash"] for p in provas if p.get("imagem_hash")}),
+                "arquivos": arquivos,
+            }, f)
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(tmp, destino)
+        _gravar_indice(gabarito_id, {
+            "provas": [p["id"] for p in provas], "resultados": [r["id"] for r in resultados]
+        })
+
+        storage.fila.submeter(storage.gabaritos, "atualizar", gabarito_id, {"arquivado_em": agora}).result()
+        _descartar_quentes(gabarito_id, provas, resultados)
+    return True
+
+
+def _ler_registros(diretorio: str, nome: str) -> List[dict]:
+    try:
+        with open(os.path.join(diretorio, f"{nome}.json"), encoding="utf-8") as f:
+            return json.load(f)[nome]
+    except FileNotFoundError:
+        return []
+
+
+def restaurar(gabarito_id: int) -> bool:
+    """Trazer de volta (com os mesmos ids) o que foi arquivado de um gabarito"""
+    with _lock, _trava.exclusiva():
+        storage.gabaritos.sincronizar()
+        gabarito = storage.gabaritos.obter(gabarito_id)
+        if not gabarito or not gabarito.get("arquivado_em"):
+            return False
+        diretorio = diretorio_arquivo(gabarito_id)
+        manifesto = os.path.join(diretorio, "manifesto.json")
+        if os.path.exists(manifesto):
+            with open(manifesto, encoding="utf-8") as f:
+                arquivos = json.load(f)["arquivos"]
+            with tarfile.open(os.path.join(diretorio, "pacote.tar.gz"), "r:gz") as pacote:
+                for nome, original in arquivos.items():
+                    if os.path.exists(original):
+                        continue
+                    os.makedirs(os.path.dirname(original) or ".", exist_ok=True)
+                    with pacote.extractfile(nome) as origem, open(original + ".tmp", "wb") as f:
+                        shutil.copyfileobj(origem, f)
+                    os.replace(original + ".tmp", original)
+            # "restaurar" ignora ids que já voltaram (restauração interrompida)
+            for nome in COLECOES_ARQUIVADAS:
+                itens = _ler_registros(diretorio, nome)
+                for inicio in range(0, len(itens), REMOCAO_LOTE):
+                    operacoes = [("restaurar", (item,)) for item in itens[inicio:inicio + REMOCAO_LOTE]]
+                    storage.fila.submeter_lote(getattr(storage, nome), operacoes).result()
+        storage.fila.submeter(storage.gabaritos, "atualizar", gabarito_id, {"arquivado_em": None}).result()
+        _gravar_indice(gabarito_id)
+        shutil.rmtree(diretorio, ignore_errors=True)
+        _fechar_arquivado(gabarito_id)
+    return True
+
+
+async def garantir_restaurado(gabarito_id: Optional[int]):
+    """Restaurar o gabarito antes de uma escrita nas suas provas/resultados, se ele está arquivado"""
+    if gabarito_id is None:
+        return
+    gabarito = storage.gabaritos.obter(gabarito_id)
+    if gabarito and gabarito.get("arquivado_em"):
+        await run_in_threadpool(restaurar, gabarito_id)
+
+
+async def obter_ou_restaurar(colecao, item_id: int) -> Optional[dict]:
+    """colecao.obter(item_id) para uma escrita, restaurando antes o gabarito arquivado que o guarda"""
+    item = colecao.obter(item_id)
+    if item is None:
+        gabarito_id = await run_in_threadpool(localizar, colecao.nome, item_id)
+        if gabarito_id is not None:
+            await run_in_threadpool(restaurar, gabarito_id)
+            item = colecao.obter(item_id)
+    return item
+
+
+def _obter_arquivado(nome: str, item_id: int) -> Optional[dict]:
+    arquivado = abrir_arquivado(localizar(nome, item_id))
+    return getattr(arquivado, nome).obter(item_id) if arquivado else None
+
+
+async def obter_ou_arquivado(colecao, item_id: int) -> Optional[dict]:
+    """colecao.obter(item_id) ou, se o registro está arquivado, a cópia do arquivo (sem restaurar)"""
+    item = colecao.obter(item_id)
+    if item is None:
+        item = await run_in_threadpool(_obter_arquivado, colecao.nome, item_id)
+    return item
+
+
+async def colecao_de_leitura(colecao, gabarito_id: Optional[int]):
+    """A coleção de onde ler os registros de `gabarito_id`: a do arquivo, se ele está arquivado"""
+    arquivado = await run_in_threadpool(abrir_arquivado, gabarito_id)
+    return getattr(arquivado, colecao.nome) if arquivado else colecao
+
+
+def arquivar_encerrados() -> Dict[str, int]:
+    """Arquivar os gabaritos encerrados há mais de ARQUIVO_IDADE_DIAS
+
+    Também termina arquivamentos interrompidos (gabarito já marcado com
+    registros ainda no armazenamento principal).
+    """
+    arquivados = concluidos = 0
+    limite = (datetime.now() - timedelta(days=ARQUIVO_IDADE_DIAS)).isoformat()
+    for gabarito in storage.gabaritos.listar():
+        if gabarito.get("arquivado_em"):
+            ids = _ids_no_indice(gabarito["id"])
+            provas = [p for p in storage.provas.filtrar(gabarito_id=gabarito["id"]) if p["id"] in ids["provas"]]
+            resultados = [
+                r for r in storage.resultados.filtrar(gabarito_id=gabarito["id"]) if r["id"] in ids["resultados"]
+            ]
+            if provas or resultados:
+                _descartar_quentes(gabarito["id"], provas, resultados)
+                concluidos += 1
+        elif ARQUIVO_IDADE_DIAS >= 0 and gabarito.get("encerrado_em") and gabarito["encerrado_em"] < limite:
+            arquivados += arquivar(gabarito["id"])
+    return {"arquivados": arquivados, "concluidos": concluidos}
+
+
+class Manutencao:
+    """Thread que roda a coleta e o arquivo a cada MANUTENCAO_INTERVALO_S"""
+
+    def __init__(self, intervalo: float = MANUTENCAO_INTERVALO_S):
+        self.intervalo = intervalo
+        self.ultima: Optional[dict] = None
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def executar(self) -> dict:
+        """Uma rodada completa (coleta de órfãos e arquivo); retorna os totais"""
+        inicio = time.perf_counter()
+        totais = {**coletar_orfaos(), **arquivar_encerrados()}
+        self.ultima = {**totais, "executada_em": datetime.now().isoformat(), "duracao_s": time.perf_counter() - inicio}
+        return self.ultima
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.executar()
+            except Exception as e:  # a próxima rodada tenta de novo
+                print(f"Erro na manutenção: {e}")
+
+    def iniciar(self):
+        if self._thread is None and self.intervalo > 0:
+            self._thread = threading.Thread(target=self._rodar, name="manutencao", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+
+manutencao = Manutencao()
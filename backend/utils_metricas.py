@@ -0,0 +1,366 @@
+"""
+Métricas no formato do Prometheus (GET /metrics)
+
+Contadores, medidores e histogramas simples, em memória e sem dependências
+(este módulo não importa nada do app, então o storage e os workers podem
+usá-lo). Com vários workers do uvicorn, cada um grava seus valores em um
+arquivo de um diretório comum a cada METRICAS_INTERVALO_S segundos
+(Registro.compartilhar) e o /metrics de qualquer worker soma os de todos:
+contadores e histogramas de workers que já terminaram continuam somando,
+medidores só contam os de workers vivos.
+
+O middleware (MiddlewareMetricas) mede cada requisição pela rota (o modelo
+do caminho, ex: /api/provas/{prova_id}, para não criar uma série por id):
+latência, requisições em andamento e tamanho do corpo recebido e enviado.
+As etapas internas (carga e gravação do storage, renderização das folhas,
+decodificação das fotos e reconhecimento) são medidas com medir_etapa() /
+registrar_etapa().
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# O Response do Starlette acrescenta "; charset=utf-8" aos tipos text/*
+TIPO_CONTEUDO = "text/plain; version=0.0.4"
+METRICAS_INTERVALO_S = float(os.getenv("METRICAS_INTERVALO_S", 5))
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    """Base: nome, ajuda, nomes dos rótulos e os valores por combinação de rótulos"""
+
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _rotulos_texto(self, chave: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pares = list(zip(self.rotulos, chave)) + ([extra] if extra else [])
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+    def valores(self) -> Dict[tuple, object]:
+        """Cópia dos valores atuais, por combinação de rótulos"""
+        with self._lock:
+            return dict(self._valores)
+
+    @staticmethod
+    def somar(valor, outro):
+        """Juntar o valor de outro processo ao deste"""
+        return valor + outro
+
+    def _amostras(self, valores: Dict[tuple, object]) -> Iterator[str]:
+        for chave, valor in sorted(valores.items()):
+            yield f"{self.nome}{self._rotulos_texto(chave)} {_formatar(valor)}"
+
+    def exportar(self, valores: Optional[Dict[tuple, object]] = None) -> List[str]:
+        valores = self.valores() if valores is None else valores
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}", *self._amostras(valores)]
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+
+class Medidor(Metrica):
+    """Valor que sobe e desce; com `coletar`, lido só na hora da exportação
+
+    `local=True`: com vários workers, exporta só o valor do próprio processo
+    (para valores iguais em todos, como o tamanho das coleções).
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 coletar: Optional[Callable[[], Dict[tuple, float]]] = None, local: bool = False):
+        super().__init__(nome, ajuda, rotulos)
+        self.coletar = coletar
+        self.local = local
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor: float = 1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def definir(self, valor: float, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def valores(self) -> Dict[tuple, object]:
+        if self.coletar is not None:
+            valores = self.coletar()
+            with self._lock:
+                self._valores = {tuple(str(v) for v in chave): valor for chave, valor in valores.items()}
+        return super().valores()
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        posicao = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                # [contagem por bucket (não acumulada) + "+Inf", soma, total]
+                serie = self._valores[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def valores(self) -> Dict[tuple, object]:
+        with self._lock:
+            return {chave: [list(contagens), soma, total] for chave, (contagens, soma, total) in self._valores.items()}
+
+    @staticmethod
+    def somar(valor, outro):
+        return [[a + b for a, b in zip(valor[0], outro[0])], valor[1] + outro[1], valor[2] + outro[2]]
+
+    def _amostras(self, valores: Dict[tuple, object]) -> Iterator[str]:
+        for chave, (contagens, soma, total) in sorted(valores.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                yield f"{self.nome}_bucket{self._rotulos_texto(chave, ('le', _formatar(limite)))} {acumulado}"
+            yield f"{self.nome}_sum{self._rotulos_texto(chave)} {_formatar(soma)}"
+            yield f"{self.nome}_count{self._rotulos_texto(chave)} {total}"
+
+
+def _processo_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registro:
+    """Conjunto de métricas exportadas juntas"""
+
+    def __init__(self):
+        self._metricas: Dict[str, Metrica] = {}
+        # Diretório comum aos workers (None: só este processo)
+        self.diretorio: Optional[str] = None
+        self._compartilhador: Optional[threading.Thread] = None
+
+    def registrar(self, metrica: Metrica) -> Metrica:
+        self._metricas[metrica.nome] = metrica
+        return metrica
+
+    # ===== VÁRIOS WORKERS =====
+    def compartilhar(self, diretorio: str, intervalo: float = METRICAS_INTERVALO_S):
+        """Gravar os valores deste processo em `diretorio` a cada `intervalo` segundos"""
+        os.makedirs(diretorio, exist_ok=True)
+        self.diretorio = diretorio
+        if self._compartilhador is None:
+            self._compartilhador = threading.Thread(
+                target=self._compartilhar, args=(intervalo,), name="metricas", daemon=True
+            )
+            self._compartilhador.start()
+
+    def _compartilhar(self, intervalo: float):
+        while True:
+            time.sleep(intervalo)
+            try:
+                self._gravar_estado()
+            except OSError as e:
+                print(f"Erro ao gravar as métricas do processo: {e}")
+
+    def _gravar_estado(self):
+        estado = {
+            nome: [[list(chave), valor] for chave, valor in metrica.valores().items()]
+            for nome, metrica in self._metricas.items()
+            if not getattr(metrica, "local", False)
+        }
+        caminho = os.path.join(self.diretorio, f"{os.getpid()}.json")
+        with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(estado, f, separators=(",", ":"))
+        os.replace(caminho + ".tmp", caminho)
+
+    def _estados_outros(self) -> List[Tuple[bool, dict]]:
+        """(vivo, valores) de cada outro processo que gravou no diretório"""
+        estados = []
+        for arquivo in os.listdir(self.diretorio):
+            nome, extensao = os.path.splitext(arquivo)
+            if extensao != ".json" or not nome.isdigit() or int(nome) == os.getpid():
+                continue
+            try:
+                with open(os.path.join(self.diretorio, arquivo), encoding="utf-8") as f:
+                    estados.append((_processo_vivo(int(nome)), json.load(f)))
+            except (OSError, ValueError):
+                continue  # removido ou sendo trocado agora
+        return estados
+
+    def exportar(self) -> str:
+        outros = self._estados_outros() if self.diretorio else []
+        linhas = []
+        for nome, metrica in self._metricas.items():
+            valores = metrica.valores()
+            if isinstance(metrica, Medidor) and metrica.local:
+                outros_da_metrica = []
+            else:
+                outros_da_metrica = [
+                    estado.get(nome, ()) for vivo, estado in outros
+                    if vivo or not isinstance(metrica, Medidor)
+                ]
+            for pares in outros_da_metrica:
+                for chave, valor in pares:
+                    chave = tuple(chave)
+                    valores[chave] = metrica.somar(valores[chave], valor) if chave in valores else valor
+            linhas.extend(metrica.exportar(valores))
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+REQUISICOES = registro.registrar(Contador(
+    "testify_http_requisicoes_total", "Requisições HTTP respondidas", ("metodo", "rota", "status")
+))
+DURACAO = registro.registrar(Histograma(
+    "testify_http_duracao_segundos", "Latência das requisições HTTP (até o último byte)", ("metodo", "rota")
+))
+EM_ANDAMENTO = registro.registrar(Medidor(
+    "testify_http_em_andamento", "Requisições HTTP em andamento", ("metodo",)
+))
+BYTES_REQUISICAO = registro.registrar(Histograma(
+    "testify_http_requisicao_bytes", "Tamanho do corpo das requisições", ("metodo", "rota"), BUCKETS_BYTES
+))
+BYTES_RESPOSTA = registro.registrar(Histograma(
+    "testify_http_resposta_bytes", "Tamanho do corpo das respostas", ("metodo", "rota"), BUCKETS_BYTES
+))
+ETAPAS = registro.registrar(Histograma(
+    "testify_etapa_duracao_segundos", "Duração das etapas internas (storage, folhas, imagens, OMR)", ("etapa",)
+))
+FALHAS = registro.registrar(Contador(
+    "testify_falhas_total", "Falhas em etapas internas (sem resposta de erro ao cliente)", ("etapa",)
+))
+
+
+def registrar_etapa(etapa: str, segundos: float):
+    """Registrar a duração de uma etapa medida em outro lugar (ex: em um worker)"""
+    ETAPAS.observar(segundos, etapa=etapa)
+
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """Medir o bloco como uma etapa; exceções contam em testify_falhas_total"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        FALHAS.inc(etapa=etapa)
+        raise
+    finally:
+        ETAPAS.observar(time.perf_counter() - inicio, etapa=etapa)
+
+
+# ===== MIDDLEWARE =====
+ROTA_DESCONHECIDA = "<desconhecida>"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mede as requisições HTTP por rota
+
+    A rota só é conhecida depois do roteamento: o router do Starlette grava
+    o endpoint no scope, e o modelo do caminho vem das rotas do app.
+    `perfil` (opcional) recebe o scope e o send e devolve um context
+    manager que envolve a requisição e entrega o send a usar (ver utils_perfil).
+    """
+
+    def __init__(self, app, perfil: Optional[Callable] = None):
+        self.app = app
+        self.perfil = perfil
+        self._rotas: Optional[Dict[Callable, str]] = None
+
+    def _rota(self, scope: dict) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return ROTA_DESCONHECIDA
+        if self._rotas is None or endpoint not in self._rotas:
+            rotas = {}
+            for rota in getattr(scope.get("app"), "routes", ()):
+                if hasattr(rota, "endpoint"):
+                    rotas.setdefault(rota.endpoint, getattr(rota, "path", ROTA_DESCONHECIDA))
+            self._rotas = rotas
+        return self._rotas.get(endpoint, ROTA_DESCONHECIDA)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        inicio = time.perf_counter()
+        status = 500
+        bytes_resposta = 0
+        bytes_requisicao = 0
+        # Por método: a rota só é conhecida depois do roteamento
+        EM_ANDAMENTO.inc(metodo=metodo)
+
+        async def receive_medido():
+            nonlocal bytes_requisicao
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                bytes_requisicao += len(mensagem.get("body", b""))
+            return mensagem
+
+        async def send_medido(mensagem):
+            nonlocal status, bytes_resposta
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            elif mensagem["type"] == "http.response.body":
+                bytes_resposta += len(mensagem.get("body", b""))
+            await send(mensagem)
+
+        try:
+            if self.perfil is not None:
+                with self.perfil(scope, send_medido) as enviar:
+                    await self.app(scope, receive_medido, enviar)
+            else:
+                await self.app(scope, receive_medido, send_medido)
+        finally:
+            EM_ANDAMENTO.dec(metodo=metodo)
+            rota = self._rota(scope)
+            REQUISICOES.inc(metodo=metodo, rota=rota, status=status)
+            DURACAO.observar(time.perf_counter() - inicio, metodo=metodo, rota=rota)
+            BYTES_REQUISICAO.observar(bytes_requisicao, metodo=metodo, rota=rota)
+            BYTES_RESPOSTA.observar(bytes_resposta, metodo=metodo, rota=rota)
@@ -0,0 +1,227 @@
+"""
+Leitura óptica (OMR) das folhas de resposta geradas por utils_gabarito
+
+A foto é alinhada ao layout da folha por homografia (usando as quatro marcas
+de alinhamento dos cantos) e o preenchimento de todas as bolhas é medido de
+uma vez com NumPy, sem laço em Python por bolha.
+"""
+
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Fração do preenchimento (acima do da folha em branco) para considerar marcada
+LIMIAR_MARCACAO = float(os.getenv("OMR_LIMIAR_MARCACAO", 0.45))
+# Fotos maiores que isso são reduzidas antes de procurar as marcas
+MAX_LADO_DETECCAO = 1600
+
+# Marcadores usados em respostas_detectadas
+RESPOSTA_EM_BRANCO = ""
+RESPOSTA_MULTIPLA = "*"
+
+# Código de identificação das folhas personalizadas: 16 bits do id do
+# gabarito + 12 bits do código do aluno + 8 bits de verificação (CRC-8)
+CODIGO_BITS_GABARITO = 16
+CODIGO_BITS_FOLHA = 12
+CODIGO_BITS_CRC = 8
+CODIGO_BITS = CODIGO_BITS_GABARITO + CODIGO_BITS_FOLHA + CODIGO_BITS_CRC
+# Aplicado ao CRC para uma faixa toda em branco nunca ser um código válido
+CODIGO_CRC_XOR = 0xA5
+
+
+class FolhaNaoReconhecida(Exception):
+    """A imagem não pôde ser lida ou alinhada ao layout da folha"""
+
+
+@lru_cache(maxsize=128)
+def carregar_layout(layout_path: str) -> dict:
+    """Ler (com cache) o descritor de layout gravado junto do PNG"""
+    with open(layout_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=16)
+def _offsets_disco(raio: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Deslocamentos (dy, dx) dos pixels de um disco de raio `raio`"""
+    r = int(np.ceil(raio))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    dentro = dy ** 2 + dx ** 2 <= raio ** 2
+    return dy[dentro], dx[dentro]
+
+
+def _crc8(valor: int, num_bits: int) -> int:
+    """CRC-8 (polinômio 0x07) dos `num_bits` bits de `valor`, do mais significativo"""
+    crc = 0
+    for i in reversed(range(num_bits)):
+        crc ^= ((valor >> i) & 1) << 7
+        crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def codificar_codigo(gabarito_id: int, codigo: int) -> List[int]:
+    """Bits (do mais significativo) impressos na faixa de identificação da folha"""
+    if not 0 < codigo < (1 << CODIGO_BITS_FOLHA):
+        raise ValueError(f"Código de folha fora do intervalo: {codigo}")
+    dados = ((gabarito_id % (1 << CODIGO_BITS_GABARITO)) << CODIGO_BITS_FOLHA) | codigo
+    num_dados = CODIGO_BITS_GABARITO + CODIGO_BITS_FOLHA
+    valor = (dados << CODIGO_BITS_CRC) | (_crc8(dados, num_dados) ^ CODIGO_CRC_XOR)
+    return [(valor >> i) & 1 for i in reversed(range(CODIGO_BITS))]
+
+
+def decodificar_codigo(bits: List[int]) -> Optional[Tuple[int, int]]:
+    """(id do gabarito módulo 2^16, código da folha) ou None se a verificação falhar"""
+    if len(bits) != CODIGO_BITS:
+        return None
+    valor = 0
+    for bit in bits:
+        valor = (valor << 1) | int(bit)
+    dados, crc = valor >> CODIGO_BITS_CRC, valor & 0xFF
+    if _crc8(dados, CODIGO_BITS_GABARITO + CODIGO_BITS_FOLHA) ^ CODIGO_CRC_XOR != crc:
+        return None
+    codigo = dados & ((1 << CODIGO_BITS_FOLHA) - 1)
+    if codigo == 0:
+        return None
+    return dados >> CODIGO_BITS_FOLHA, codigo
+
+
+def binarizar(cinza: np.ndarray) -> np.ndarray:
+    """Imagem em tons de cinza -> máscara booleana de pixels escuros"""
+    suave = cv2.GaussianBlur(cinza, (3, 3), 0)
+    binaria = cv2.adaptiveThreshold(
+        suave, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 51, 10
+    )
+    return binaria.astype(bool)
+
+
+def medir_preenchimento(escuro: np.ndarray, layout: dict) -> np.ndarray:
+    """Fração de pixels escuros no interior de cada bolha -> (questões, alternativas)
+
+    Todas as bolhas são amostradas com uma única indexação vetorizada.
+    """
+    centros = np.rint(np.asarray(layout["bubbles"], dtype=np.float64)).astype(np.intp)
+    # Só o miolo da bolha, para o contorno impresso não contar como marcação
+    dy, dx = _offsets_disco(layout["bubble_diameter"] * 0.4)
+    altura, largura = escuro.shape
+    ys = np.clip(centros[..., 1, None] + dy, 0, altura - 1)
+    xs = np.clip(centros[..., 0, None] + dx, 0, largura - 1)
+    return escuro[ys, xs].mean(axis=-1)
+
+
+def ler_codigo(escuro: np.ndarray, layout: dict) -> Optional[Tuple[int, int]]:
+    """Ler a faixa de identificação de uma folha alinhada (None se ausente ou ilegível)"""
+    faixa = layout.get("codigo")
+    if not faixa:
+        return None
+    # Miolo de cada barra (60% do tamanho), para tolerar pequenos desalinhamentos
+    meia_l = max(1, int(faixa["largura"] * 0.3))
+    meia_a = max(1, int(faixa["altura"] * 0.3))
+    centros = np.rint(np.asarray(faixa["celulas"], dtype=np.float64)).astype(np.intp)
+    dy, dx = np.mgrid[-meia_a:meia_a + 1, -meia_l:meia_l + 1]
+    altura, largura = escuro.shape
+    ys = np.clip(centros[:, 1, None] + dy.ravel(), 0, altura - 1)
+    xs = np.clip(centros[:, 0, None] + dx.ravel(), 0, largura - 1)
+    bits = (escuro[ys, xs].mean(axis=-1) >= 0.5).astype(int).tolist()
+    return decodificar_codigo(bits)
+
+
+def localizar_marcas(cinza: np.ndarray) -> np.ndarray:
+    """Encontrar as quatro marcas de alinhamento -> centros (TL, TR, BR, BL)"""
+    altura, largura = cinza.shape
+    escala = min(1.0, MAX_LADO_DETECCAO / max(altura, largura))
+    if escala < 1.0:
+        cinza = cv2.resize(cinza, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+    _, binaria = cv2.threshold(
+        cv2.GaussianBlur(cinza, (5, 5), 0), 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+    )
+    # RETR_LIST: com fundo escuro na foto, a folha vira um "buraco" do contorno externo
+    contornos, _ = cv2.findContours(binaria, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    area_minima = cinza.shape[0] * cinza.shape[1] * 1e-4
+    candidatos = []
+    for contorno in contornos:
+        area = cv2.contourArea(contorno)
+        if area < area_minima:
+            continue
+        x, y, w, h = cv2.boundingRect(contorno)
+        # Quadrado cheio: proporção ~1 e quase toda a caixa preenchida
+        if 0.7 <= w / h <= 1.3 and area / (w * h) >= 0.85:
+            candidatos.append((x + w / 2, y + h / 2))
+    if len(candidatos) < 4:
+        raise FolhaNaoReconhecida("Marcas de alinhamento não encontradas")
+
+    pontos = np.asarray(candidatos)
+    h, w = cinza.shape
+    cantos = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+    # Candidato mais próximo de cada canto da imagem
+    distancias = np.linalg.norm(pontos[None, :, :] - cantos[:, None, :], axis=-1)
+    escolhidos = distancias.argmin(axis=1)
+    if len(set(escolhidos.tolist())) < 4:
+        raise FolhaNaoReconhecida("Marcas de alinhamento ambíguas")
+    return pontos[escolhidos] / escala
+
+
+def alinhar(cinza: np.ndarray, layout: dict) -> np.ndarray:
+    """Projetar a foto no sistema de coordenadas da folha gerada"""
+    origem = localizar_marcas(cinza).astype(np.float32)
+    destino = np.asarray(layout["fiducials"], dtype=np.float32)
+    homografia = cv2.getPerspectiveTransform(origem, destino)
+    largura, altura = layout["page_size"]
+    return cv2.warpPerspective(
+        cinza, homografia, (largura, altura), flags=cv2.INTER_LINEAR, borderValue=255
+    )
+
+
+def ler_respostas(cinza: np.ndarray, layout: dict, limiar: float = LIMIAR_MARCACAO) -> dict:
+    """Ler as marcações de uma folha já carregada em tons de cinza
+
+    Retorna:
+        respostas: alternativa marcada por questão ("" em branco, "*" múltipla)
+        em_branco / multiplas: índices (base 0) das questões nessas situações
+        preenchimento: intensidade de marcação de cada bolha (0 a 1)
+        codigo: (id do gabarito módulo 2^16, código da folha) das folhas
+            personalizadas, ou None
+    """
+    alinhada = alinhar(cinza, layout)
+    escuro = binarizar(alinhada)
+    preenchimento = medir_preenchimento(escuro, layout)
+    base = np.asarray(layout["preenchimento_base"], dtype=np.float64)
+    # Normalizar pelo que ainda estava branco na folha vazia
+    intensidade = np.clip((preenchimento - base) / np.maximum(1 - base, 1e-6), 0, 1)
+
+    marcadas = intensidade >= limiar
+    num_marcadas = marcadas.sum(axis=1)
+    escolhas = np.asarray(layout["choices"], dtype=object)[intensidade.argmax(axis=1)]
+    respostas = np.where(
+        num_marcadas == 1,
+        escolhas,
+        np.where(num_marcadas == 0, RESPOSTA_EM_BRANCO, RESPOSTA_MULTIPLA)
+    )
+    return {
+        "respostas": respostas.tolist(),
+        "em_branco": np.flatnonzero(num_marcadas == 0).tolist(),
+        "multiplas": np.flatnonzero(num_marcadas > 1).tolist(),
+        "preenchimento": intensidade.round(3).tolist(),
+        "codigo": ler_codigo(escuro, layout),
+    }
+
+
+def ler_folha(imagem_path: str, layout_path: str, tempos: Optional[Dict[str, float]] = None) -> dict:
+    """Carregar a imagem de uma prova e ler as respostas marcadas
+
+    Com `tempos`, acumula ali os segundos de "decodificacao" e "reconhecimento".
+    """
+    inicio = time.perf_counter()
+    cinza = cv2.imread(imagem_path, cv2.IMREAD_GRAYSCALE)
+    if cinza is None:
+        raise FolhaNaoReconhecida(f"Não foi possível abrir a imagem {imagem_path}")
+    decodificada = time.perf_counter()
+    leitura = ler_respostas(cinza, carregar_layout(layout_path))
+    if tempos is not None:
+        tempos["decodificacao"] = tempos.get("decodificacao", 0.0) + decodificada - inicio
+        tempos["reconhecimento"] = tempos.get("reconhecimento", 0.0) + time.perf_counter() - decodificada
+    return leitura
@@ -0,0 +1,191 @@
+"""
+Perfil de uma requisição por amostragem (opt-in, pelo header X-Profile)
+
+Com PERFIL_HABILITADO=true, uma requisição com o header `X-Profile: 1` (ou
+com o valor de PERFIL_TOKEN, se definido) é medida por um profiler de
+amostragem: uma thread lê as pilhas de todas as threads do processo a cada
+PERFIL_INTERVALO_MS enquanto a requisição roda. A resposta vem normal, com
+o header X-Profile-Id; o relatório fica em GET /metrics/perfis/{id}.
+
+Pilhas de threads ociosas (event loop esperando no select, workers
+parados em filas) são descartadas; requisições simultâneas aparecem no
+mesmo perfil, então o ideal é perfilar com o servidor pouco carregado.
+O relatório traz as funções com mais amostras e as pilhas no formato
+"collapsed" (uma por linha), que flamegraph.pl e speedscope abrem direto.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+PERFIL_HABILITADO = os.getenv("PERFIL_HABILITADO", "false").lower() in ("1", "true", "sim", "yes")
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN", "")
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", 1))
+PERFIL_GUARDADOS = int(os.getenv("PERFIL_GUARDADOS", 32))
+# No máximo um perfil por vez: duas amostragens simultâneas se atrapalham
+_em_uso = threading.Lock()
+
+# Funções onde uma thread fica parada esperando (a pilha não interessa)
+_OCIOSAS = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def _quadro(frame) -> str:
+    codigo = frame.f_code
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+class Amostrador:
+    """Thread que conta as pilhas de todas as outras threads"""
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self.pilhas: Counter = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, name="perfil", daemon=True)
+
+    def _rodar(self):
+        propria = threading.get_ident()
+        nomes = {}
+        while not self._parar.wait(self.intervalo):
+            self.amostras += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == propria:
+                    continue
+                codigo = frame.f_code
+                if (os.path.basename(codigo.co_filename), codigo.co_name) in _OCIOSAS:
+                    continue
+                pilha = []
+                while frame is not None:
+                    pilha.append(_quadro(frame))
+                    frame = frame.f_back
+                if ident not in nomes:
+                    nomes = {t.ident: t.name for t in threading.enumerate()}
+                pilha.append(nomes.get(ident, str(ident)))
+                self.pilhas[";".join(reversed(pilha))] += 1
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+
+def relatorio(titulo: str, amostrador: Amostrador, duracao: float, maximo_funcoes: int = 30) -> str:
+    """Texto do perfil: resumo, funções mais amostradas e pilhas collapsed"""
+    proprias, totais = Counter(), Counter()
+    for pilha, contagem in amostrador.pilhas.items():
+        quadros = pilha.split(";")[1:]  # sem o nome da thread
+        if quadros:
+            proprias[quadros[-1]] += contagem
+        for quadro in set(quadros):
+            totais[quadro] += contagem
+    linhas = [
+        f"# {titulo}",
+        f"# duração {duracao * 1000:.1f} ms, {amostrador.amostras} amostras "
+        f"(intervalo {amostrador.intervalo * 1000:g} ms), {sum(amostrador.pilhas.values())} pilhas ativas",
+        "",
+        "# funções com mais amostras (próprias / incluindo as chamadas)",
+    ]
+    for quadro, contagem in proprias.most_common(maximo_funcoes):
+        linhas.append(f"{contagem:>7} {totais[quadro]:>7}  {quadro}")
+    linhas += ["", "# pilhas (formato collapsed: flamegraph.pl / speedscope)"]
+    linhas += [f"{pilha} {contagem}" for pilha, contagem in amostrador.pilhas.most_common()]
+    return "\n".join(linhas) + "\n"
+
+
+class Perfis:
+    """Últimos relatórios gerados, por id
+
+    Com `diretorio` (vários workers), os relatórios também vão para arquivos
+    nele, para que o GET do relatório funcione em qualquer worker.
+    """
+
+    def __init__(self, maximo: int = PERFIL_GUARDADOS):
+        self.maximo = maximo
+        self.diretorio: Optional[str] = None
+        self._relatorios: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, perfil_id: str, texto: str):
+        with self._lock:
+            self._relatorios[perfil_id] = texto
+            while len(self._relatorios) > self.maximo:
+                self._relatorios.popitem(last=False)
+        if self.diretorio:
+            os.makedirs(self.diretorio, exist_ok=True)
+            with open(os.path.join(self.diretorio, f"{perfil_id}.txt"), "w", encoding="utf-8") as f:
+                f.write(texto)
+            try:
+                arquivos = sorted(
+                    (os.path.join(self.diretorio, nome) for nome in os.listdir(self.diretorio)),
+                    key=os.path.getmtime
+                )
+                for caminho in arquivos[:-self.maximo]:
+                    os.remove(caminho)
+            except OSError:
+                pass  # outro worker limpando ao mesmo tempo
+
+    def obter(self, perfil_id: str) -> Optional[str]:
+        with self._lock:
+            texto = self._relatorios.get(perfil_id)
+        if texto is None and self.diretorio and perfil_id.isalnum():
+            caminho = os.path.join(self.diretorio, f"{perfil_id}.txt")
+            if os.path.exists(caminho):
+                with open(caminho, encoding="utf-8") as f:
+                    texto = f.read()
+        return texto
+
+
+perfis = Perfis()
+
+
+def _pedido(scope: dict) -> bool:
+    if not PERFIL_HABILITADO:
+        return False
+    for nome, valor in scope.get("headers", ()):
+        if nome == b"x-profile":
+            valor = valor.decode("latin-1").strip()
+            return valor == PERFIL_TOKEN if PERFIL_TOKEN else valor.lower() in ("1", "true")
+    return False
+
+
+@contextmanager
+def perfil_requisicao(scope: dict, send):
+    """Perfilar a requisição se ela pediu (ver o docstring do módulo)
+
+    Entrega o `send` a usar: com perfil, o header X-Profile-Id é
+    acrescentado ao início da resposta.
+    """
+    if not _pedido(scope) or not _em_uso.acquire(blocking=False):
+        yield send
+        return
+    perfil_id = uuid.uuid4().hex[:12]
+
+    async def send_com_id(mensagem):
+        if mensagem["type"] == "http.response.start":
+            mensagem = {**mensagem, "headers": list(mensagem.get("headers", [])) + [(b"x-profile-id", perfil_id.encode())]}
+        await send(mensagem)
+
+    amostrador = Amostrador(PERFIL_INTERVALO_MS / 1000)
+    inicio = time.perf_counter()
+    amostrador.iniciar()
+    try:
+        yield send_com_id
+    finally:
+        amostrador.parar()
+        _em_uso.release()
+        titulo = f"{scope['method']} {scope['path']}" + (f"?{scope['query_string'].decode()}" if scope.get("query_string") else "")
+        perfis.guardar(perfil_id, relatorio(titulo, amostrador, time.perf_counter() - inicio))
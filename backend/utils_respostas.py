@@ -0,0 +1,265 @@
+"""
+Representação compacta das respostas gravadas nos resultados
+
+Em vez de listas de strings, as respostas do aluno são gravadas como bytes
+(em base64 no JSON), um por questão, com o índice da alternativa marcada;
+EM_BRANCO e MULTIPLA marcam questão em branco e marcação múltipla. Cada
+resultado referencia por "chave_id" a versão da chave de respostas (coleção
+`chaves`, registros imutáveis) com que foi corrigido, em vez de guardar uma
+cópia dela; os bytes do aluno são lidos com as alternativas dessa versão.
+
+As listas "respostas_aluno" / "respostas_corretas" do schema só são
+montadas na resposta da API (expandir_resultado). Respostas com valores
+fora das alternativas continuam gravadas como lista, e resultados antigos
+(com as duas listas) são convertidos na inicialização.
+"""
+
+import base64
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import storage
+
+# Códigos além dos índices das alternativas (0..253)
+EM_BRANCO = 255  # ""
+MULTIPLA = 254  # "*"
+CONVERSAO_LOTE = 500
+
+
+@lru_cache(maxsize=64)
+def _codigos(alternativas: tuple) -> Dict[str, int]:
+    codigos = {"": EM_BRANCO, "*": MULTIPLA}
+    codigos.update((alternativa, indice) for indice, alternativa in enumerate(alternativas))
+    return codigos
+
+
+@lru_cache(maxsize=64)
+def _tabela(alternativas: tuple) -> tuple:
+    tabela = [None] * 256
+    tabela[EM_BRANCO], tabela[MULTIPLA] = "", "*"
+    tabela[:len(alternativas)] = alternativas
+    return tuple(tabela)
+
+
+def codificar(respostas: Sequence[str], alternativas: Sequence[str]) -> Optional[str]:
+    """Respostas em base64 (um byte por questão), ou None se alguma não cabe"""
+    if len(alternativas) > MULTIPLA:
+        return None
+    codigos = _codigos(tuple(alternativas))
+    try:
+        dados = bytes(codigos[resposta] for resposta in respostas)
+    except (KeyError, TypeError):
+        return None
+    return base64.b64encode(dados).decode("ascii")
+
+
+def expandir(dados: bytes, alternativas: Sequence[str]) -> List[str]:
+    """Lista de respostas (formato da API) a partir dos bytes"""
+    tabela = _tabela(tuple(alternativas))
+    return [tabela[codigo] for codigo in dados]
+
+
+class Chave:
+    """Uma versão (imutável) da chave de respostas de um gabarito"""
+
+    __slots__ = ("id", "gabarito_id", "alternativas", "corretas", "codigos")
+
+    def __init__(self, registro: dict):
+        self.id = registro["id"]
+        self.gabarito_id = registro["gabarito_id"]
+        self.alternativas = tuple(registro["alternativas"])
+        if "respostas" in registro:
+            self.codigos: Optional[bytes] = base64.b64decode(registro["respostas"])
+            self.corretas = tuple(expandir(self.codigos, self.alternativas))
+        else:
+            self.codigos = None
+            self.corretas = tuple(registro["respostas_corretas"])
+
+
+def registro_chave(gabarito_id: int, alternativas: Sequence[str], corretas: Sequence[str]) -> dict:
+    """Registro da coleção `chaves` (compacto quando as respostas cabem nas alternativas)"""
+    registro = {"gabarito_id": gabarito_id, "alternativas": list(alternativas),
+                "criado_em": datetime.now().isoformat()}
+    texto = codificar(corretas, alternativas)
+    if texto is not None:
+        registro["respostas"] = texto
+    else:
+        registro["respostas_corretas"] = list(corretas)
+    return registro
+
+
+class ChavesVersionadas:
+    """Versões das chaves de respostas e a versão atual de cada gabarito
+
+    As versões ficam em cache para sempre (são imutáveis); a atual de cada
+    gabarito é invalidada pelo observador de gabaritos. Quando as respostas
+    corretas ou as alternativas mudam, a próxima consulta registra uma nova
+    versão e grava seu id em "chave_id" do gabarito.
+    """
+
+    def __init__(self, chaves, gabaritos):
+        self._chaves = chaves
+        self._gabaritos = gabaritos
+        self._versoes: Dict[int, Chave] = {}
+        self._atuais: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._registro = threading.Lock()
+        # Incrementado a cada invalidação: uma leitura que cruzou com uma
+        # atualização não grava a versão antiga como atual
+        self._geracao = 0
+        gabaritos.observar(self._ao_mudar)
+
+    def _ao_mudar(self, op: str, anterior: Optional[dict], atual: Optional[dict]):
+        gabarito = anterior or atual
+        with self._lock:
+            self._geracao += 1
+            self._atuais.pop(gabarito["id"], None)
+
+    def obter(self, chave_id: Optional[int]) -> Optional[Chave]:
+        """Versão da chave pelo id (None se não existe)"""
+        if chave_id is None:
+            return None
+        chave = self._versoes.get(chave_id)
+        if chave is None:
+            registro = self._chaves.obter(chave_id)
+            if registro is None:
+                return None
+            chave = self._versoes.setdefault(chave_id, Chave(registro))
+        return chave
+
+    def atual(self, gabarito_id: int) -> Optional[Chave]:
+        """Versão com as respostas corretas atuais do gabarito (None se ele não existe)
+
+        Pode gravar (nova versão); não chamar de observadores do storage.
+        """
+        # Mudanças de outros workers invalidam _atuais pelo observador
+        self._gabaritos.sincronizar()
+        with self._lock:
+            chave_id = self._atuais.get(gabarito_id)
+            geracao = self._geracao
+        if chave_id is not None:
+            return self.obter(chave_id)
+        chave = self._registrar(gabarito_id)
+        if chave is not None:
+            with self._lock:
+                if self._geracao == geracao:
+                    self._atuais[gabarito_id] = chave.id
+        return chave
+
+    def _registrar(self, gabarito_id: int) -> Optional[Chave]:
+        # Um registro por vez: duas requisições não criam versões repetidas
+        with self._registro:
+            gabarito = self._gabaritos.obter(gabarito_id)
+            if gabarito is None:
+                return None
+            alternativas = tuple(gabarito["alternativas"])
+            corretas = tuple(gabarito["respostas_corretas"])
+            existente = self.obter(gabarito.get("chave_id"))
+            if existente is not None and (existente.alternativas, existente.corretas) == (alternativas, corretas):
+                return existente
+            novo = storage.fila.submeter(
+                self._chaves, "inserir", registro_chave(gabarito_id, alternativas, corretas)
+            ).result()
+            storage.fila.submeter(self._gabaritos, "atualizar", gabarito_id, {"chave_id": novo["id"]}).result()
+            return self.obter(novo["id"])
+
+
+versoes_chave = ChavesVersionadas(storage.chaves, storage.gabaritos)
+
+
+# ===== RESULTADOS =====
+def campos_respostas(respostas_aluno: Sequence[str], chave: Chave) -> dict:
+    """Campos gravados no resultado para as respostas do aluno corrigidas com `chave`"""
+    texto = codificar(respostas_aluno, chave.alternativas)
+    if texto is not None:
+        return {"chave_id": chave.id, "respostas": texto}
+    return {"chave_id": chave.id, "respostas_aluno": list(respostas_aluno)}
+
+
+def respostas_aluno(resultado: dict) -> List[str]:
+    """Respostas do aluno de um resultado gravado (compacto ou antigo)"""
+    if "respostas" in resultado:
+        chave = versoes_chave.obter(resultado["chave_id"])
+        return expandir(base64.b64decode(resultado["respostas"]), chave.alternativas)
+    return list(resultado["respostas_aluno"])
+
+
+def respostas_corretas(resultado: dict) -> List[str]:
+    """Chave com que o resultado foi corrigido"""
+    chave = versoes_chave.obter(resultado.get("chave_id"))
+    if chave is not None:
+        return list(chave.corretas)
+    return list(resultado.get("respostas_corretas") or [])
+
+
+def acertos_questoes(resultado: dict) -> np.ndarray:
+    """Acerto (bool) em cada questão, até a menor entre respostas e chave
+
+    Resultados compactos comparam os bytes direto, sem montar listas.
+    """
+    chave = versoes_chave.obter(resultado.get("chave_id"))
+    if "respostas" in resultado and chave is not None and chave.codigos is not None:
+        aluno = np.frombuffer(base64.b64decode(resultado["respostas"]), dtype=np.uint8)
+        corretas = np.frombuffer(chave.codigos, dtype=np.uint8)
+    else:
+        aluno = np.asarray(respostas_aluno(resultado), dtype=object)
+        corretas = np.asarray(respostas_corretas(resultado), dtype=object)
+    n = min(len(aluno), len(corretas))
+    return aluno[:n] == corretas[:n]
+
+
+def compactar_resultado(resultado: dict, chave: Chave) -> dict:
+    """Registro inteiro (sem id) do resultado com as respostas relidas para `chave`"""
+    respostas = respostas_aluno(resultado)
+    novo = {
+        campo: valor for campo, valor in resultado.items()
+        if campo not in ("id", "chave_id", "respostas", "respostas_aluno", "respostas_corretas")
+    }
+    novo.update(campos_respostas(respostas, chave))
+    return novo
+
+
+def expandir_resultado(resultado: dict) -> dict:
+    """Resultado no formato da API (com as listas de respostas)"""
+    expandido = {campo: valor for campo, valor in resultado.items() if campo not in ("respostas", "chave_id")}
+    expandido["respostas_aluno"] = respostas_aluno(resultado)
+    expandido["respostas_corretas"] = respostas_corretas(resultado)
+    return expandido
+
+
+def converter_resultados_antigos() -> int:
+    """Converter resultados gravados com as duas listas para o formato compacto
+
+    A chave copiada em cada resultado vira uma versão na coleção `chaves`
+    (a atual do gabarito, quando igual). Resultados de gabaritos removidos
+    ficam como estão. Retorna quantos resultados foram convertidos.
+    """
+    antigos = [r for r in storage.resultados.listar() if "chave_id" not in r]
+    versoes: Dict[tuple, Chave] = {}
+    operacoes = []
+    for resultado in antigos:
+        gabarito = storage.gabaritos.obter(resultado["gabarito_id"])
+        if gabarito is None:
+            continue
+        alternativas = tuple(gabarito["alternativas"])
+        corretas = tuple(resultado["respostas_corretas"])
+        chave = versoes.get((resultado["gabarito_id"], alternativas, corretas))
+        if chave is None:
+            chave = versoes_chave.atual(resultado["gabarito_id"])
+            if (chave.alternativas, chave.corretas) != (alternativas, corretas):
+                # Corrigido com uma chave anterior: vira uma versão só do histórico
+                registro = storage.fila.submeter(
+                    storage.chaves, "inserir", registro_chave(resultado["gabarito_id"], alternativas, corretas)
+                ).result()
+                chave = versoes_chave.obter(registro["id"])
+            versoes[(resultado["gabarito_id"], alternativas, corretas)] = chave
+        operacoes.append(("substituir", (resultado["id"], compactar_resultado(resultado, chave))))
+    for inicio in range(0, len(operacoes), CONVERSAO_LOTE):
+        storage.fila.submeter_lote(storage.resultados, operacoes[inicio:inicio + CONVERSAO_LOTE]).result()
+    if operacoes:
+        storage.resultados.compactar()
+    return len(operacoes)
@@ -0,0 +1,177 @@
+"""
+Semelhança entre as folhas de respostas dos alunos (indício de cola)
+
+As respostas de um gabarito viram uma matriz one-hot alunos × (questão,
+alternativa) em float32: o produto dela pela transposta conta, para todos os
+pares de uma vez (BLAS), as questões em que dois alunos marcaram a mesma
+alternativa. Zerando as colunas das alternativas corretas, o mesmo produto
+conta os erros iguais, que são o sinal que interessa: acertar junto é
+esperado, errar igual é raro.
+
+A significância de um par compara os erros iguais com o esperado se os dois
+respondessem de forma independente: o aluno i erra a questão q com
+probabilidade w_i·d_q (w_i = fração de questões que ele errou, d_q = quanto a
+questão é mais difícil que a média) e, errando, escolhe a alternativa errada
+a na proporção r_qa da turma. Os erros iguais esperados são então
+λ = w_i·w_j·Σ_q d_q²·s_q, com s_q = Σ_a r_qa², e o escore é −log10 da
+probabilidade (Poisson) de pelo menos aquele número de erros iguais,
+calculado em matriz para todos os pares. Os pares são processados em blocos
+de linhas, então a memória não cresce com o quadrado do número de alunos.
+"""
+
+import math
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from utils_analise import matriz_respostas
+from utils_respostas import respostas_aluno
+
+SIMILARIDADE_BLOCO = int(os.getenv("SIMILARIDADE_BLOCO", 1024))
+# Pares com menos erros iguais que isso não entram no ranking
+SIMILARIDADE_MINIMO_ERROS = int(os.getenv("SIMILARIDADE_MINIMO_ERROS", 3))
+
+
+def one_hot(matriz: np.ndarray, num_alternativas: int) -> np.ndarray:
+    """Matriz (alunos, questões × alternativas) com 1 na alternativa marcada
+
+    Em branco e marcações inválidas ficam com a linha toda zerada: não
+    contam como resposta igual.
+    """
+    alunos, questoes = matriz.shape
+    codificada = np.zeros((alunos, questoes, num_alternativas), dtype=np.float32)
+    linhas, colunas = np.nonzero(matriz >= 0)
+    codificada[linhas, colunas, matriz[linhas, colunas]] = 1
+    return codificada.reshape(alunos, questoes * num_alternativas)
+
+
+def pares_suspeitos(
+    matriz: np.ndarray,
+    chave: np.ndarray,
+    num_alternativas: int,
+    limite: int = 20,
+    minimo_erros: int = SIMILARIDADE_MINIMO_ERROS,
+    bloco: int = SIMILARIDADE_BLOCO
+) -> List[dict]:
+    """Os `limite` pares (i < j, índices da matriz) com maior escore de erros iguais
+
+    Cada par traz "i", "j", "iguais" (mesma alternativa marcada), "erros_iguais",
+    "esperado" e "escore" (−log10 da probabilidade ao acaso). `chave` é o índice da alternativa correta de
+    cada questão.
+    """
+    alunos, questoes = matriz.shape
+    respostas = one_hot(matriz, num_alternativas)
+    corretas = np.zeros((questoes, num_alternativas), dtype=bool)
+    validas = chave >= 0
+    corretas[np.flatnonzero(validas), chave[validas]] = True
+    erradas = respostas * ~corretas.ravel()
+
+    # Probabilidade de errar de cada aluno, dificuldade relativa de cada
+    # questão e concentração dos erros dela nas alternativas erradas
+    w = erradas.sum(axis=1, dtype=np.float64) / max(questoes, 1)
+    erros_questao = erradas.sum(axis=0, dtype=np.float64).reshape(questoes, num_alternativas)
+    total_questao = erros_questao.sum(axis=1)
+    d = total_questao / total_questao.mean() if total_questao.any() else total_questao
+    r = erros_questao / np.maximum(total_questao, 1)[:, None]
+    fator = (d ** 2 * (r ** 2).sum(axis=1)).sum()
+    log_fatorial = np.array([math.lgamma(k + 1) for k in range(questoes + 1)])
+
+    candidatos = []
+    for inicio in range(0, alunos, bloco):
+        fim = min(inicio + bloco, alunos)
+        # Só j > i: cada par uma vez
+        erros_iguais = erradas[inicio:fim] @ erradas[inicio:].T
+        iguais = respostas[inicio:fim] @ respostas[inicio:].T
+        esperado = w[inicio:fim, None] * w[None, inicio:] * fator
+        escore = escore_poisson(erros_iguais.astype(np.int64), esperado, log_fatorial)
+        escore[np.tril_indices(fim - inicio, k=0, m=alunos - inicio)] = -np.inf
+        escore[erros_iguais < minimo_erros] = -np.inf
+
+        selecionados = np.flatnonzero(escore > -np.inf)
+        if len(selecionados) > limite:
+            selecionados = selecionados[np.argpartition(-escore.ravel()[selecionados], limite - 1)[:limite]]
+        for indice in selecionados:
+            a, b = divmod(int(indice), alunos - inicio)
+            candidatos.append({
+                "i": inicio + a,
+                "j": inicio + b,
+                "iguais": int(iguais[a, b]),
+                "erros_iguais": int(erros_iguais[a, b]),
+                "esperado": float(esperado[a, b]),
+                "escore": float(escore[a, b]),
+            })
+
+    candidatos.sort(key=lambda par: (-par["escore"], -par["erros_iguais"]))
+    return candidatos[:limite]
+
+
+def escore_poisson(k: np.ndarray, esperado: np.ndarray, log_fatorial: np.ndarray) -> np.ndarray:
+    """−log10 P(X ≥ k) para X ~ Poisson(esperado), elemento a elemento
+
+    A cauda é o termo P(X = k) vezes a soma da série geométrica que a limita
+    por cima (razão esperado/(k+1)); com k abaixo do esperado, o escore é 0.
+    """
+    esperado = np.maximum(esperado, 1e-12)
+    razao = esperado / (k + 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_cauda = k * np.log(esperado) - esperado - log_fatorial[k] - np.log1p(-razao)
+    log_cauda = np.where(razao < 1, np.minimum(log_cauda, 0.0), 0.0)
+    return -log_cauda / math.log(10)
+
+
+def _aluno(resultado: dict) -> dict:
+    return {
+        "resultado_id": resultado["id"],
+        "prova_id": resultado["prova_id"],
+        "nome_aluno": resultado["nome_aluno"],
+        "matricula_aluno": resultado["matricula_aluno"],
+        "turma_aluno": resultado["turma_aluno"],
+    }
+
+
+def analisar_similaridade(
+    gabarito: dict,
+    resultados: List[dict],
+    turma_aluno: Optional[str] = None,
+    limite: int = 20,
+    minimo_erros: int = SIMILARIDADE_MINIMO_ERROS
+) -> dict:
+    """Pares suspeitos de um gabarito, no formato de SimilaridadeResponse
+
+    Uma prova corrigida mais de uma vez entra só com o resultado mais recente.
+    """
+    ultimos = {}
+    for resultado in resultados:
+        if resultado["prova_id"] not in ultimos or resultado["id"] > ultimos[resultado["prova_id"]]["id"]:
+            ultimos[resultado["prova_id"]] = resultado
+    resultados = sorted(ultimos.values(), key=lambda r: r["id"])
+
+    alternativas = list(gabarito["alternativas"])
+    num_questoes = gabarito["num_questoes"]
+    chave = matriz_respostas([list(gabarito["respostas_corretas"])[:num_questoes]], alternativas, num_questoes)[0]
+    matriz = matriz_respostas([respostas_aluno(r) for r in resultados], alternativas, num_questoes)
+
+    total_pares = len(resultados) * (len(resultados) - 1) // 2
+    pares = []
+    for par in pares_suspeitos(matriz, chave, len(alternativas), limite, minimo_erros):
+        a, b = resultados[par["i"]], resultados[par["j"]]
+        pares.append({
+            "aluno_a": _aluno(a),
+            "aluno_b": _aluno(b),
+            "respostas_iguais": par["iguais"],
+            "erros_iguais": par["erros_iguais"],
+            "erros_iguais_esperados": round(par["esperado"], 2),
+            "escore": round(par["escore"], 2),
+            # Corrigido pelo número de pares comparados (Bonferroni): entre
+            # milhares de pares, algum escore alto aparece por acaso
+            "p_valor": min(1.0, 10 ** -par["escore"] * total_pares),
+        })
+
+    return {
+        "gabarito_id": gabarito["id"],
+        "turma_aluno": turma_aluno,
+        "total_alunos": len(resultados),
+        "total_pares": total_pares,
+        "pares": pares,
+    }
@@ -0,0 +1,87 @@
+"""
+Armazenamento das imagens enviadas, endereçado pelo conteúdo
+
+O upload é copiado para o disco em blocos enquanto o SHA-256 é calculado,
+então o consumo de memória não depende do tamanho da foto. O arquivo final
+fica em UPLOAD_DIR/ab/cd/<sha256>.<ext>: a mesma imagem enviada duas vezes
+ocupa um único arquivo.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "data/uploads")
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 * 1024))
+CHUNK_SIZE = 1024 * 1024
+
+# Assinaturas (magic bytes) dos formatos aceitos
+_ASSINATURAS = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+)
+
+
+class UploadInvalido(Exception):
+    """Arquivo enviado não é uma imagem suportada ou excede o tamanho máximo"""
+
+
+def detectar_extensao(cabecalho: bytes) -> Optional[str]:
+    """Extensão real da imagem a partir dos primeiros bytes"""
+    if cabecalho[:4] == b"RIFF" and cabecalho[8:12] == b"WEBP":
+        return ".webp"
+    for assinatura, ext in _ASSINATURAS:
+        if cabecalho.startswith(assinatura):
+            return ext
+    return None
+
+
+def caminho_por_hash(sha256: str, ext: str) -> str:
+    """Caminho (em diretórios fragmentados) de um conteúdo"""
+    return os.path.join(UPLOAD_DIR, sha256[:2], sha256[2:4], sha256 + ext)
+
+
+def armazenar(origem: BinaryIO, max_bytes: int = MAX_UPLOAD_SIZE) -> dict:
+    """Copiar `origem` para o armazenamento, em blocos, calculando o hash
+
+    Retorna {"caminho", "sha256", "tamanho", "novo"}; "novo" é False quando
+    o mesmo conteúdo já estava armazenado (nada é gravado de novo).
+    """
+    tmp_dir = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    sha = hashlib.sha256()
+    tamanho = 0
+    ext = None
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            while True:
+                bloco = origem.read(CHUNK_SIZE)
+                if not bloco:
+                    break
+                if ext is None:
+                    ext = detectar_extensao(bloco[:16])
+                    if ext is None:
+                        raise UploadInvalido("Formato de imagem não suportado")
+                tamanho += len(bloco)
+                if tamanho > max_bytes:
+                    raise UploadInvalido(f"Imagem maior que o limite de {max_bytes} bytes")
+                sha.update(bloco)
+                destino.write(bloco)
+        if tamanho == 0:
+            raise UploadInvalido("Arquivo vazio")
+
+        digest = sha.hexdigest()
+        caminho = caminho_por_hash(digest, ext)
+        novo = not os.path.exists(caminho)
+        if novo:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            os.replace(tmp_path, caminho)
+        return {"caminho": caminho, "sha256": digest, "tamanho": tamanho, "novo": novo}
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
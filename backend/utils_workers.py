@@ -0,0 +1,55 @@
+"""
+Execução com vários workers do uvicorn (uvicorn --workers N / WEB_CONCURRENCY)
+
+O storage já é seguro entre processos (ver storage/). Aqui fica o que os
+workers combinam entre si:
+- um só deles (o líder, eleito por uma trava em data/) retoma na
+  inicialização o trabalho que ficou pendente: provas na fila de OMR,
+  recorreções e a conversão de resultados antigos. Os demais só atendem
+  requisições (e processam o que elas enfileirarem);
+- os pools de processos (OMR, folhas) dividem as CPUs entre os workers;
+- métricas e perfis ficam em diretórios comuns, para o /metrics de
+  qualquer worker mostrar o total.
+"""
+
+import os
+import shutil
+
+import storage
+from storage.trava import TravaArquivo
+
+WEB_CONCURRENCY = storage.WEB_CONCURRENCY
+MULTIPROCESSO = WEB_CONCURRENCY > 1
+
+METRICAS_DIR = os.path.join(storage.DATA_DIR, "metricas")
+PERFIS_DIR = os.path.join(storage.DATA_DIR, "perfis")
+
+_trava_lider = TravaArquivo(os.path.join(storage.DATA_DIR, "lider.lock"))
+
+
+def cpus_por_worker() -> int:
+    """Processos de um pool por worker, para os workers juntos usarem todas as CPUs"""
+    return max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
+
+def eleger_lider() -> bool:
+    """Tentar ser o worker que retoma o trabalho pendente
+
+    A trava fica com o processo até ele terminar; com um worker só, ele
+    sempre é o líder.
+    """
+    return _trava_lider.tentar_exclusiva()
+
+
+def diretorio_metricas(lider: bool) -> str:
+    """Diretório das métricas desta execução; o líder apaga os de execuções anteriores
+
+    Os workers de uma execução têm o mesmo pai (o supervisor do uvicorn),
+    então o pid dele separa uma execução da outra.
+    """
+    diretorio = os.path.join(METRICAS_DIR, str(os.getppid()))
+    if lider and os.path.isdir(METRICAS_DIR):
+        for nome in os.listdir(METRICAS_DIR):
+            if nome != str(os.getppid()):
+                shutil.rmtree(os.path.join(METRICAS_DIR, nome), ignore_errors=True)
+    return diretorio